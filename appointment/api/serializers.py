@@ -1,4 +1,4 @@
-from django.utils import timezone
+from django.db import transaction
 from rest_framework import serializers
 from typing import List, Dict, Any
 from appointment.models import Appointment
@@ -7,6 +7,8 @@ from authentication.api.serializers import SimpleUserSerializer
 from documents.api.document_serializers import DocumentSerializer
 from documents.models.document import Document
 from documents.models.document_template import ServiceDocumentRequirement
+from documents.services import DocumentBlobService
+from documents.uploads import get_max_upload_size
 from service.api.serializers import ServiceSerializer
 from service.models.document_service import DocumentService
 from service.models.service import Service
@@ -42,64 +44,81 @@ class AppointmentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['is_completed', 'rating']
 
+    def _first_review(self, obj: Appointment, user=None):
+        """Retorna a avaliação mais antiga, usando as reviews pré-carregadas quando houver"""
+        reviews = [
+            review for review in obj.reviews.all()
+            if user is None or review.user_id == user.id
+        ]
+        return min(reviews, key=lambda review: review.id, default=None)
+
     def get_rating(self, obj: Appointment) -> int:
-        review = obj.reviews.first()
+        review = self._first_review(obj)
         return review.rating if review else None
     
     def get_documents(self, obj: Appointment) -> List[Dict]:
         """Retorna apenas documentos ativos (não deletados)"""
-        active_documents = obj.documents.filter(deleted_at__isnull=True)
-        return DocumentSerializer(active_documents, many=True).data
+        active_documents = getattr(obj, 'active_documents', None)
+        if active_documents is None:
+            active_documents = obj.documents.alive()
+        return DocumentSerializer(active_documents, many=True, context=self.context).data
     
     def get_extra_documents(self, obj: Appointment) -> List[Dict]:
         """Retorna apenas documentos extras ativos"""
-        active_documents = obj.extra_documents.filter(deleted_at__isnull=True)
-        return DocumentSerializer(active_documents, many=True).data
-
-    def _process_extra_documents(
-        self,
-        files: List[Any],
-        is_update: bool = False,
-        appointment: Appointment = None
-    ) -> List[Document]:
-        """Processa documentos extras do agendamento"""
-        if not files:
-            return []
-
-        documents_created = []
-        max_file_size = 5 * 1024 * 1024  # 5MB
-
-        try:
-            if is_update and appointment:
-                appointment.extra_documents.update(deleted_at=timezone.now())
-
-            for file in files:
-                if file.size > max_file_size:
-                    raise serializers.ValidationError(
-                        f"Arquivo {file.name} excede o tamanho máximo permitido (5MB)"
-                    )
-
-                if is_update and appointment and appointment.extra_documents.filter(
-                    file_name=file.name
-                ).exists():
-                    document = appointment.extra_documents.get(file_name=file.name)
-                    document.deleted_at = None
-                    document.save()
-                else:
-                    document = Document.objects.create(
-                        file_name=file.name,
-                        file_content=file.read(),
-                        file_type=file.name.split('.')[-1].lower(),
-                        document_type='extra'
-                    )
-                documents_created.append(document)
-
-            return documents_created
-
-        except Exception as e:
-            for doc in documents_created:
-                doc.delete()
-            raise serializers.ValidationError(f"Erro ao processar documentos extras: {str(e)}")
+        active_documents = getattr(obj, 'active_extra_documents', None)
+        if active_documents is None:
+            active_documents = obj.extra_documents.alive()
+        return DocumentSerializer(active_documents, many=True, context=self.context).data
+
+    def _new_document(self, file: Any, document_type: str) -> Document:
+        """Monta um documento ainda não gravado; o conteúdo é copiado em blocos para o blob store"""
+        document = Document(
+            file_name=file.name,
+            file_type=file.name.split('.')[-1].lower(),
+            document_type=document_type
+        )
+        document.set_uploaded_content(file)
+        return document
+
+    def _link_documents(self, relation, documents: List[Document]) -> None:
+        """Insere as linhas da tabela intermediária em uma consulta; os documentos são novos, então não há duplicatas"""
+        relation.through.objects.bulk_create([
+            relation.through(**{relation.source_field_name: relation.instance, relation.target_field_name: document})
+            for document in documents
+        ])
+
+    def _replace_documents(self, relation, files: List[Any], document_type: str) -> None:
+        """
+        Substitui os documentos da relação pelos arquivos enviados (já validados): os atuais
+        são excluídos logicamente, os de mesmo nome reativados com o novo conteúdo e os
+        demais criados e associados em lote. Deve rodar dentro da transação do update.
+        """
+        DocumentBlobService.soft_delete(relation.all())
+
+        existing = {}
+        for document in relation.filter(file_name__in=[file.name for file in files]).order_by('pk'):
+            existing.setdefault(document.file_name, document)
+
+        restored, created = [], []
+        for file in files:
+            document = existing.pop(file.name, None)
+            if document:
+                # Reativa o documento com o conteúdo recém-enviado; o anterior pode já ter sido recolhido
+                document.set_uploaded_content(file)
+                restored.append(document)
+            else:
+                created.append(self._new_document(file, document_type))
+
+        DocumentBlobService.bulk_restore(restored)
+        DocumentBlobService.bulk_create(created)
+        self._link_documents(relation, created)
+
+    def _validate_extra_documents(self, files: List[Any]) -> List[Any]:
+        """Valida os documentos extras enviados, antes de qualquer alteração nos existentes"""
+        max_file_size = get_max_upload_size()
+        for file in files:
+            DocumentService.validate_file_size(file, max_file_size)
+        return files
 
     def validate(self, attrs: Dict) -> Dict:
         """Validação completa dos dados do agendamento"""
@@ -197,37 +216,37 @@ class AppointmentSerializer(serializers.ModelSerializer):
             # Remove services do validated_data pois será adicionado depois
             validated_data.pop('services', None)
             validated_data.pop('extra_files', None)
-            
-            appointment = Appointment.objects.create(
-                client_id=client_id,
-                provider_id=provider_id,
-                **validated_data
-            )
-            
-            # Adiciona serviço
-            service = Service.objects.get(id=service_id)
-            appointment.services.add(service)
 
-            # Processa documentos
-            documents = self._process_documents(
-                request.FILES, 
-                [service_id], 
-                is_update=False
-            )
-            
-            if documents:
-                appointment.documents.add(*documents)
+            # Valida e monta os documentos antes de qualquer escrita no banco
+            documents = [
+                self._new_document(file, 'start')
+                for file in self._validate_documents(request.FILES, [service_id])
+            ]
+            extra_documents = [
+                self._new_document(file, 'extra')
+                for file in self._validate_extra_documents(extra_files)
+            ]
 
-            if extra_files:
-                extra_documents = self._process_extra_documents(extra_files)
-                if extra_documents:
-                    appointment.extra_documents.add(*extra_documents)
+            # Uma única transação: qualquer falha desfaz o agendamento, os documentos e as associações
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    client_id=client_id,
+                    provider_id=provider_id,
+                    **validated_data
+                )
+
+                # O serviço passa pelo add(): os agregados de avaliação e o consolidado do dashboard dependem do m2m_changed
+                appointment.services.add(service_id)
+
+                DocumentBlobService.bulk_create(documents + extra_documents)
+                self._link_documents(appointment.documents, documents)
+                self._link_documents(appointment.extra_documents, extra_documents)
 
             return appointment
 
+        except serializers.ValidationError:
+            raise
         except Exception as e:
-            if 'appointment' in locals():
-                appointment.delete()
             raise serializers.ValidationError(str(e))
 
     def update(self, instance: Appointment, validated_data: Dict[str, Any]) -> Appointment:
@@ -236,43 +255,39 @@ class AppointmentSerializer(serializers.ModelSerializer):
         if not request:
             raise serializers.ValidationError("Contexto da requisição não encontrado")
 
-        try:
-            extra_files = []
-            for key in request.FILES.keys():
-                if key.startswith('extra_document_'):
-                    extra_files.append(request.FILES[key])
-            validated_data.pop('extra_files', None)
+        extra_files = []
+        for key in request.FILES.keys():
+            if key.startswith('extra_document_'):
+                extra_files.append(request.FILES[key])
+        validated_data.pop('extra_files', None)
+        service_id = request.data.get('services')
 
-            instance = self._update_basic_fields(instance, request.data)
-            
-            service_id = request.data.get('services')
-            if service_id:
-                service = Service.objects.get(id=service_id)
-                instance.services.clear()
-                instance.services.add(service)
-
-            if request.FILES:
-                new_documents = self._process_documents(
-                    request.FILES,
-                    [service_id] if service_id else [s.id for s in instance.services.all()],
-                    is_update=True,
-                    appointment=instance
-                )
-                if new_documents:
-                    instance.documents.add(*new_documents)
-                
-                if extra_files:
-                    new_extra_documents = self._process_extra_documents(
-                        extra_files,
-                        is_update=True,
-                        appointment=instance
-                    )
-                    if new_extra_documents:
-                        instance.extra_documents.add(*new_extra_documents)
-
-            instance.save()
+        try:
+            # Todos os arquivos são validados antes de alterar os documentos existentes
+            service_ids = [service_id] if service_id else list(instance.services.values_list('id', flat=True))
+            files = self._validate_documents(request.FILES, service_ids)
+            extra_files = self._validate_extra_documents(extra_files)
+
+            # Uma única transação: em caso de falha a exclusão dos documentos anteriores (e a
+            # remoção dos blobs agendada para o commit) é desfeita junto com o restante
+            with transaction.atomic():
+                instance = self._update_basic_fields(instance, request.data)
+
+                if service_id:
+                    service = Service.objects.get(id=service_id)
+                    instance.services.clear()
+                    instance.services.add(service)
+
+                if request.FILES:
+                    self._replace_documents(instance.documents, files, 'start')
+                    if extra_files:
+                        self._replace_documents(instance.extra_documents, extra_files, 'extra')
+
+                instance.save()
             return instance
 
+        except serializers.ValidationError:
+            raise
         except Exception as e:
             raise serializers.ValidationError(str(e))
 
@@ -292,68 +307,32 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
         return instance
 
-    def _process_documents(
-        self, 
-        files: Dict, 
-        service_ids: List[int], 
-        is_update: bool = False,
-        appointment: Appointment = None
-    ) -> List[Document]:
-        """Processa documentos do agendamento"""
+    def _validate_documents(self, files: Dict, service_ids: List[int]) -> List[Any]:
+        """
+        Valida tipo e tamanho dos documentos obrigatórios enviados, antes de
+        qualquer alteração nos existentes, e retorna os arquivos na ordem dos requisitos
+        """
         if not files:
             return []
 
-        document_service = DocumentService()
-        documents_created = []
+        requirements = ServiceDocumentRequirement.objects.filter(
+            service__in=service_ids
+        ).select_related('document_template')
 
-        try:
-            if is_update and appointment:
-                appointment.documents.update(deleted_at=timezone.now())
-
-            requirements = ServiceDocumentRequirement.objects.filter(
-                service__in=service_ids
-            ).select_related('document_template')
-
-            for requirement in requirements:
-                file_key = f'document_requirement_{requirement.id}'
-                if file_key in files:
-                    file = files[file_key]
-                    
-                    # Valida tipo do arquivo
-                    document_service.validate_file_type(
-                        file, 
-                        requirement.document_template.file_types
-                    )
-
-                    # Verifica se documento já existe (em caso de update)
-                    if is_update and appointment and appointment.documents.filter(
-                        file_name=file.name
-                    ).exists():
-                        document = appointment.documents.get(file_name=file.name)
-                        document.deleted_at = None
-                        document.save()
-                        documents_created.append(document)
-                    else:
-                        # Cria novo documento
-                        document = Document.objects.create(
-                            file_name=file.name,
-                            file_content=file.read(),
-                            file_type=file.name.split('.')[-1].lower(),
-                            document_type='start'
-                        )
-                        documents_created.append(document)
-
-            return documents_created
+        validated = []
+        for requirement in requirements:
+            file = files.get(f'document_requirement_{requirement.id}')
+            if file is None:
+                continue
+            DocumentService.validate_file_type(file, requirement.document_template.file_types)
+            DocumentService.validate_file_size(file, get_max_upload_size())
+            validated.append(file)
+        return validated
 
-        except Exception as e:
-            for doc in documents_created:
-                doc.delete()
-            raise serializers.ValidationError(f"Erro ao processar documentos: {str(e)}")
-        
     def get_review(self, obj: Appointment) -> Dict:
         # tem que trazer o review do user logado
         user = self.context.get('request').user
-        review = obj.reviews.filter(user=user).first()
+        review = self._first_review(obj, user)
         return ReviewSerializer(review).data if review else None
         
 class ReviewSerializer(serializers.ModelSerializer):
@@ -1,13 +1,51 @@
+from django.db.models import Prefetch
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from appointment.models import Appointment, Review
 from appointment.api.serializers import AppointmentSerializer, ReviewSerializer
+from appointment.services import AvailabilityService
 from core.models.mixins import DynamicPermissionModelViewSet
+from documents.models.document import Document
+from documents.models.document_template import ServiceDocumentRequirement
+from documents.uploads import DocumentStorageUploadHandler
+from service.models import Service
 
 class AppointmentViewSet(DynamicPermissionModelViewSet):
-    queryset = Appointment.objects.filter(deleted_at__isnull=True).all()
+    queryset = Appointment.objects.alive()
     serializer_class = AppointmentSerializer
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action in ('create', 'update', 'partial_update'):
+            # Os documentos enviados vão direto para o blob store, sem passar inteiros pela memória
+            request.upload_handlers = [DocumentStorageUploadHandler(request)]
+        return drf_request
+
+    def get_queryset(self):
+        """
+        Carrega em lote tudo que o AppointmentSerializer acessa, mantendo o número
+        de queries da listagem constante independentemente da quantidade de agendamentos
+        """
+        services = Service.objects.prefetch_related(
+            Prefetch(
+                'document_requirements',
+                queryset=ServiceDocumentRequirement.objects.select_related(
+                    'document_template__document'
+                ).defer('document_template__document__file_content')
+            )
+        )
+
+        active_documents = Document.objects.alive()
+
+        return super().get_queryset().select_related(
+            'client', 'provider'
+        ).prefetch_related(
+            Prefetch('services', queryset=services),
+            Prefetch('documents', queryset=active_documents, to_attr='active_documents'),
+            Prefetch('extra_documents', queryset=active_documents, to_attr='active_extra_documents'),
+            'reviews',
+        )
     
     @action(detail=True, methods=['patch'])
     def update_status(self, request, pk=None):
@@ -43,6 +81,49 @@ class AppointmentViewSet(DynamicPermissionModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['get'], url_path='available_slots')
+    def available_slots(self, request):
+        """
+        Lista os horários livres de um prestador para um serviço dentro de uma janela
+        """
+        params = request.query_params
+        provider_id = params.get('provider')
+        service_id = params.get('service')
+
+        if not provider_id or not service_id:
+            return Response(
+                {'error': 'Parâmetros provider e service são obrigatórios'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            service = Service.objects.alive().get(id=service_id)
+        except (Service.DoesNotExist, ValueError):
+            return Response(
+                {'error': 'Serviço não encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            provider_id = AvailabilityService.parse_provider_param(provider_id)
+            start = AvailabilityService.parse_datetime_param(params.get('from'), 'from')
+            end = AvailabilityService.parse_datetime_param(params.get('to'), 'to')
+            step = AvailabilityService.parse_step_param(params.get('step'))
+            slots = AvailabilityService.find_available_slots(
+                provider_id, service.duration, start, end, step
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'provider': provider_id,
+            'service': service.id,
+            'duration': service.duration,
+            'from': start,
+            'to': end,
+            'slots': slots,
+        })
+
 class ReviewViewSet(DynamicPermissionModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
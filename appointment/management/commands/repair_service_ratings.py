@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from appointment.services import ServiceRatingService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula rating_sum e rating_count dos serviços a partir das avaliações ativas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--service', type=int, action='append', dest='services',
+            help='Id de um serviço a recalcular (pode ser repetido); por padrão, todos'
+        )
+
+    def handle(self, *args, **options):
+        total = ServiceRatingService.recompute(options['services'])
+        self.stdout.write(self.style.SUCCESS(f'Avaliações recalculadas para {total} serviços.'))
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_service_ratings(apps, schema_editor):
+    Review = apps.get_model('appointment', 'Review')
+    Service = apps.get_model('service', 'Service')
+
+    reviews = Review.objects.filter(
+        deleted_at__isnull=True,
+        appointment__services=OuterRef('pk')
+    ).order_by().values('appointment__services')
+
+    Service.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0)),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0015_appointment_extra_documents'),
+        ('service', '0003_service_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_service_ratings, migrations.RunPython.noop),
+    ]
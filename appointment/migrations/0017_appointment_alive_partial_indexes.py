@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0016_backfill_service_ratings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['provider', 'appointment_date'], name='appointment_provider_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['status'], name='appointment_alive_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['appointment_date'], name='appointment_alive_date_idx'),
+        ),
+    ]
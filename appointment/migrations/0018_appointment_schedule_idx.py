@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0017_appointment_alive_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_provider_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['provider', 'status', 'appointment_date'], include=('id',), name='appointment_schedule_idx'),
+        ),
+    ]
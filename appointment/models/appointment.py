@@ -1,12 +1,14 @@
 from django.db import models
 import uuid
-from django.db.models import Q
+from django.db.models import DateTimeField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
 from datetime import datetime, timedelta
 
 from django.forms import ValidationError
 from authentication.models import User
 from documents.models.document import Document
 from service.models import Service
+from core.models.expressions import Minutes
 from core.models.mixins import TimeStampedModel
 
 class Appointment(TimeStampedModel):
@@ -34,7 +36,28 @@ class Appointment(TimeStampedModel):
     )
 
     class Meta:
-        ordering = ['-created_at'] 
+        ordering = ['-created_at']
+        # Índices parciais: cobrem apenas os agendamentos ativos, que são os consultados
+        indexes = [
+            # Agenda do prestador: check_availability, horários livres e agenda em lote (Appointment.scheduled).
+            # Com o id incluído (PostgreSQL), as colunas lidas do agendamento vêm todas do índice
+            models.Index(
+                fields=['provider', 'status', 'appointment_date'],
+                include=['id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='appointment_schedule_idx'
+            ),
+            models.Index(
+                fields=['status'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='appointment_alive_status_idx'
+            ),
+            models.Index(
+                fields=['appointment_date'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='appointment_alive_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Appointment {self.id} for {self.client.name} with {self.provider.name}"
@@ -44,6 +67,35 @@ class Appointment(TimeStampedModel):
             raise ValidationError("Este agendamento não pode ser excluído pois já foi confirmado.")
         return super().delete()
     
+    @classmethod
+    def with_end_time(cls, queryset=None):
+        """
+        Anota em cada agendamento a duração total (soma das durações dos serviços)
+        e o horário de término calculado pelo banco.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        return queryset.annotate(
+            total_duration=Coalesce(Sum('services__duration'), 0),
+        ).annotate(
+            end_time=ExpressionWrapper(
+                F('appointment_date') + Minutes(F('total_duration')),
+                output_field=DateTimeField()
+            ),
+        )
+
+    @classmethod
+    def scheduled(cls, provider_ids):
+        """
+        Agendamentos ativos que ocupam a agenda dos prestadores (pendentes ou em andamento).
+        Os filtros correspondem ao índice appointment_schedule_idx.
+        """
+        return cls.objects.alive().filter(
+            provider_id__in=provider_ids,
+            status__in=[cls.Status.PENDING, cls.Status.IN_PROGRESS]
+        )
+
     @classmethod
     def check_availability(cls, proposed_date, provider_id, service_duration, exclude_appointment_id=None):
         """
@@ -60,35 +112,28 @@ class Appointment(TimeStampedModel):
 
         service_end = proposed_date + timedelta(minutes=service_duration)
 
-        base_query = cls.objects.filter(
-            provider_id=provider_id,
-            deleted_at__isnull=True,
-            status__in=[cls.Status.PENDING, cls.Status.IN_PROGRESS]
-        )
+        base_query = cls.scheduled([provider_id])
 
         if exclude_appointment_id:
             base_query = base_query.exclude(id=exclude_appointment_id)
 
-        conflicting_appointments = base_query.filter(
-            Q(appointment_date__lt=service_end) &
-            Q(appointment_date__gt=proposed_date - timedelta(minutes=60))
-        )
+        # O término de cada agendamento é calculado no banco, então a consulta
+        # retorna apenas os conflitos reais, qualquer que seja a duração dos serviços
+        conflicting_appointments = cls.with_end_time(base_query).filter(
+            appointment_date__lt=service_end,
+            end_time__gte=proposed_date
+        ).annotate(
+            client_name=F('client__name')
+        ).prefetch_related('services').order_by('appointment_date')
 
-        conflicts = []
-        for app in conflicting_appointments:
-            app_duration = app.services.first().duration if app.services.exists() else 0
-            app_end = app.appointment_date + timedelta(minutes=app_duration)
-            
-            if (app.appointment_date <= service_end and 
-                app_end >= proposed_date):
-                conflicts.append({
-                    'appointment_id': app.id,
-                    'start': app.appointment_date,
-                    'end': app_end,
-                    'service': app.services.first().name if app.services.exists() else 'Não especificado',
-                    'client': app.client.name,
-                    'status': app.status
-                })
+        conflicts = [{
+            'appointment_id': app.id,
+            'start': app.appointment_date,
+            'end': app.end_time,
+            'service': ', '.join(service.name for service in app.services.all()) or 'Não especificado',
+            'client': app.client_name,
+            'status': app.status
+        } for app in conflicting_appointments]
 
         return {
             'is_available': len(conflicts) == 0,
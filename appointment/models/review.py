@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from appointment.models.appointment import Appointment
 from authentication.models.user import User
 from core.models.mixins import TimeStampedModel
@@ -15,4 +15,13 @@ class Review(TimeStampedModel):
     user = models.ForeignKey(User, on_delete=models.PROTECT)
 
     def __str__(self):
-        return f'Review for {self.appointment.id} by {self.user.name}'
\ No newline at end of file
+        return f'Review for {self.appointment.id} by {self.user.name}'
+
+    def save(self, *args, **kwargs):
+        # Os agregados de avaliação do serviço são atualizados pelos sinais na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self):
+        with transaction.atomic():
+            return super().delete()
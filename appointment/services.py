@@ -0,0 +1,213 @@
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from appointment.models.appointment import Appointment
+from appointment.models.review import Review
+from service.models.service import Service
+
+Interval = Tuple[datetime, datetime]
+
+
+class AvailabilityService:
+    """Serviço para busca de horários livres dos prestadores."""
+    MAX_WINDOW = timedelta(days=31)
+    DEFAULT_STEP_MINUTES = 15
+
+    @staticmethod
+    def parse_datetime_param(value: str, name: str) -> datetime:
+        parsed = parse_datetime(value) if value else None
+        if not parsed:
+            raise ValueError(f'Parâmetro {name} inválido ou ausente')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    @staticmethod
+    def parse_provider_param(value: str) -> uuid.UUID:
+        try:
+            return uuid.UUID(str(value).strip())
+        except ValueError:
+            raise ValueError('Parâmetro provider inválido')
+
+    @staticmethod
+    def parse_step_param(value: Optional[str]) -> int:
+        if value in (None, ''):
+            return AvailabilityService.DEFAULT_STEP_MINUTES
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError('Parâmetro step inválido')
+
+    @staticmethod
+    def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+        """Une intervalos sobrepostos ou encostados em uma lista ordenada e disjunta."""
+        merged: List[Interval] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def get_busy_intervals(provider_id, start: datetime, end: datetime) -> List[Interval]:
+        """Busca, em uma única consulta, os intervalos ocupados do prestador na janela."""
+        appointments = Appointment.with_end_time(
+            Appointment.scheduled([provider_id])
+        ).filter(
+            appointment_date__lt=end,
+            end_time__gte=start
+        ).values_list('appointment_date', 'end_time')
+
+        return AvailabilityService.merge_intervals(appointments)
+
+    @staticmethod
+    def find_available_slots(
+        provider_id,
+        duration: int,
+        start: datetime,
+        end: datetime,
+        step_minutes: int = DEFAULT_STEP_MINUTES
+    ) -> List[datetime]:
+        """
+        Retorna todos os horários de início, alinhados a step_minutes a partir de start,
+        em que um serviço de duration minutos cabe sem conflitar com a agenda.
+
+        Usa a mesma regra de Appointment.check_availability: um agendamento
+        conflita se começa antes do fim proposto e termina a partir do início proposto.
+        """
+        if end <= start:
+            raise ValueError('A data final deve ser posterior à data inicial')
+        if end - start > AvailabilityService.MAX_WINDOW:
+            raise ValueError(f'A janela de busca não pode exceder {AvailabilityService.MAX_WINDOW.days} dias')
+        if duration <= 0 or step_minutes <= 0:
+            raise ValueError('Duração e intervalo devem ser positivos')
+
+        busy = AvailabilityService.get_busy_intervals(provider_id, start, end)
+        length = timedelta(minutes=duration)
+        step = timedelta(minutes=step_minutes)
+
+        slots = []
+        index = 0
+        slot = start
+        while slot + length <= end:
+            while index < len(busy) and busy[index][1] < slot:
+                index += 1
+
+            if index < len(busy) and busy[index][0] < slot + length:
+                # Pula direto para o primeiro horário da grade após o fim do intervalo ocupado
+                slot = start + ((busy[index][1] - start) // step + 1) * step
+                continue
+
+            slots.append(slot)
+            slot += step
+
+        return slots
+
+
+class ProviderScheduleService:
+    """Serviço para montagem, em lote, da agenda futura dos prestadores."""
+    MAX_WINDOW = timedelta(days=31)
+
+    @staticmethod
+    def parse_provider_ids(values: Iterable[str]) -> List[uuid.UUID]:
+        """Aceita o parâmetro provider repetido e/ou separado por vírgulas"""
+        try:
+            return [uuid.UUID(value.strip()) for item in values for value in item.split(',') if value.strip()]
+        except ValueError:
+            raise ValueError('Parâmetro provider inválido')
+
+    @staticmethod
+    def get_window(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Interval:
+        """Janela padrão: de agora até MAX_WINDOW à frente"""
+        start = start or timezone.now()
+        end = end or start + ProviderScheduleService.MAX_WINDOW
+        if end <= start:
+            raise ValueError('A data final deve ser posterior à data inicial')
+        if end - start > ProviderScheduleService.MAX_WINDOW:
+            raise ValueError(f'A janela da agenda não pode exceder {ProviderScheduleService.MAX_WINDOW.days} dias')
+        return start, end
+
+    @staticmethod
+    def get_schedules(provider_ids, start: datetime, end: datetime) -> Dict[uuid.UUID, List[Dict]]:
+        """
+        Busca os agendamentos ativos de todos os prestadores na janela [start, end)
+        e os agrupa por prestador. São duas consultas, independente da quantidade
+        de prestadores: agendamentos com o término calculado pelo banco e serviços.
+        """
+        appointments = Appointment.with_end_time(
+            Appointment.scheduled(provider_ids).filter(
+                appointment_date__gte=start,
+                appointment_date__lt=end
+            ).only('id', 'provider_id', 'appointment_date')
+        ).prefetch_related(
+            Prefetch('services', queryset=Service.objects.only('id', 'name').order_by('pk'))
+        ).order_by('appointment_date')
+
+        schedules = defaultdict(list)
+        for appointment in appointments:
+            services = appointment.services.all()
+            schedules[appointment.provider_id].append({
+                'id': appointment.id,
+                'start': appointment.appointment_date,
+                'end': appointment.end_time,
+                'service': services[0].name if services else None,
+            })
+        return schedules
+
+
+class ServiceRatingService:
+    """
+    Serviço de manutenção dos agregados de avaliação (rating_sum/rating_count) dos serviços.
+
+    Cada avaliação ativa conta para todos os serviços do seu agendamento. As
+    alterações são aplicadas como deltas com F(), o que as mantém corretas
+    mesmo com avaliações gravadas em paralelo.
+    """
+
+    @staticmethod
+    def apply(service_ids, rating_delta: int, count_delta: int) -> None:
+        if not rating_delta and not count_delta:
+            return
+        Service.objects.filter(pk__in=service_ids).update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta
+        )
+
+    @staticmethod
+    def apply_to_appointment(appointment_id, rating_delta: int, count_delta: int) -> None:
+        """Aplica o delta a todos os serviços do agendamento, em uma única consulta"""
+        ServiceRatingService.apply(
+            Appointment.services.through.objects.filter(appointment_id=appointment_id).values('service_id'),
+            rating_delta,
+            count_delta
+        )
+
+    @staticmethod
+    def totals(appointment_ids) -> Tuple[int, int]:
+        """Soma e quantidade das avaliações ativas dos agendamentos"""
+        result = Review.objects.alive().filter(
+            appointment_id__in=appointment_ids
+        ).aggregate(total=Sum('rating'), quantity=Count('id'))
+        return result['total'] or 0, result['quantity']
+
+    @staticmethod
+    def recompute(service_ids=None) -> int:
+        """Recalcula os agregados a partir das avaliações; usado pelo comando de reparo"""
+        reviews = Review.objects.alive().filter(
+            appointment__services=OuterRef('pk')
+        ).order_by().values('appointment__services')
+
+        services = Service.objects.all()
+        if service_ids is not None:
+            services = services.filter(pk__in=service_ids)
+
+        return services.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0)),
+            rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), Value(0))
+        )
@@ -0,0 +1,75 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from appointment.models.appointment import Appointment
+from appointment.models.review import Review
+from appointment.services import ServiceRatingService
+
+
+def _contribution(rating, deleted_at):
+    """Quanto uma avaliação soma em (rating_sum, rating_count)"""
+    return (rating, 1) if deleted_at is None else (0, 0)
+
+
+@receiver(pre_save, sender=Review)
+def capture_review_state(sender, instance, raw=False, **kwargs):
+    instance._rating_previous = None
+    if raw or instance._state.adding:
+        return
+    instance._rating_previous = Review.objects.filter(pk=instance.pk).values(
+        'rating', 'deleted_at', 'appointment_id'
+    ).first()
+
+
+@receiver(post_save, sender=Review)
+def update_service_ratings(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, '_rating_previous', None)
+    rating, count = _contribution(int(instance.rating), instance.deleted_at)
+
+    if previous and previous['appointment_id'] != instance.appointment_id:
+        old_rating, old_count = _contribution(previous['rating'], previous['deleted_at'])
+        ServiceRatingService.apply_to_appointment(previous['appointment_id'], -old_rating, -old_count)
+    elif previous:
+        old_rating, old_count = _contribution(previous['rating'], previous['deleted_at'])
+        rating, count = rating - old_rating, count - old_count
+
+    ServiceRatingService.apply_to_appointment(instance.appointment_id, rating, count)
+
+
+@receiver(post_delete, sender=Review)
+def remove_service_ratings(sender, instance, **kwargs):
+    rating, count = _contribution(instance.rating, instance.deleted_at)
+    ServiceRatingService.apply_to_appointment(instance.appointment_id, -rating, -count)
+
+
+@receiver(m2m_changed, sender=Appointment.services.through)
+def move_service_ratings(sender, instance, action, reverse, pk_set, **kwargs):
+    related = instance.appointments if reverse else instance.services
+    if action == 'pre_clear':
+        # Guarda o outro lado da relação, que não é informado no post_clear
+        instance._rating_removed = set(related.values_list('pk', flat=True))
+        return
+    if action == 'pre_remove':
+        # O remove informa os ids pedidos, mesmo os que não estavam associados
+        instance._rating_removed = set(related.filter(pk__in=pk_set).values_list('pk', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action != 'post_add':
+        pk_set = getattr(instance, '_rating_removed', set())
+    if not pk_set:
+        return
+
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        # instance é o serviço; pk_set são agendamentos
+        rating, count = ServiceRatingService.totals(pk_set)
+        ServiceRatingService.apply([instance.pk], sign * rating, sign * count)
+    else:
+        rating, count = ServiceRatingService.totals([instance.pk])
+        ServiceRatingService.apply(pk_set, sign * rating, sign * count)
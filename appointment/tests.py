@@ -1,11 +1,25 @@
+import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from model_bakery import baker
+from appointment.api.serializers import AppointmentSerializer
 from appointment.models import Appointment
 from appointment.models.review import Review
+from appointment.services import AvailabilityService, ProviderScheduleService
 from core.models.feature import Feature
+from documents.models.document import Document
+from documents.models.document_blob import DocumentBlob
+from documents.services import DocumentBlobService
+from documents.models.document_template import DocumentTemplate, ServiceDocumentRequirement
 from core.models.role import Role
+from service.api.serializers import ServiceSerializer
 from service.models import Service
 from django.core.files.uploadedfile import SimpleUploadedFile
 import json
@@ -97,6 +111,39 @@ class AppointmentViewSetTests(APITestCase):
             f"Expected 'Horário indisponível para agendamento' in {error_messages}"
         )
 
+    def test_create_appointment_streams_documents_to_storage(self):
+        content = b"conteudo do documento extra" * 100
+        data = {
+            "appointment_date": "2024-12-02T10:00:00Z",
+            "client": str(self.user.id),
+            "provider": str(self.user.id),
+            "services": [self.service.id],
+            "extra_document_1": SimpleUploadedFile("extra.pdf", content, content_type="application/pdf"),
+        }
+
+        response = self.client.post(self.url, data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        document = Appointment.objects.get(id=response.data['id']).extra_documents.get()
+        self.assertIsNone(document.file_content)
+        self.assertEqual(document.file_size, len(content))
+        self.assertEqual(document.read_content(), content)
+
+    @override_settings(DOCUMENT_MAX_UPLOAD_SIZE=1024)
+    def test_create_appointment_rejects_oversized_document(self):
+        data = {
+            "appointment_date": "2024-12-02T10:00:00Z",
+            "client": str(self.user.id),
+            "provider": str(self.user.id),
+            "services": [self.service.id],
+            "extra_document_1": SimpleUploadedFile("extra.pdf", b"x" * 2048, content_type="application/pdf"),
+        }
+
+        response = self.client.post(self.url, data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("excede o tamanho máximo", str(response.data))
+        self.assertEqual(Appointment.objects.alive().count(), 1)
+
     def test_list_appointments(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -193,4 +240,575 @@ class ReviewViewSetTests(APITestCase):
     # def tearDown(self):
     #     # Limpar banco de dados após cada teste
     #     Appointment.objects.all().delete()
-    #     Review.objects.all().delete()
\ No newline at end of file
+    #     Review.objects.all().delete()
+
+class AppointmentAvailabilityTests(TestCase):
+
+    def setUp(self):
+        self.provider = baker.make("authentication.User")
+        self.client_user = baker.make("authentication.User")
+        self.long_service = baker.make(Service, duration=180)
+        self.short_service = baker.make(Service, duration=30)
+
+    def _make_appointment(self, date, *services, status=Appointment.Status.PENDING):
+        appointment = baker.make(
+            Appointment,
+            appointment_date=date,
+            status=status,
+            client=self.client_user,
+            provider=self.provider,
+        )
+        appointment.services.add(*services)
+        return appointment
+
+    def test_detects_conflict_with_long_service(self):
+        appointment = self._make_appointment(datetime(2024, 12, 1, 10, tzinfo=dt_timezone.utc), self.long_service)
+
+        availability = Appointment.check_availability(
+            "2024-12-01T12:00:00Z", self.provider.id, 30
+        )
+
+        self.assertFalse(availability['is_available'])
+        self.assertEqual(availability['conflicts'][0]['appointment_id'], appointment.id)
+        self.assertEqual(
+            availability['conflicts'][0]['end'],
+            datetime(2024, 12, 1, 13, tzinfo=dt_timezone.utc)
+        )
+
+    def test_end_time_sums_all_services(self):
+        self._make_appointment(
+            datetime(2024, 12, 1, 10, tzinfo=dt_timezone.utc), self.long_service, self.short_service
+        )
+
+        self.assertFalse(Appointment.check_availability(
+            "2024-12-01T13:15:00Z", self.provider.id, 30
+        )['is_available'])
+        self.assertTrue(Appointment.check_availability(
+            "2024-12-01T13:45:00Z", self.provider.id, 30
+        )['is_available'])
+
+    def test_ignores_canceled_and_excluded_appointments(self):
+        self._make_appointment(
+            datetime(2024, 12, 1, 10, tzinfo=dt_timezone.utc), self.short_service,
+            status=Appointment.Status.CANCELED
+        )
+        excluded = self._make_appointment(datetime(2024, 12, 1, 10, tzinfo=dt_timezone.utc), self.short_service)
+
+        availability = Appointment.check_availability(
+            "2024-12-01T10:00:00Z", self.provider.id, 30, exclude_appointment_id=excluded.id
+        )
+        self.assertTrue(availability['is_available'])
+
+    def test_query_count_does_not_depend_on_conflicts(self):
+        for hour in range(8, 18):
+            self._make_appointment(datetime(2024, 12, 1, hour, tzinfo=dt_timezone.utc), self.long_service)
+
+        with self.assertNumQueries(2):
+            availability = Appointment.check_availability(
+                "2024-12-01T09:00:00Z", self.provider.id, 600
+            )
+        self.assertEqual(len(availability['conflicts']), 10)
+
+
+class AvailableSlotsTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('appointment-available-slots')
+
+        feature, _ = Feature.objects.get_or_create(name="appointment.available_slots_appointment")
+        self.role = Role.objects.create(name="client", role_type="client")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.provider = baker.make("authentication.User")
+        self.service = baker.make(Service, duration=60)
+        appointment = baker.make(
+            Appointment,
+            status=Appointment.Status.PENDING,
+            appointment_date=datetime(2024, 12, 1, 10, tzinfo=dt_timezone.utc),
+            client=self.user,
+            provider=self.provider,
+        )
+        appointment.services.add(self.service)
+
+    def _get(self, **params):
+        query = {
+            'provider': str(self.provider.id),
+            'service': self.service.id,
+            'from': '2024-12-01T08:00:00Z',
+            'to': '2024-12-01T14:00:00Z',
+            'step': 30,
+            **params,
+        }
+        return self.client.get(self.url, query)
+
+    def test_returns_slots_that_fit_around_busy_intervals(self):
+        response = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        slots = [slot.strftime('%H:%M') for slot in response.data['slots']]
+        self.assertEqual(slots, ['08:00', '08:30', '09:00', '11:30', '12:00', '12:30', '13:00'])
+
+    def test_slots_pass_availability_check(self):
+        response = self._get()
+        for slot in response.data['slots']:
+            self.assertTrue(
+                Appointment.check_availability(slot, self.provider.id, self.service.duration)['is_available']
+            )
+
+    def test_month_window_runs_in_constant_queries(self):
+        for day in range(1, 29):
+            for hour in (9, 13, 16):
+                appointment = baker.make(
+                    Appointment,
+                    appointment_date=datetime(2025, 1, day, hour, tzinfo=dt_timezone.utc),
+                    client=self.user,
+                    provider=self.provider,
+                )
+                appointment.services.add(self.service)
+
+        # Verificação de permissão, serviço e intervalos ocupados
+        self._get(**{'from': '2025-01-01T00:00:00Z', 'to': '2025-01-31T00:00:00Z'})
+        with self.assertNumQueries(2):
+            response = self._get(**{'from': '2025-01-01T00:00:00Z', 'to': '2025-01-31T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(datetime(2025, 1, 1, 9, tzinfo=dt_timezone.utc), response.data['slots'])
+
+    def test_rejects_invalid_window(self):
+        response = self._get(**{'from': '2024-12-01T08:00:00Z', 'to': '2025-03-01T08:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self._get(**{'to': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejects_invalid_provider_and_step(self):
+        response = self._get(provider='abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Parâmetro provider inválido'})
+
+        response = self._get(step='abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Parâmetro step inválido'})
+
+    def test_merge_intervals(self):
+        t = lambda hour: datetime(2024, 12, 1, hour, tzinfo=dt_timezone.utc)
+        merged = AvailabilityService.merge_intervals([(t(12), t(13)), (t(8), t(10)), (t(9), t(11)), (t(11), t(12))])
+        self.assertEqual(merged, [(t(8), t(13))])
+
+
+class ProviderScheduleTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('user-providers')
+
+        feature, _ = Feature.objects.get_or_create(name="providers_userviewset")
+        self.role = Role.objects.create(name="client", role_type="client")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.provider_role = Role.objects.create(name="provider", role_type="provider")
+        self.service = baker.make(Service, name="Corte", duration=30)
+        self.other_service = baker.make(Service, name="Barba", duration=45)
+
+    def _make_provider(self, appointments=0):
+        provider = baker.make("authentication.User", role=self.provider_role)
+        for day in range(1, appointments + 1):
+            appointment = baker.make(
+                Appointment,
+                status=Appointment.Status.PENDING,
+                appointment_date=datetime(2025, 1, day, 10, tzinfo=dt_timezone.utc),
+                client=self.user,
+                provider=provider,
+            )
+            appointment.services.add(self.service, self.other_service)
+        return provider
+
+    def _get(self, **params):
+        query = {'from': '2025-01-01T00:00:00Z', 'to': '2025-01-31T00:00:00Z', **params}
+        return self.client.get(self.url, query)
+
+    def test_returns_grouped_schedule_with_total_duration(self):
+        provider = self._make_provider(appointments=2)
+        baker.make(
+            Appointment,
+            status=Appointment.Status.COMPLETED,
+            appointment_date=datetime(2025, 1, 5, 10, tzinfo=dt_timezone.utc),
+            client=self.user,
+            provider=provider,
+        )
+
+        response = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        schedule = next(item for item in response.data if item['id'] == str(provider.id))['appointments']
+        self.assertEqual(len(schedule), 2)
+        self.assertEqual(schedule[0]['start'], datetime(2025, 1, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(schedule[0]['end'], datetime(2025, 1, 1, 11, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual(schedule[0]['service'], 'Corte')
+
+    def test_window_and_provider_filters(self):
+        provider = self._make_provider(appointments=3)
+        other = self._make_provider(appointments=1)
+
+        response = self._get(provider=str(provider.id), to='2025-01-03T00:00:00Z')
+        self.assertEqual([item['id'] for item in response.data], [str(provider.id)])
+        self.assertEqual(len(response.data[0]['appointments']), 2)
+
+        response = self._get(provider=f'{provider.id},{other.id}')
+        self.assertEqual({item['id'] for item in response.data}, {str(provider.id), str(other.id)})
+
+    def test_rejects_invalid_parameters(self):
+        self.assertEqual(self._get(provider='abc').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(to='2025-06-01T00:00:00Z').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_grow_with_providers(self):
+        self._make_provider(appointments=2)
+        self._get()
+
+        with CaptureQueriesContext(connection) as context:
+            self._get()
+        queries = len(context.captured_queries)
+
+        for _ in range(5):
+            self._make_provider(appointments=3)
+        with self.assertNumQueries(queries):
+            response = self._get()
+        self.assertEqual(len(response.data), 6)
+
+    def test_default_window_starts_now(self):
+        start, end = ProviderScheduleService.get_window()
+        self.assertEqual(end - start, ProviderScheduleService.MAX_WINDOW)
+
+
+class AppointmentListQueryTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('appointment-list')
+
+        feature, _ = Feature.objects.get_or_create(name="appointment.list_appointment")
+        self.role = Role.objects.create(name="provider", role_type="provider")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.service = baker.make(Service, duration=60)
+        template = baker.make(DocumentTemplate, document=baker.make(Document, file_name="modelo.pdf"))
+        baker.make(ServiceDocumentRequirement, service=self.service, document_template=template)
+
+    def _create_appointments(self, count):
+        for _ in range(count):
+            appointment = baker.make(
+                Appointment,
+                appointment_date="2024-12-01T10:00:00Z",
+                client=baker.make("authentication.User"),
+                provider=self.user,
+            )
+            appointment.services.add(self.service)
+            appointment.documents.add(baker.make(Document, file_name="rg.pdf"))
+            appointment.documents.add(baker.make(Document, file_name="antigo.pdf", deleted_at="2024-11-01T10:00:00Z"))
+            appointment.extra_documents.add(baker.make(Document, file_name="extra.pdf"))
+            baker.make(Review, appointment=appointment, user=self.user, rating=8)
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def test_list_query_count_is_bounded(self):
+        self._create_appointments(2)
+        self._count_list_queries()
+        small_page_queries, _ = self._count_list_queries()
+
+        self._create_appointments(8)
+        large_page_queries, _ = self._count_list_queries()
+
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_list_serializes_prefetched_data(self):
+        self._create_appointments(1)
+        _, response = self._count_list_queries()
+
+        appointment = response.data['results'][0]
+        self.assertEqual([doc['file_name'] for doc in appointment['documents']], ['rg.pdf'])
+        self.assertEqual([doc['file_name'] for doc in appointment['extra_documents']], ['extra.pdf'])
+        self.assertEqual(appointment['rating'], 8)
+        self.assertEqual(appointment['review']['rating'], 8)
+        self.assertEqual(appointment['services'][0]['rating_avg'], 8)
+
+
+class ServiceRatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.service = baker.make(Service, duration=30)
+        self.other_service = baker.make(Service, duration=30)
+        self.appointment = baker.make(Appointment, appointment_date="2024-12-01T10:00:00Z")
+        self.appointment.services.add(self.service)
+
+    def _aggregates(self, service):
+        service.refresh_from_db()
+        return service.rating_sum, service.rating_count
+
+    def test_review_create_update_and_delete(self):
+        review = baker.make(Review, appointment=self.appointment, rating=8)
+        baker.make(Review, appointment=self.appointment, rating=6)
+        self.assertEqual(self._aggregates(self.service), (14, 2))
+        self.assertEqual(self.service.rating_average, 7)
+
+        review.rating = 10
+        review.save()
+        self.assertEqual(self._aggregates(self.service), (16, 2))
+
+        review.delete()
+        self.assertEqual(self._aggregates(self.service), (6, 1))
+        self.assertEqual(self._aggregates(self.other_service), (0, 0))
+
+    def test_appointment_service_changes_move_ratings(self):
+        baker.make(Review, appointment=self.appointment, rating=9)
+
+        self.appointment.services.add(self.other_service)
+        self.assertEqual(self._aggregates(self.other_service), (9, 1))
+
+        self.appointment.services.remove(self.service)
+        self.appointment.services.remove(self.service)
+        self.assertEqual(self._aggregates(self.service), (0, 0))
+
+        self.other_service.appointments.clear()
+        self.assertEqual(self._aggregates(self.other_service), (0, 0))
+
+    def test_repair_command(self):
+        baker.make(Review, appointment=self.appointment, rating=7)
+        Service.objects.update(rating_sum=100, rating_count=100)
+
+        call_command('repair_service_ratings', stdout=io.StringIO())
+
+        self.assertEqual(self._aggregates(self.service), (7, 1))
+        self.assertEqual(self._aggregates(self.other_service), (0, 0))
+
+    def test_serializer_reads_aggregates_without_queries(self):
+        baker.make(Review, appointment=self.appointment, rating=5)
+        service = Service.objects.get(pk=self.service.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ServiceSerializer().get_rating_avg(service), 5)
+
+
+class AppointmentScheduleIndexTests(TestCase):
+
+    def setUp(self):
+        if connection.vendor not in ('postgresql', 'sqlite') or not connection.features.supports_explaining_query_execution:
+            self.skipTest('Banco sem suporte a EXPLAIN')
+
+        self.provider = baker.make("authentication.User")
+        service = baker.make(Service, duration=60)
+        for day in range(1, 11):
+            appointment = baker.make(
+                Appointment,
+                appointment_date=datetime(2025, 1, day, 10, tzinfo=dt_timezone.utc),
+                provider=self.provider,
+            )
+            appointment.services.add(service)
+
+    def _explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Com poucas linhas o planejador prefere a leitura sequencial; o teste verifica se o índice é utilizável
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_availability_lookup_uses_schedule_index(self):
+        start = datetime(2025, 1, 5, 10, tzinfo=dt_timezone.utc)
+        queryset = Appointment.with_end_time(Appointment.scheduled([self.provider.id])).filter(
+            appointment_date__lt=start + timedelta(hours=1),
+            end_time__gte=start
+        )
+
+        self.assertIn('appointment_schedule_idx', self._explain(queryset))
+
+    def test_provider_schedule_uses_schedule_index(self):
+        queryset = Appointment.scheduled([self.provider.id]).filter(
+            appointment_date__gte=datetime(2025, 1, 1, tzinfo=dt_timezone.utc),
+            appointment_date__lt=datetime(2025, 2, 1, tzinfo=dt_timezone.utc)
+        )
+
+        self.assertIn('appointment_schedule_idx', self._explain(queryset))
+
+
+class AppointmentCreateTransactionTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('appointment-list')
+
+        feature, _ = Feature.objects.get_or_create(name="appointment.create_appointment")
+        self.role = Role.objects.create(name="provider", role_type="provider")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.service = baker.make(Service, duration=60)
+        template = baker.make(DocumentTemplate, document=baker.make(Document, file_name="modelo.pdf"), file_types="pdf")
+        self.requirement = baker.make(ServiceDocumentRequirement, service=self.service, document_template=template)
+
+    def _data(self, extra_count, day=2):
+        data = {
+            "appointment_date": f"2024-12-{day:02d}T10:00:00Z",
+            "client": str(self.user.id),
+            "provider": str(self.user.id),
+            "services": [self.service.id],
+            f"document_requirement_{self.requirement.id}": SimpleUploadedFile("rg.pdf", b"rg", content_type="application/pdf"),
+        }
+        for index in range(extra_count):
+            data[f"extra_document_{index}"] = SimpleUploadedFile(f"extra_{index}.pdf", b"extra", content_type="application/pdf")
+        return data
+
+    def _writes(self, queries, table):
+        return [
+            query['sql'] for query in queries
+            if table in query['sql'] and not query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+
+    def test_documents_and_links_are_inserted_in_bulk(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, self._data(3), format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        queries = context.captured_queries
+        self.assertEqual(len(self._writes(queries, Document._meta.db_table + '"')), 1)
+        self.assertEqual(len(self._writes(queries, Appointment.documents.through._meta.db_table)), 1)
+        self.assertEqual(len(self._writes(queries, Appointment.extra_documents.through._meta.db_table)), 1)
+
+        appointment = Appointment.objects.get(id=response.data['id'])
+        self.assertEqual(appointment.documents.get().read_content(), b"rg")
+        self.assertEqual(DocumentBlob.objects.get(pk=appointment.documents.get().content_hash).ref_count, 1)
+        # Os três extras têm o mesmo conteúdo: um único blob com três referências
+        extra_hashes = set(appointment.extra_documents.values_list('content_hash', flat=True))
+        self.assertEqual(len(extra_hashes), 1)
+        self.assertEqual(DocumentBlob.objects.get(pk=extra_hashes.pop()).ref_count, 3)
+
+    def _create_queries(self, extra_count, day):
+        """Consultas feitas pelo create; as do upload (registro dos blobs enviados) acontecem antes"""
+        create = AppointmentSerializer.create
+        captured = []
+
+        def capture(serializer, validated_data):
+            with CaptureQueriesContext(connection) as context:
+                appointment = create(serializer, validated_data)
+            captured.extend(context.captured_queries)
+            return appointment
+
+        with mock.patch.object(AppointmentSerializer, 'create', capture):
+            response = self.client.post(self.url, self._data(extra_count, day), format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(captured)
+
+    def test_query_count_does_not_grow_with_documents(self):
+        self.assertEqual(self._create_queries(1, day=2), self._create_queries(4, day=3))
+
+    def test_failure_rolls_back_appointment_and_documents(self):
+        with mock.patch.object(AppointmentSerializer, '_link_documents', side_effect=RuntimeError('falha')):
+            response = self.client.post(self.url, self._data(2), format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(Document.objects.filter(file_name__in=["rg.pdf", "extra_0.pdf", "extra_1.pdf"]).exists())
+        self.assertFalse(DocumentBlob.objects.filter(ref_count__gt=0).exists())
+
+
+class AppointmentUpdateTransactionTests(APITestCase):
+
+    def setUp(self):
+        feature, _ = Feature.objects.get_or_create(name="appointment.partial_update_appointment")
+        self.role = Role.objects.create(name="provider", role_type="provider")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.service = baker.make(Service, duration=60)
+        template = baker.make(DocumentTemplate, document=baker.make(Document, file_name="modelo.pdf"), file_types="pdf")
+        self.requirement = baker.make(ServiceDocumentRequirement, service=self.service, document_template=template)
+
+        self.appointment = baker.make(
+            Appointment,
+            appointment_date="2024-12-02T10:00:00Z",
+            client=self.user,
+            provider=self.user,
+        )
+        self.appointment.services.add(self.service)
+        self.document = Document(file_name="rg.pdf", file_type="pdf", document_type="start")
+        self.document.set_content(b"documento anterior")
+        self.document.save()
+        self.appointment.documents.add(self.document)
+
+        self.url = reverse('appointment-detail', args=[self.appointment.id])
+
+    def _data(self, **files):
+        return {
+            "appointment_date": "2024-12-02T10:00:00Z",
+            "client": str(self.user.id),
+            "provider": str(self.user.id),
+            "services": self.service.id,
+            **files,
+        }
+
+    def _assert_previous_document_kept(self):
+        self.document.refresh_from_db()
+        self.assertIsNone(self.document.deleted_at)
+        self.assertEqual(self.document.read_content(), b"documento anterior")
+        self.assertEqual(DocumentBlob.objects.get(pk=self.document.content_hash).ref_count, 1)
+
+    def test_rejected_file_keeps_previous_document(self):
+        data = self._data(**{
+            f"document_requirement_{self.requirement.id}": SimpleUploadedFile("rg.png", b"imagem", content_type="image/png"),
+        })
+
+        # Executa os on_commit como em autocommit, onde a remoção do blob aconteceria na hora
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, data, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Tipo de arquivo inválido", str(response.data))
+        self._assert_previous_document_kept()
+
+    def test_failure_after_replacing_documents_is_rolled_back(self):
+        data = self._data(**{
+            f"document_requirement_{self.requirement.id}": SimpleUploadedFile("novo.pdf", b"novo", content_type="application/pdf"),
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(DocumentBlobService, 'bulk_create', side_effect=RuntimeError('falha')):
+                response = self.client.patch(self.url, data, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self._assert_previous_document_kept()
+        self.assertFalse(self.appointment.documents.filter(file_name="novo.pdf").exists())
+
+    def test_update_restores_and_creates_documents_in_bulk(self):
+        data = self._data(**{
+            f"document_requirement_{self.requirement.id}": SimpleUploadedFile("rg.pdf", b"rg novo", content_type="application/pdf"),
+            "extra_document_1": SimpleUploadedFile("extra_1.pdf", b"extra 1", content_type="application/pdf"),
+            "extra_document_2": SimpleUploadedFile("extra_2.pdf", b"extra 2", content_type="application/pdf"),
+        })
+        previous_hash = self.document.content_hash
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        inserts = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(f'INSERT INTO "{Document._meta.db_table}"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        # O documento de mesmo nome é reativado com o novo conteúdo
+        document = self.appointment.documents.alive().get()
+        self.assertEqual(document.pk, self.document.pk)
+        self.assertEqual(document.read_content(), b"rg novo")
+        self.assertEqual(DocumentBlob.objects.get(pk=document.content_hash).ref_count, 1)
+        self.assertEqual(DocumentBlob.objects.get(pk=previous_hash).ref_count, 0)
+        self.assertEqual(
+            sorted(self.appointment.extra_documents.alive().values_list('file_name', flat=True)),
+            ["extra_1.pdf", "extra_2.pdf"]
+        )
@@ -1,10 +1,13 @@
-from django.utils import timezone
 from rest_framework import serializers
-from appointment.models.appointment import Appointment
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from appointment.services import ProviderScheduleService
 from authentication.models import User
 from core.api.serializers import FeatureSerializer, RoleSerializer
 from core.models.role import Role
 from core.api.serializers import ProfileSerializer
+from core.models.jwt import set_permission_claims
 
 class UserSerializer(serializers.ModelSerializer):
     role = serializers.PrimaryKeyRelatedField(queryset=Role.objects.all())
@@ -91,16 +94,25 @@ class ProviderScheduleSerializer(SimpleUserSerializer):
         fields = SimpleUserSerializer.Meta.fields + ['appointments']
 
     def get_appointments(self, obj):
-        appointments = Appointment.objects.filter(
-            provider=obj,
-            deleted_at__isnull=True,
-            status__in=[Appointment.Status.PENDING, Appointment.Status.IN_PROGRESS],
-            appointment_date__gte=timezone.now()  # Apenas futuros
-        ).order_by('appointment_date')
+        # A view carrega as agendas de todos os prestadores de uma vez e as repassa no contexto
+        schedules = self.context.get('schedules')
+        if schedules is None:
+            start, end = ProviderScheduleService.get_window()
+            schedules = ProviderScheduleService.get_schedules([obj.pk], start, end)
+        return schedules.get(obj.pk, [])
 
-        return [{
-            'id': app.id,
-            'start': app.appointment_date,
-            'end': app.appointment_date + timezone.timedelta(minutes=app.services.first().duration if app.services.exists() else 0),
-            'service': app.services.first().name if app.services.exists() else None,
-        } for app in appointments]
\ No newline at end of file
+
+class PermissionClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh que recalcula as claims de permissão: as do refresh token são as do login
+    e, depois de qualquer mudança de permissões, seriam recusadas pelo modo stateless
+    """
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        for name, token_class in (('access', AccessToken), ('refresh', RefreshToken)):
+            if name in data:
+                token = token_class(data[name])
+                set_permission_claims(token, token[jwt_settings.USER_ID_CLAIM])
+                data[name] = str(token)
+        return data
@@ -3,10 +3,13 @@ from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from authentication.api.serializers import ProviderScheduleSerializer, SimpleUserSerializer, UserSerializer
+from appointment.services import AvailabilityService, ProviderScheduleService
+from authentication.api.serializers import (
+    PermissionClaimsTokenRefreshSerializer, ProviderScheduleSerializer, SimpleUserSerializer, UserSerializer
+)
 from authentication.services import EmailService, UserService
+from core.models.jwt import get_tokens_for_user
 from core.models.mixins import DynamicViewPermissions
 from authentication.models import User
 from core.models.role import Role
@@ -24,8 +27,27 @@ class UserViewSet(ViewSet):
 
     @action(detail=False, methods=['get'])
     def providers(self, request):
+        """
+        Lista os prestadores com seus agendamentos ativos na janela from/to
+        (padrão: de agora até 31 dias à frente), opcionalmente filtrando por provider
+        """
+        params = request.query_params
+        try:
+            start, end = ProviderScheduleService.get_window(
+                AvailabilityService.parse_datetime_param(params['from'], 'from') if params.get('from') else None,
+                AvailabilityService.parse_datetime_param(params['to'], 'to') if params.get('to') else None
+            )
+            provider_ids = ProviderScheduleService.parse_provider_ids(params.getlist('provider'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         users = User.objects.filter(role__role_type=Role.RoleType.PROVIDER)
-        serializer = ProviderScheduleSerializer(users, many=True)
+        if provider_ids:
+            users = users.filter(id__in=provider_ids)
+        users = list(users)
+
+        schedules = ProviderScheduleService.get_schedules([user.pk for user in users], start, end)
+        serializer = ProviderScheduleSerializer(users, many=True, context={'schedules': schedules})
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -36,7 +58,7 @@ class UserViewSet(ViewSet):
 
     @action(detail=True, methods=['put'], url_path='update-user')
     def update_user_profile(self, request, pk=None):
-        user = get_object_or_404(User.objects.select_related('profile'), id=pk, deleted_at__isnull=True)
+        user = get_object_or_404(User.objects.alive().select_related('profile'), id=pk)
         try:
             user = UserService.update_user(user, request.data)
             serializer = UserSerializer(user)
@@ -61,7 +83,7 @@ class AuthenticationView(ViewSet):
         try:
             user = User.objects.get(email=email)
             if user.check_password(password):
-                refresh = RefreshToken.for_user(user)
+                refresh = get_tokens_for_user(user)
                 serializer = UserSerializer(user)
                 return Response({
                     'user': serializer.data,
@@ -113,4 +135,4 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     pass
 
 class CustomTokenRefreshView(TokenRefreshView):
-    pass
\ No newline at end of file
+    serializer_class = PermissionClaimsTokenRefreshSerializer
\ No newline at end of file
@@ -5,6 +5,7 @@ from core.models.profile import Profile
 from core.models.feature import Feature
 from core.models.role import Role
 from core.models.mixins import TimeStampedModel
+from core.permissions.permission_cache import permission_cache
 
 class User(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -35,5 +36,4 @@ class User(TimeStampedModel):
         return check_password(raw_password, self.password)
 
     def has_permission(self, permission_name):
-        return self.features.filter(name=permission_name).exists() or \
-               (self.role and self.role.features.filter(name=permission_name).exists())
\ No newline at end of file
+        return permission_cache.has_permission(self.pk, permission_name)
\ No newline at end of file
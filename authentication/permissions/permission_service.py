@@ -3,15 +3,12 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.backends import BaseBackend
 from authentication.models.user import User
 from core.models import Feature
+from core.permissions.permission_cache import permission_cache
 
 class PermissionService:
     @staticmethod
     def has_permission(user: User, feature_name: str) -> bool:
-        try:
-            feature = Feature.objects.get(name=feature_name)
-            return user.role.features.filter(id=feature.id).exists() or user.features.filter(id=feature.id).exists()
-        except ObjectDoesNotExist:
-            return False
+        return permission_cache.has_permission(user.pk, feature_name)
 
     @staticmethod
     def assign_feature_to_user(user: User, feature_name: str) -> bool:
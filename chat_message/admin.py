@@ -1,5 +1,5 @@
 from django.contrib import admin
-from chat_message.models import Message, Chat
+from chat_message.models import ChatReadState, Message, Chat
 
 
 @admin.register(Chat)
@@ -22,3 +22,10 @@ class MessageAdmin(admin.ModelAdmin):
     def content_snippet(self, obj):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
     content_snippet.short_description = 'Message Preview'
+
+
+@admin.register(ChatReadState)
+class ChatReadStateAdmin(admin.ModelAdmin):
+    list_display = ('id', 'chat', 'user', 'last_read_message', 'updated_at')
+    search_fields = ('chat__id', 'user__name')
+    list_select_related = ('user',)
@@ -1,14 +1,50 @@
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from authentication.models.user import User
 from chat_message.api.serializers import ChatUserSerializer
 from chat_message.models import Chat, Message
+from chat_message.services import ChatInboxService, ChatStreamService, MessageFeedService
 from core.models.mixins import DynamicPermissionModelViewSet
 from authentication.api.serializers import SimpleUserSerializer
 from core.models.mixins import DynamicViewPermissions
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Permite negociar text/event-stream; o corpo do stream é montado pela própria view."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Respostas de erro continuam sendo enviadas como JSON
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class ChatStreamTokenAuthentication(BaseAuthentication):
+    """Autentica a abertura do stream pelo token de ?token=, emitido por stream_token."""
+
+    def authenticate(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            return None
+
+        try:
+            user_id = ChatStreamService.read_token(token)
+        except ValueError as e:
+            raise AuthenticationFailed(str(e))
+
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            raise AuthenticationFailed('Usuário não encontrado')
+        return (user, None)
+
 
 class ChatMessageView(DynamicPermissionModelViewSet):
     permission_classes = [DynamicViewPermissions]
@@ -17,39 +53,30 @@ class ChatMessageView(DynamicPermissionModelViewSet):
     @action(detail=False, methods=["get"])
     def list_user_chats(self, request):
         user = request.user
-        chats = Chat.objects.filter(participants=user)
+        try:
+            limit = MessageFeedService.parse_limit(request.query_params.get("limit"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        chats = list(Chat.objects.filter(participants=user.pk).prefetch_related(
+            Prefetch(
+                'participants',
+                queryset=User.objects.exclude(id=user.pk).select_related('profile'),
+                to_attr='other_participants'
+            )
+        ))
+        # Apenas as mensagens mais recentes de cada chat; o restante é paginado em list_messages
+        pages = MessageFeedService.get_latest_pages([chat.id for chat in chats], limit=limit)
 
         chat_data = []
         for chat in chats:
-            messages = chat.messages.order_by("timestamp")
-
-            my_messages = []
-            other_messages = []
-
-            for message in messages:
-                if message.sender == user:
-                    my_messages.append({
-                        "id": message.id,
-                        "content": message.content,
-                        "timestamp": message.timestamp,
-                    })
-                else:
-                    other_messages.append({
-                        "id": message.id,
-                        "sender_name": message.sender.name,
-                        "content": message.content,
-                        "timestamp": message.timestamp,
-                    })
-
-            participants = chat.participants.exclude(id=user.id)
-            serialized_participants = ChatUserSerializer(participants, many=True).data
-
+            messages, has_more = pages[chat.id]
             chat_data.append({
                 "chat_id": chat.id,
-                "participants": serialized_participants,
+                "participants": ChatUserSerializer(chat.other_participants, many=True).data,
                 "created_at": chat.created_at,
-                "my_messages": my_messages,
-                "other_messages": other_messages,
+                **MessageFeedService.split_messages(messages, user),
+                "has_more": has_more,
             })
 
         return Response(chat_data)
@@ -74,36 +101,37 @@ class ChatMessageView(DynamicPermissionModelViewSet):
 
         return Response({
             "chat_id": chat.id,
-            "participants": ChatUserSerializer(chat.participants.all(), many=True).data,
+            "participants": ChatUserSerializer(chat.participants.select_related('profile'), many=True).data,
         })
 
 
     @action(detail=True, methods=["get"])
     def list_messages(self, request, pk=None):
+        """
+        Lista as mensagens do chat em páginas de até limit mensagens.
+        Aceita os cursores before/after (id de mensagem) e since (id de mensagem ou data ISO)
+        para buscar apenas as mensagens novas.
+        """
         user = request.user
-        messages = Message.objects.filter(chat__id=pk).order_by("timestamp")
-
-        my_messages = []
-        other_messages = []
-
-        for message in messages:
-            if message.sender == user:
-                my_messages.append({
-                    "id": message.id,
-                    "content": message.content,
-                    "timestamp": message.timestamp,
-                })
-            else:
-                other_messages.append({
-                    "id": message.id,
-                    "sender_name": message.sender.name,
-                    "content": message.content,
-                    "timestamp": message.timestamp,
-                })
+        params = request.query_params
+
+        try:
+            limit = MessageFeedService.parse_limit(params.get("limit"))
+            messages, has_more = MessageFeedService.get_page(
+                pk,
+                before=params.get("before"),
+                after=params.get("after"),
+                since=params.get("since"),
+                limit=limit
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
         return Response({
-            "my_messages": my_messages,
-            "other_messages": other_messages,
+            **MessageFeedService.split_messages(messages, user),
+            "has_more": has_more,
+            "oldest_id": messages[0]["id"] if messages else None,
+            "newest_id": messages[-1]["id"] if messages else None,
         })
 
 
@@ -118,14 +146,104 @@ class ChatMessageView(DynamicPermissionModelViewSet):
         chat = get_object_or_404(Chat, id=chat_id)
         sender = request.user
 
-        if sender not in chat.participants.all():
+        if not chat.participants.filter(id=sender.id).exists():
             return Response({"error": "Você não faz parte deste chat."}, status=403)
 
         message = Message.objects.create(
             chat=chat, sender=sender, content=content)
+        ChatInboxService.register_message(message)
+        ChatStreamService.publish_message(message, sender.name)
 
         return Response({
             "message_id": message.id,
             "content": message.content,
             "timestamp": message.timestamp,
         })
+
+
+    @action(detail=False, methods=["get"])
+    def inbox(self, request):
+        """
+        Resumo dos chats do usuário: participantes, última mensagem
+        e quantidade de mensagens não lidas
+        """
+        chats = ChatInboxService.get_inbox(request.user)
+
+        inbox = []
+        for chat in chats:
+            last_message = chat.last_message
+            inbox.append({
+                "chat_id": chat.id,
+                "participants": ChatUserSerializer(chat.other_participants, many=True).data,
+                "created_at": chat.created_at,
+                "last_message": {
+                    "id": last_message.id,
+                    "sender_id": last_message.sender_id,
+                    "sender_name": last_message.sender.name,
+                    "content": last_message.content,
+                    "timestamp": last_message.timestamp,
+                } if last_message else None,
+                "unread_count": chat.unread_count,
+            })
+
+        return Response(inbox)
+
+
+    @action(detail=True, methods=["post"])
+    def mark_as_read(self, request, pk=None):
+        chat = get_object_or_404(Chat, id=pk)
+
+        if not chat.participants.filter(id=request.user.id).exists():
+            return Response({"error": "Você não faz parte deste chat."}, status=403)
+
+        try:
+            message_id = ChatInboxService.mark_as_read(chat.id, request.user, request.data.get("message_id"))
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "chat_id": chat.id,
+            "last_read_message_id": message_id,
+        })
+
+
+    @action(detail=False, methods=["post"])
+    def stream_token(self, request):
+        """
+        Token para abrir o stream com EventSource (GET stream/?token=...), válido por
+        CHAT_STREAM_TOKEN_LIFETIME segundos. Quando o token expira, a reconexão automática
+        do EventSource recebe 401: o cliente pede um novo token e reabre o stream com
+        ?last_event_id= do último evento recebido.
+        """
+        return Response({
+            "token": ChatStreamService.issue_token(request.user.id),
+            "expires_in": getattr(settings, 'CHAT_STREAM_TOKEN_LIFETIME', 60),
+        })
+
+
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[JSONRenderer, EventStreamRenderer],
+        authentication_classes=[ChatStreamTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    def stream(self, request):
+        """
+        Stream (Server-Sent Events) das novas mensagens dos chats do usuário.
+        Ao reconectar, o cabeçalho Last-Event-ID (ou ?last_event_id=) reenvia o que foi perdido.
+        Aceita o cabeçalho Authorization ou o token de stream_token em ?token=.
+        """
+        last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return Response({"error": "Last-Event-ID inválido."}, status=400)
+
+        response = StreamingHttpResponse(
+            ChatStreamService.stream(request.user.id, last_event_id),
+            content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Evita que proxies (nginx) acumulem o stream em buffer
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -0,0 +1,181 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Fila de eventos de um usuário conectado ao stream"""
+
+    def __init__(self, broker: 'InProcessBroker', user_id: str, maxsize: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, event: Dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Cliente lento: descarta o evento; ele é recuperado via Last-Event-ID ao reconectar
+            pass
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Pub/sub em memória: entrega os eventos aos assinantes deste processo.
+    Suficiente para um único processo (e para os testes).
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, user_id) -> Subscription:
+        subscription = Subscription(self, str(user_id), self.queue_size)
+        with self._lock:
+            self._subscriptions[subscription.user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def has_subscribers(self, user_ids: Iterable) -> bool:
+        with self._lock:
+            return any(str(user_id) in self._subscriptions for user_id in user_ids)
+
+    def deliver(self, user_ids: Iterable, event: Dict) -> None:
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(str(user_id), ())
+            ]
+        for subscription in targets:
+            subscription.put(event)
+
+    def publish(self, user_ids: Iterable, event: Dict) -> None:
+        self.deliver(user_ids, event)
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """
+    Pub/sub entre processos via LISTEN/NOTIFY do PostgreSQL.
+
+    publish envia um NOTIFY; cada processo com assinantes mantém uma conexão
+    dedicada em LISTEN e repassa os eventos aos assinantes locais. Eventos maiores
+    que o limite do NOTIFY levam apenas o id da mensagem, carregada pelo ouvinte.
+    """
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, channel: str = 'chat_messages', using: str = 'default',
+                 loader: Optional[str] = 'chat_message.services.ChatStreamService.load_event', **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.using = using
+        self.loader: Optional[Callable[[int], Optional[Dict]]] = import_string(loader) if loader else None
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, user_ids: Iterable, event: Dict) -> None:
+        users = [str(user_id) for user_id in user_ids]
+        payload = json.dumps({'users': users, 'event': event}, cls=DjangoJSONEncoder)
+        if len(payload.encode()) > self.MAX_PAYLOAD:
+            payload = json.dumps({'users': users, 'message_id': event['id']})
+
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def subscribe(self, user_id) -> Subscription:
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def _ensure_listener(self) -> None:
+        with self._listener_lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen_forever, name='chat-broker-listener', daemon=True)
+            self._listener.start()
+
+    def _listen_forever(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception('Falha na conexão LISTEN do chat; reconectando')
+                time.sleep(1)
+
+    def _listen(self) -> None:
+        import psycopg2
+        from psycopg2 import sql
+
+        params = connections[self.using].get_connection_params()
+        connection = psycopg2.connect(**params)
+        try:
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.channel)))
+
+            while True:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self._dispatch(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def _dispatch(self, payload: str) -> None:
+        data = json.loads(payload)
+        users = data['users']
+        if not self.has_subscribers(users):
+            return
+
+        event = data.get('event')
+        if event is None and self.loader:
+            event = self.loader(data['message_id'])
+        if event is not None:
+            self.deliver(users, event)
+
+
+@lru_cache(maxsize=None)
+def get_chat_broker() -> InProcessBroker:
+    """Instancia o backend configurado em settings.CHAT_BROKER"""
+    config = getattr(settings, 'CHAT_BROKER', {})
+    backend = import_string(config.get('BACKEND', 'chat_message.broker.InProcessBroker'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+def _reset_chat_broker(setting, **kwargs):
+    if setting == 'CHAT_BROKER':
+        get_chat_broker.cache_clear()
+
+
+setting_changed.connect(_reset_chat_broker)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_message', '0002_alter_message_chat_alter_message_sender'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_timestamp_idx'),
+        ),
+    ]
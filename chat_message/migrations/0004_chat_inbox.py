@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_user_password_reset_token'),
+        ('chat_message', '0003_message_chat_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat_message.message'),
+        ),
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat_message.chat')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat_message.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_states', to='authentication.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chatreadstate',
+            constraint=models.UniqueConstraint(fields=('chat', 'user'), name='unique_chat_read_state'),
+        ),
+    ]
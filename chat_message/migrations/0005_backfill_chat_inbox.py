@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_chat_inbox(apps, schema_editor):
+    Chat = apps.get_model('chat_message', 'Chat')
+    ChatReadState = apps.get_model('chat_message', 'ChatReadState')
+    Message = apps.get_model('chat_message', 'Message')
+
+    Chat.objects.update(last_message=Subquery(
+        Message.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-id').values('id')[:1]
+    ))
+
+    # O histórico existente é considerado lido, para não aparecer todo como não lido
+    Participant = Chat.participants.through
+    ChatReadState.objects.bulk_create([
+        ChatReadState(chat_id=chat_id, user_id=user_id, last_read_message_id=last_message_id)
+        for chat_id, user_id, last_message_id in Participant.objects.values_list(
+            'chat_id', 'user_id', 'chat__last_message_id'
+        ).iterator()
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_message', '0004_chat_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_chat_inbox, migrations.RunPython.noop),
+    ]
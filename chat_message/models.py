@@ -6,6 +6,9 @@ from authentication.models.user import User
 class Chat(models.Model):
     participants = models.ManyToManyField(User, related_name="chats")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Desnormalizado: atualizado em send_message para montar a caixa de entrada sem varrer o histórico
+    last_message = models.ForeignKey(
+        "Message", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
 
     def __str__(self):
         return f"Chat between: {', '.join([user.name for user in self.participants.all()])}"
@@ -18,5 +21,29 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Leitura de uma página do chat como varredura de intervalo no índice
+            models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender.name} at {self.timestamp}"
+
+
+class ChatReadState(models.Model):
+    chat = models.ForeignKey(
+        Chat, on_delete=models.CASCADE, related_name="read_states")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="chat_read_states")
+    last_read_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='unique_chat_read_state'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read chat {self.chat_id} up to {self.last_read_message_id}"
@@ -0,0 +1,331 @@
+import json
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from authentication.models.user import User
+from chat_message.broker import get_chat_broker
+from chat_message.models import Chat, ChatReadState, Message
+
+
+class MessageFeedService:
+    """Serviço para leitura paginada das mensagens de um chat, ordenadas por (timestamp, id)."""
+    DEFAULT_LIMIT = 50
+    MAX_LIMIT = 200
+    # Projeção usada nas páginas: o nome do remetente vem no mesmo SELECT
+    FIELDS = ('id', 'chat_id', 'sender_id', 'content', 'timestamp')
+
+    @staticmethod
+    def parse_limit(value: Optional[str]) -> int:
+        if value in (None, ''):
+            return MessageFeedService.DEFAULT_LIMIT
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('Parâmetro limit inválido')
+        if limit <= 0:
+            raise ValueError('Parâmetro limit deve ser positivo')
+        return min(limit, MessageFeedService.MAX_LIMIT)
+
+    @staticmethod
+    def get_cursor(chat_id, message_id, name: str) -> Tuple:
+        """Converte o id de uma mensagem do chat na chave (timestamp, id) usada na ordenação"""
+        try:
+            cursor = Message.objects.filter(chat_id=chat_id, id=int(message_id)).values_list('timestamp', 'id').first()
+        except (TypeError, ValueError):
+            cursor = None
+        if not cursor:
+            raise ValueError(f'Parâmetro {name} inválido: mensagem não encontrada neste chat')
+        return cursor
+
+    @staticmethod
+    def get_page(
+        chat_id,
+        before=None,
+        after=None,
+        since=None,
+        limit: int = DEFAULT_LIMIT
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Retorna até limit mensagens (FIELDS + sender_name) em ordem cronológica e se existem mais mensagens
+        na direção pedida.
+
+        - before: mensagens anteriores à mensagem informada (página mais antiga)
+        - after: mensagens posteriores à mensagem informada (próxima página)
+        - since: id de mensagem ou data ISO; mensagens novas desde esse ponto
+        - sem cursor: as mensagens mais recentes
+        """
+        messages = Message.objects.filter(chat_id=chat_id).values(
+            *MessageFeedService.FIELDS, sender_name=F('sender__name')
+        )
+        ascending = False
+
+        if since not in (None, ''):
+            if str(since).isdigit():
+                after = since
+            else:
+                since_date = parse_datetime(since)
+                if not since_date:
+                    raise ValueError('Parâmetro since inválido')
+                if timezone.is_naive(since_date):
+                    since_date = timezone.make_aware(since_date)
+                messages = messages.filter(timestamp__gt=since_date)
+                ascending = True
+
+        if before not in (None, ''):
+            timestamp, message_id = MessageFeedService.get_cursor(chat_id, before, 'before')
+            messages = messages.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+            )
+
+        if after not in (None, ''):
+            timestamp, message_id = MessageFeedService.get_cursor(chat_id, after, 'after')
+            messages = messages.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+            )
+            ascending = True
+
+        if ascending:
+            page = list(messages.order_by('timestamp', 'id')[:limit + 1])
+            return page[:limit], len(page) > limit
+
+        # Página mais recente (ou anterior a before): busca do fim e devolve em ordem cronológica
+        page = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+        return page[:limit][::-1], len(page) > limit
+
+    @staticmethod
+    def get_latest_pages(chat_ids: List, limit: int = DEFAULT_LIMIT) -> Dict[int, Tuple[List[Dict], bool]]:
+        """
+        Página mais recente de cada chat, em uma única consulta: numera as mensagens
+        de cada chat da mais nova para a mais antiga e mantém as limit + 1 primeiras.
+        """
+        rows = Message.objects.filter(chat_id__in=chat_ids).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('chat_id'),
+                order_by=[F('timestamp').desc(), F('id').desc()]
+            )
+        ).filter(
+            position__lte=limit + 1
+        ).values(
+            *MessageFeedService.FIELDS, 'position', sender_name=F('sender__name')
+        ).order_by('chat_id', '-position')
+
+        pages = {chat_id: ([], False) for chat_id in chat_ids}
+        for row in rows:
+            messages, has_more = pages[row['chat_id']]
+            if row.pop('position') > limit:
+                pages[row['chat_id']] = (messages, True)
+            else:
+                messages.append(row)
+        return pages
+
+    @staticmethod
+    def split_messages(messages: List[Dict], user) -> Dict[str, List[Dict]]:
+        """Separa as mensagens do usuário das mensagens dos demais participantes, sem consultar o remetente"""
+        my_messages = []
+        other_messages = []
+
+        for message in messages:
+            if message["sender_id"] == user.pk:
+                my_messages.append({
+                    "id": message["id"],
+                    "content": message["content"],
+                    "timestamp": message["timestamp"],
+                })
+            else:
+                other_messages.append({
+                    "id": message["id"],
+                    "sender_name": message["sender_name"],
+                    "content": message["content"],
+                    "timestamp": message["timestamp"],
+                })
+
+        return {
+            "my_messages": my_messages,
+            "other_messages": other_messages,
+        }
+
+
+class ChatInboxService:
+    """Serviço da caixa de entrada: última mensagem e contagem de não lidas por chat."""
+
+    @staticmethod
+    def get_inbox(user):
+        """
+        Chats do usuário com a última mensagem e o número de mensagens não lidas,
+        resolvidos em uma única consulta (mais uma para os participantes).
+        """
+        last_read = ChatReadState.objects.filter(
+            chat=OuterRef('chat'), user_id=user.pk
+        ).values('last_read_message_id')[:1]
+
+        unread = Message.objects.filter(
+            chat=OuterRef('pk')
+        ).exclude(
+            sender_id=user.pk
+        ).filter(
+            id__gt=Coalesce(Subquery(last_read), Value(0))
+        ).order_by().values('chat').annotate(total=Count('id')).values('total')
+
+        return Chat.objects.filter(
+            participants=user.pk
+        ).select_related(
+            'last_message__sender'
+        ).annotate(
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0))
+        ).prefetch_related(
+            Prefetch(
+                'participants',
+                queryset=User.objects.exclude(id=user.pk).select_related('profile'),
+                to_attr='other_participants'
+            )
+        ).order_by(F('last_message__timestamp').desc(nulls_last=True), '-created_at')
+
+    @staticmethod
+    def register_message(message: Message) -> None:
+        """Aponta o chat para a nova mensagem e a marca como lida para quem enviou"""
+        with transaction.atomic():
+            # Só avança: com commits fora de ordem, a mensagem mais antiga não sobrescreve a mais nova
+            Chat.objects.filter(pk=message.chat_id).filter(
+                Q(last_message__isnull=True) | Q(last_message_id__lt=message.id)
+            ).update(last_message=message)
+            ChatInboxService.mark_as_read(message.chat_id, message.sender, message.id)
+
+    @staticmethod
+    def mark_as_read(chat_id, user, message_id=None) -> Optional[int]:
+        """
+        Avança a posição de leitura do usuário no chat até message_id
+        (ou até a última mensagem). Nunca retrocede.
+        """
+        if message_id is None:
+            message_id = Chat.objects.filter(pk=chat_id).values_list('last_message_id', flat=True).first()
+        else:
+            message_id = int(message_id)
+            if not Message.objects.filter(chat_id=chat_id, id=message_id).exists():
+                raise ValueError('Mensagem não encontrada neste chat')
+
+        if message_id is None:
+            return None
+
+        state, created = ChatReadState.objects.get_or_create(
+            chat_id=chat_id, user_id=user.pk,
+            defaults={'last_read_message_id': message_id}
+        )
+        if not created:
+            ChatReadState.objects.filter(pk=state.pk).filter(
+                Q(last_read_message__isnull=True) | Q(last_read_message_id__lt=message_id)
+            ).update(last_read_message_id=message_id, updated_at=timezone.now())
+        return message_id
+
+
+class ChatStreamService:
+    """Serviço do stream de novas mensagens via Server-Sent Events."""
+    REPLAY_LIMIT = 200
+    TOKEN_SALT = 'chat_message.stream'
+
+    @staticmethod
+    def issue_token(user_id) -> str:
+        """
+        Token assinado e de curta duração que autentica apenas a abertura do stream:
+        o EventSource do navegador não envia o cabeçalho Authorization
+        """
+        return signing.dumps(str(user_id), salt=ChatStreamService.TOKEN_SALT)
+
+    @staticmethod
+    def read_token(token: str) -> str:
+        """Retorna o id do usuário do token; lança ValueError se ele for inválido ou tiver expirado"""
+        try:
+            return signing.loads(
+                token,
+                salt=ChatStreamService.TOKEN_SALT,
+                max_age=getattr(settings, 'CHAT_STREAM_TOKEN_LIFETIME', 60)
+            )
+        except signing.BadSignature:
+            raise ValueError('Token do stream inválido ou expirado')
+
+    @staticmethod
+    def build_event(message: Message, sender_name: str) -> Dict:
+        return {
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "sender_id": message.sender_id,
+            "sender_name": sender_name,
+            "content": message.content,
+            "timestamp": message.timestamp,
+        }
+
+    @staticmethod
+    def load_event(message_id) -> Optional[Dict]:
+        message = Message.objects.select_related('sender').filter(id=message_id).first()
+        return ChatStreamService.build_event(message, message.sender.name) if message else None
+
+    @staticmethod
+    def publish_message(message: Message, sender_name: str) -> None:
+        """Envia a mensagem aos participantes conectados depois do commit"""
+        user_ids = list(
+            Chat.participants.through.objects.filter(chat_id=message.chat_id).values_list('user_id', flat=True)
+        )
+        event = ChatStreamService.build_event(message, sender_name)
+        transaction.on_commit(lambda: get_chat_broker().publish(user_ids, event))
+
+    @staticmethod
+    def get_missed_events(user_id, last_event_id: int) -> List[Dict]:
+        """Mensagens criadas após last_event_id nos chats do usuário, para quem reconectou"""
+        messages = Message.objects.filter(
+            chat__participants=user_id, id__gt=last_event_id
+        ).select_related('sender').order_by('id')[:ChatStreamService.REPLAY_LIMIT]
+        return [ChatStreamService.build_event(message, message.sender.name) for message in messages]
+
+    @staticmethod
+    def format_event(event: Dict) -> str:
+        data = json.dumps(event, cls=DjangoJSONEncoder)
+        return f"id: {event['id']}\nevent: message\ndata: {data}\n\n"
+
+    @staticmethod
+    def stream(user_id, last_event_id: Optional[int] = None) -> Iterator[str]:
+        """
+        Gera o stream SSE do usuário. A conexão é encerrada após CHAT_STREAM_MAX_DURATION
+        segundos; o cliente reconecta com Last-Event-ID e recebe o que perdeu.
+
+        Enquanto isso o gerador ocupa a thread que atende a requisição, por isso o stream
+        exige workers em threads ou um servidor ASGI; a conexão com o banco é devolvida
+        logo após o reenvio das mensagens perdidas.
+        """
+        heartbeat = getattr(settings, 'CHAT_STREAM_HEARTBEAT', 15)
+        max_duration = getattr(settings, 'CHAT_STREAM_MAX_DURATION', 300)
+
+        # Assina antes de buscar as mensagens perdidas para não haver lacuna entre as duas
+        subscription = get_chat_broker().subscribe(user_id)
+        try:
+            yield f"retry: {int(heartbeat * 1000)}\n\n"
+
+            last_sent = last_event_id or 0
+            if last_event_id is not None:
+                for event in ChatStreamService.get_missed_events(user_id, last_event_id):
+                    last_sent = event['id']
+                    yield ChatStreamService.format_event(event)
+
+            # Daqui em diante só o broker é usado: a conexão com o banco não fica presa
+            # durante a espera (dentro de uma transação, como nos testes, ela é mantida)
+            if not connection.in_atomic_block:
+                connection.close()
+
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event['id'] <= last_sent:
+                    continue
+                last_sent = event['id']
+                yield ChatStreamService.format_event(event)
+        finally:
+            subscription.close()
@@ -0,0 +1,322 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import User
+from chat_message.broker import get_chat_broker
+from chat_message.models import Chat, Message
+from chat_message.services import ChatInboxService, ChatStreamService
+from core.models.feature import Feature
+from core.models.role import Role
+
+
+class ChatTestMixin:
+
+    def setUp(self):
+        role = Role.objects.create(role_type='client')
+        for name in ('list_messages_chatmessageview', 'list_user_chats_chatmessageview', 'send_message_chatmessageview'):
+            role.features.add(Feature.objects.get_or_create(name=name)[0])
+
+        self.user = baker.make(User, role=role, name='Ana')
+        self.other = baker.make(User, role=role, name='Bruno')
+        self.client.force_authenticate(user=self.user)
+
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.user, self.other)
+
+    def _create_messages(self, count):
+        return [
+            Message.objects.create(
+                chat=self.chat,
+                sender=self.user if i % 2 == 0 else self.other,
+                content=f'mensagem {i}'
+            )
+            for i in range(count)
+        ]
+
+
+class MessageFeedTests(ChatTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.messages = self._create_messages(10)
+        self.url = reverse('chat-list-messages', args=[self.chat.id])
+
+    def _ids(self, response):
+        return sorted(
+            [m['id'] for m in response.data['my_messages']] +
+            [m['id'] for m in response.data['other_messages']]
+        )
+
+    def test_default_page_returns_latest_messages(self):
+        response = self.client.get(self.url, {'limit': 4})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._ids(response), [m.id for m in self.messages[-4:]])
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(response.data['oldest_id'], self.messages[-4].id)
+        self.assertEqual(response.data['newest_id'], self.messages[-1].id)
+
+    def test_before_cursor_walks_history_without_overlap(self):
+        seen = []
+        params = {'limit': 3}
+        while True:
+            response = self.client.get(self.url, params)
+            seen.extend(self._ids(response))
+            if not response.data['has_more']:
+                break
+            params = {'limit': 3, 'before': response.data['oldest_id']}
+
+        self.assertEqual(sorted(seen), [m.id for m in self.messages])
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_after_and_since_return_only_new_messages(self):
+        response = self.client.get(self.url, {'after': self.messages[6].id})
+        self.assertEqual(self._ids(response), [m.id for m in self.messages[7:]])
+        self.assertFalse(response.data['has_more'])
+
+        response = self.client.get(self.url, {'since': self.messages[8].id})
+        self.assertEqual(self._ids(response), [self.messages[9].id])
+
+        since = (self.messages[-1].timestamp - timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {'since': since, 'limit': 2})
+        self.assertEqual(self._ids(response), [m.id for m in self.messages[:2]])
+        self.assertTrue(response.data['has_more'])
+
+    def test_invalid_cursor(self):
+        other_chat = Chat.objects.create()
+        foreign = Message.objects.create(chat=other_chat, sender=self.user, content='outro chat')
+
+        response = self.client.get(self.url, {'before': foreign.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {'limit': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_chats_are_limited(self):
+        response = self.client.get(reverse('chat-list-user-chats'), {'limit': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chat = response.data[0]
+        ids = sorted(m['id'] for m in chat['my_messages'] + chat['other_messages'])
+        self.assertEqual(ids, [m.id for m in self.messages[-2:]])
+        self.assertTrue(chat['has_more'])
+
+
+class ChatInboxTests(ChatTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('inbox_chatmessageview', 'mark_as_read_chatmessageview'):
+            self.user.role.features.add(Feature.objects.get_or_create(name=name)[0])
+        self.url = reverse('chat-inbox')
+
+    def _send(self, sender, content):
+        self.client.force_authenticate(user=sender)
+        response = self.client.post(reverse('chat-send-message'), {'chat_id': self.chat.id, 'content': content})
+        self.client.force_authenticate(user=self.user)
+        return response
+
+    def test_inbox_shows_last_message_and_unread_count(self):
+        self._send(self.other, 'oi')
+        self._send(self.other, 'tudo bem?')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entry = response.data[0]
+        self.assertEqual(entry['last_message']['content'], 'tudo bem?')
+        self.assertEqual(entry['last_message']['sender_name'], 'Bruno')
+        self.assertEqual(entry['unread_count'], 2)
+        self.assertEqual([str(p['id']) for p in entry['participants']], [str(self.other.id)])
+
+        # Responder marca a conversa como lida para quem enviou
+        self._send(self.user, 'tudo sim')
+        entry = self.client.get(self.url).data[0]
+        self.assertEqual(entry['last_message']['content'], 'tudo sim')
+        self.assertEqual(entry['unread_count'], 0)
+
+    def test_mark_as_read(self):
+        first = self._send(self.other, 'oi').data['message_id']
+        self._send(self.other, 'tudo bem?')
+
+        url = reverse('chat-mark-as-read', args=[self.chat.id])
+        response = self.client.post(url, {'message_id': first})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.url).data[0]['unread_count'], 1)
+
+        self.client.post(url)
+        self.assertEqual(self.client.get(self.url).data[0]['unread_count'], 0)
+
+        # Marcar uma mensagem antiga não retrocede a leitura
+        self.client.post(url, {'message_id': first})
+        self.assertEqual(self.client.get(self.url).data[0]['unread_count'], 0)
+
+    def test_last_message_is_not_moved_back(self):
+        older, newer = self._create_messages(2)
+
+        # Commits fora de ordem: a mensagem mais nova é registrada primeiro
+        ChatInboxService.register_message(newer)
+        ChatInboxService.register_message(older)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.last_message_id, newer.id)
+
+    def test_inbox_query_count_does_not_depend_on_history(self):
+        for i in range(3):
+            chat = Chat.objects.create()
+            chat.participants.add(self.user, baker.make(User))
+            for j in range(i * 5):
+                message = Message.objects.create(chat=chat, sender=self.other, content=str(j))
+                Chat.objects.filter(pk=chat.pk).update(last_message=message)
+
+        # A primeira requisição resolve as permissões do usuário, que ficam em cache
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 4)
+
+
+@override_settings(
+    CHAT_BROKER={'BACKEND': 'chat_message.broker.InProcessBroker'},
+    CHAT_STREAM_HEARTBEAT=0.05,
+    CHAT_STREAM_MAX_DURATION=0.2,
+)
+class ChatStreamTests(ChatTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.role.features.add(Feature.objects.get_or_create(name='stream_chatmessageview')[0])
+        self.url = reverse('chat-stream')
+
+    def test_send_message_publishes_to_participants_after_commit(self):
+        subscription = get_chat_broker().subscribe(self.other.id)
+        self.addCleanup(subscription.close)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(reverse('chat-send-message'), {'chat_id': self.chat.id, 'content': 'olá'})
+            self.assertIsNone(subscription.get(timeout=0))
+
+        for callback in callbacks:
+            callback()
+
+        event = subscription.get(timeout=0)
+        self.assertEqual(event['id'], response.data['message_id'])
+        self.assertEqual(event['content'], 'olá')
+        self.assertEqual(event['sender_name'], 'Ana')
+
+    def test_stream_pushes_live_events_and_heartbeats(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+
+        message = Message.objects.create(chat=self.chat, sender=self.other, content='ao vivo')
+        get_chat_broker().publish([self.user.id], ChatStreamService.build_event(message, 'Bruno'))
+
+        chunk = next(stream).decode()
+        self.assertIn(f'id: {message.id}\n', chunk)
+        self.assertIn('"content": "ao vivo"', chunk)
+
+        rest = b''.join(stream).decode()
+        self.assertIn(': heartbeat', rest)
+        self.assertFalse(get_chat_broker().has_subscribers([self.user.id]))
+
+    def test_reconnect_replays_missed_messages(self):
+        seen, missed_one, missed_two = self._create_messages(3)
+
+        response = self.client.get(self.url, HTTP_LAST_EVENT_ID=str(seen.id))
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertNotIn(f'id: {seen.id}\n', body)
+        self.assertIn(f'id: {missed_one.id}\n', body)
+        self.assertIn(f'id: {missed_two.id}\n', body)
+        self.assertLess(body.index(f'id: {missed_one.id}\n'), body.index(f'id: {missed_two.id}\n'))
+
+
+    def _stream_token(self):
+        self.user.role.features.add(Feature.objects.get_or_create(name='stream_token_chatmessageview')[0])
+        response = self.client.post(reverse('chat-stream-token'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    def test_event_source_opens_stream_with_token(self):
+        token = self._stream_token()
+        # O EventSource não envia o cabeçalho Authorization
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(self.url, {'token': token}, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'retry:'))
+
+        response = self.client.get(self.url, {'token': token + 'x'}, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stream_token_expires(self):
+        token = self._stream_token()
+        self.client.force_authenticate(user=None)
+
+        with override_settings(CHAT_STREAM_TOKEN_LIFETIME=0):
+            response = self.client.get(self.url, {'token': token}, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data['detail'], 'Token do stream inválido ou expirado')
+
+    def test_database_connection_is_released_while_waiting(self):
+        seen, missed = self._create_messages(2)
+
+        # Fora dos testes a resposta é consumida fora de transação
+        with mock.patch.object(connection, 'in_atomic_block', False), \
+                mock.patch.object(connection, 'close') as close:
+            stream = ChatStreamService.stream(self.user.id, seen.id)
+            next(stream)
+            self.assertIn(f'id: {missed.id}\n', next(stream))
+            close.assert_not_called()
+
+            self.assertEqual(next(stream), ': heartbeat\n\n')
+            close.assert_called_once()
+            stream.close()
+
+
+class ChatQueryCountTests(ChatTestMixin, APITestCase):
+
+    def _count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_list_messages_query_count_does_not_depend_on_page_size(self):
+        url = reverse('chat-list-messages', args=[self.chat.id])
+        self._create_messages(5)
+        self._count_queries(url)
+        small_page = self._count_queries(url)
+
+        self._create_messages(195)
+        self.assertEqual(self._count_queries(url, {'limit': 200}), small_page)
+        self.assertEqual(self._count_queries(url, {'limit': 20, 'before': Message.objects.last().id}), small_page + 1)
+
+    def test_list_user_chats_query_count_does_not_depend_on_chats(self):
+        url = reverse('chat-list-user-chats')
+        self._create_messages(5)
+        self._count_queries(url)
+        one_chat = self._count_queries(url)
+
+        for _ in range(5):
+            chat = Chat.objects.create()
+            chat.participants.add(self.user, baker.make(User))
+            for i in range(10):
+                Message.objects.create(chat=chat, sender=chat.participants.last(), content=str(i))
+
+        self.assertEqual(self._count_queries(url, {'limit': 5}), one_chat)
+
+        response = self.client.get(url, {'limit': 5})
+        for chat in response.data:
+            self.assertLessEqual(len(chat['my_messages']) + len(chat['other_messages']), 5)
@@ -8,6 +8,7 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         from .utils import create_dynamic_features
+        from . import signals  # noqa: F401
         post_migrate.connect(run_after_migrations, sender=self)
 
 def run_after_migrations(sender, **kwargs):
@@ -1,15 +1,14 @@
 from functools import wraps
 from django.core.exceptions import PermissionDenied
-from authentication.models.user import User
-from core.models.feature import Feature
+from core.permissions.permission_cache import permission_cache
 
 def has_permission(permission_name):
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if hasattr(request, 'user'):
-                user = User.objects.get(id=request.user.id)
-                if user.role.features.filter(name=permission_name).exists():
+                entry = permission_cache.get_user_entry(request.user.id)
+                if entry and permission_name in permission_cache.get_role_features(entry.role_id):
                     return view_func(request, *args, **kwargs)
             raise PermissionDenied
         return wrapper
@@ -0,0 +1,18 @@
+from django.db.models import DurationField, Func
+
+
+class Minutes(Func):
+    """
+    Converte uma expressão inteira em minutos para um intervalo (DurationField),
+    permitindo somá-la a um DateTimeField dentro da query.
+    """
+    output_field = DurationField()
+    # Backends sem tipo intervalo nativo (ex.: SQLite) armazenam durações em microssegundos
+    template = '(%(expressions)s * 60000000)'
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="(%(expressions)s * INTERVAL '1 minute')",
+            **extra_context
+        )
@@ -1,8 +1,62 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.apps import apps
+from django.utils.functional import LazyObject
 import jwt
 from django.conf import settings
+from core.permissions.permission_cache import permission_cache
+
+
+def set_permission_claims(token, user_id):
+    """
+    Grava no token a role, o tipo de role e a versão atual do conjunto de permissões
+    do usuário, usados pelo modo stateless
+    """
+    User = apps.get_model('authentication', 'User')
+    user_id = User._meta.pk.to_python(user_id)
+    entry = permission_cache.get_user_entry(user_id)
+    if entry is None:
+        raise AuthenticationFailed('Usuário não encontrado')
+
+    token['role_id'] = entry.role_id
+    token['role_type'] = entry.role_type
+    token['perm_version'] = permission_cache.get_permissions_version(user_id)
+    return token
+
+
+def get_tokens_for_user(user):
+    """Gera o par de tokens do usuário com as claims de permissão"""
+    return set_permission_claims(RefreshToken.for_user(user), user.pk)
+
+
+class StatelessUser(LazyObject):
+    """
+    Usuário reconstruído a partir das claims do token.
+
+    id, role_id, role_type e has_permission são respondidos sem consultar o banco;
+    o User real só é carregado, uma única vez, quando outro atributo é acessado.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, role_id=None, role_type=None):
+        super().__init__()
+        self.__dict__.update(id=user_id, pk=user_id, role_id=role_id, role_type=role_type)
+
+    def _setup(self):
+        User = apps.get_model('authentication', 'User')
+        self._wrapped = User.objects.get(pk=self.__dict__['id'])
+
+    def has_permission(self, permission_name):
+        return permission_cache.has_permission(self.__dict__['id'], permission_name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.__dict__['pk']
+
+    def __hash__(self):
+        return hash(self.__dict__['pk'])
+
 
 class JWTAuthentication(BaseAuthentication):
     def authenticate(self, request):
@@ -34,11 +88,33 @@ class JWTAuthentication(BaseAuthentication):
         except jwt.InvalidTokenError:
             raise AuthenticationFailed('Token inválido')
 
+        User = apps.get_model('authentication', 'User')
+
+        # Tokens emitidos sem as claims de permissão continuam usando a busca no banco
+        if getattr(settings, 'JWT_STATELESS_AUTHENTICATION', False) and 'perm_version' in payload:
+            return (self.authenticate_stateless(payload), None)
+
         try:
             # Buscar o usuário pelo UUID
-            User = apps.get_model('authentication', 'User')
             user = User.objects.get(id=payload['user_id'])
         except User.DoesNotExist:
             raise AuthenticationFailed('Usuário não encontrado')
 
-        return (user, None)
\ No newline at end of file
+        return (user, None)
+
+    def authenticate_stateless(self, payload):
+        User = apps.get_model('authentication', 'User')
+        try:
+            user_id = User._meta.pk.to_python(payload['user_id'])
+        except Exception:
+            raise AuthenticationFailed('Token inválido')
+
+        # A versão vem do cache compartilhado, invalidado pelos sinais de qualquer processo:
+        # um token emitido antes de uma mudança de permissões é recusado por todos os workers
+        current_version = permission_cache.get_permissions_version(user_id)
+        if current_version is None:
+            raise AuthenticationFailed('Usuário não encontrado')
+        if current_version != payload['perm_version']:
+            raise AuthenticationFailed('Token com permissões desatualizadas. Faça login novamente.')
+
+        return StatelessUser(user_id, payload.get('role_id'), payload.get('role_type'))
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.deletion import Collector
 from django.core.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import permissions
@@ -16,22 +17,40 @@ class PersonalizedModelViewSet(ModelViewSet):
         except ValidationError as e:
            return Response({"detail": e.message} , status=status.HTTP_400_BAD_REQUEST)
 
+class TimeStampedQuerySet(models.QuerySet):
+    def alive(self):
+        """Apenas registros não excluídos; é o filtro coberto pelos índices parciais"""
+        return self.filter(deleted_at__isnull=True)
+
+class TimeStampedManager(models.Manager.from_queryset(TimeStampedQuerySet)):
+    pass
+
 class TimeStampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TimeStampedManager()
+
     class Meta:
         abstract = True
 
-    def delete(self):
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        collector = Collector(using=using)
         try:
-            self.refresh_from_db()
-            super().delete(keep_parents=True)
+            collector.collect([self], keep_parents=True)
         except ProtectedError as e:
              raise ValidationError("Este registro não pode ser excluído pois está sendo usado em outro lugar.")
-        
-        self.deleted_at = timezone.now()
-        self.save()
+
+        with transaction.atomic(using=using, savepoint=False):
+            # O próprio registro só é marcado como excluído, sem apagar e regravar a linha
+            self.deleted_at = timezone.now()
+            self.save(using=using, update_fields=['deleted_at', 'updated_at'])
+
+            # Relações dependentes (m2m, CASCADE, SET_NULL) continuam sendo tratadas como antes
+            collector.data[self.__class__].discard(self)
+            collector.delete()
 
     def hard_delete(self):
         super().delete()
@@ -0,0 +1,66 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+
+
+def estimate_queryset_count(queryset) -> int:
+    """
+    Retorna uma contagem aproximada do queryset, guardada em cache.
+
+    No PostgreSQL usa a estimativa de linhas do planner (EXPLAIN), que não varre a
+    tabela; quando a estimativa é pequena, faz a contagem exata, que também é barata.
+    Nos demais backends faz a contagem exata.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    cache_key = 'pagination-count:' + hashlib.sha1(
+        f'{queryset.db}:{sql}:{params!r}'.encode()
+    ).hexdigest()
+
+    count = cache.get(cache_key)
+    if count is not None:
+        return count
+
+    count = None
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        count = int(plan[0]['Plan']['Plan Rows'])
+        if count < getattr(settings, 'PAGINATION_EXACT_COUNT_THRESHOLD', 10000):
+            count = None
+
+    if count is None:
+        count = queryset.count()
+
+    cache.set(cache_key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+    return count
+
+
+class TimeStampedCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) sobre created_at, id para modelos TimeStampedModel.
+
+    O total de registros só é calculado quando o cliente pede (?with_count=true) e é
+    devolvido no cabeçalho X-Total-Count como estimativa em cache.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    count_query_param = 'with_count'
+    count_header = 'X-Total-Count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total_count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.total_count = estimate_queryset_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.total_count is not None:
+            response[self.count_header] = str(self.total_count)
+        return response
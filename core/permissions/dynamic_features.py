@@ -8,6 +8,7 @@ class ModelFeatureGenerator:
     
     FIXED_FEATURES = [
         ('list_dashboardstatsview', 'Listar estatísticas do dashboard'),
+        ('cache_stats_dashboardstatsview', 'Visualizar métricas do cache do dashboard'),
         ('clients_userviewset', 'Listar clientes do sistema'),
         ('providers_userviewset', 'Listar prestadores do sistema'),
         ('users_userviewset', 'Listar usuários do sistema'),
@@ -15,10 +16,15 @@ class ModelFeatureGenerator:
         ('documents.download_document', 'Realizar download de documentos'),
         ('documents.preview_document', 'Visualizar preview de documentos'),
         ('appointment.update_status_appointment', 'Atualizar status de agendamento'),
+        ('appointment.available_slots_appointment', 'Listar horários disponíveis do prestador'),
         ('create_or_get_chat_chatmessageview', 'Create or get Chat'),
         ('send_message_chatmessageview', 'Send Message'),
         ('list_messages_chatmessageview', 'List Messages'),
         ('list_user_chats_chatmessageview', 'List Messages'),
+        ('inbox_chatmessageview', 'List Chat Inbox'),
+        ('mark_as_read_chatmessageview', 'Mark Chat as Read'),
+        ('stream_chatmessageview', 'Stream New Messages'),
+        ('stream_token_chatmessageview', 'Create Stream Token'),
     ]
     
     def __init__(self):
@@ -0,0 +1,232 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+
+@dataclass(frozen=True)
+class UserPermissionEntry:
+    role_id: Optional[int]
+    role_type: Optional[str]
+    features: FrozenSet[str]
+
+
+class PermissionCache:
+    """
+    Cache dos conjuntos de permissões resolvidos por usuário e por role, guardado
+    no cache do Django (alias 'permissions', ou 'default' se ele não existir).
+
+    Cada entrada guarda os contadores de versão com que foi montada — o global e o
+    do usuário ou da role —, que os sinais de core.signals incrementam quando as
+    features mudam. Os contadores ficam no mesmo backend das entradas, então uma
+    revogação vale para todos os processos que o compartilham. O processo lembra a
+    role de cada usuário, o que permite ler contadores e entradas do usuário e da
+    role em uma única ida ao cache. O backend padrão (locmem) é por processo: com
+    mais de um worker use PERMISSION_CACHE_BACKEND=file ou db.
+    """
+    ALIAS = 'permissions'
+    PREFIX = 'permissions'
+    MAX_ROLE_HINTS = 10_000
+
+    def __init__(self, timeout: Optional[int] = None):
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._roles: Dict = {}
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        try:
+            return caches[self.ALIAS]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    @property
+    def timeout(self) -> int:
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300)
+
+    def _version_key(self, scope: str, key=None) -> str:
+        return f'{self.PREFIX}:version:{scope}' if key is None else f'{self.PREFIX}:version:{scope}:{key}'
+
+    def _entry_key(self, scope: str, key) -> str:
+        return f'{self.PREFIX}:{scope}:{key}'
+
+    def _get_many(self, keys: List[str]) -> dict:
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key.startswith(f'{self.PREFIX}:version:') and key not in values]
+        if missing:
+            # Contador nunca criado ou descartado pelo backend: começa em um valor novo,
+            # para que entradas gravadas com as versões anteriores não voltem a ser lidas
+            for key in missing:
+                self.cache.add(key, time.time_ns(), timeout=None)
+            values.update(self.cache.get_many(missing))
+        return values
+
+    def _bump(self, key: str) -> None:
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, time.time_ns(), timeout=None)
+
+    def _get(self, values: dict, key: str, versions: Tuple):
+        """Conteúdo da entrada lida em values, se ela foi montada com as versões atuais"""
+        cached = values.get(key)
+        valid = cached is not None and cached[0] == versions
+        with self._lock:
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached[1] if valid else None
+
+    def _set(self, key: str, versions: Tuple, value) -> None:
+        self.cache.set(key, (versions, value), self.timeout)
+
+    def _role_keys(self, role_id) -> List[str]:
+        return [self._version_key('role', role_id), self._entry_key('role', role_id)]
+
+    def _load_user(self, user_id) -> Optional[Tuple[Optional[int], FrozenSet[str]]]:
+        """Role e features atribuídas diretamente ao usuário"""
+        User = django_apps.get_model('authentication', 'User')
+        roles = list(User.objects.filter(pk=user_id).values_list('role_id', flat=True))
+        if not roles:
+            return None
+
+        Feature = django_apps.get_model('core', 'Feature')
+        features = frozenset(
+            Feature.objects.filter(system_users__pk=user_id).values_list('name', flat=True)
+        )
+        return roles[0], features
+
+    def _load_role(self, role_id) -> Tuple[Optional[str], FrozenSet[str]]:
+        """Tipo e features da role"""
+        Role = django_apps.get_model('core', 'Role')
+        # Uma linha por feature (ou uma só, com None, se a role não tiver features)
+        rows = list(Role.objects.filter(pk=role_id).values_list('role_type', 'features__name'))
+        return (
+            rows[0][0] if rows else None,
+            frozenset(name for _, name in rows if name is not None)
+        )
+
+    def _role(self, values: dict, role_id) -> Tuple[Optional[str], FrozenSet[str]]:
+        if role_id is None:
+            return None, frozenset()
+
+        version_key, entry_key = self._role_keys(role_id)
+        versions = (values[self._version_key('global')], values[version_key])
+        role = self._get(values, entry_key, versions)
+        if role is None:
+            role = self._load_role(role_id)
+            self._set(entry_key, versions, role)
+        return role
+
+    def _get_role(self, role_id) -> Tuple[Optional[str], FrozenSet[str]]:
+        if role_id is None:
+            return None, frozenset()
+        return self._role(self._get_many([self._version_key('global'), *self._role_keys(role_id)]), role_id)
+
+    def _resolve(self, user_id) -> Optional[Tuple[UserPermissionEntry, FrozenSet[str]]]:
+        global_key, version_key, entry_key = (
+            self._version_key('global'), self._version_key('user', user_id), self._entry_key('user', user_id)
+        )
+        hint = self._roles.get(user_id)
+        keys = [global_key, version_key, entry_key]
+        if hint is not None:
+            keys += self._role_keys(hint)
+        values = self._get_many(keys)
+
+        versions = (values[global_key], values[version_key])
+        user = self._get(values, entry_key, versions)
+        if user is None:
+            user = self._load_user(user_id)
+            if user is None:
+                return None
+            self._set(entry_key, versions, user)
+
+        role_id, features = user
+        if role_id != hint:
+            # Role ainda não vista por este processo (ou trocada): mais uma ida ao cache
+            if role_id is not None:
+                values.update(self._get_many(self._role_keys(role_id)))
+            with self._lock:
+                if len(self._roles) >= self.MAX_ROLE_HINTS:
+                    self._roles.clear()
+                self._roles[user_id] = role_id
+
+        role_type, role_features = self._role(values, role_id)
+        return UserPermissionEntry(role_id=role_id, role_type=role_type, features=features), role_features
+
+    def get_user_entry(self, user_id) -> Optional[UserPermissionEntry]:
+        """Retorna a role, o tipo da role e as features atribuídas diretamente ao usuário"""
+        resolved = self._resolve(user_id)
+        return resolved[0] if resolved else None
+
+    def get_role_features(self, role_id) -> FrozenSet[str]:
+        """Retorna o conjunto de features de uma role"""
+        return self._get_role(role_id)[1]
+
+    def get_permissions(self, user_id) -> FrozenSet[str]:
+        """Retorna a união das features do usuário e da sua role"""
+        resolved = self._resolve(user_id)
+        if resolved is None:
+            return frozenset()
+        entry, role_features = resolved
+        return entry.features | role_features
+
+    def has_permission(self, user_id, permission_name: str) -> bool:
+        resolved = self._resolve(user_id)
+        if resolved is None:
+            return False
+        entry, role_features = resolved
+        return permission_name in entry.features or permission_name in role_features
+
+    def get_permissions_version(self, user_id) -> Optional[str]:
+        """
+        Retorna uma impressão digital curta da role e do conjunto de permissões
+        do usuário. Muda sempre que qualquer um deles muda, o que permite
+        rejeitar tokens emitidos com permissões desatualizadas.
+        """
+        resolved = self._resolve(user_id)
+        if resolved is None:
+            return None
+        entry, role_features = resolved
+        permissions = entry.features | role_features
+        fingerprint = '|'.join([str(entry.role_id), str(entry.role_type), *sorted(permissions)])
+        return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+    def invalidate_user(self, user_id) -> None:
+        self._bump(self._version_key('user', user_id))
+
+    def invalidate_role(self, role_id) -> None:
+        self._bump(self._version_key('role', role_id))
+
+    def clear(self) -> None:
+        self._bump(self._version_key('global'))
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Contadores de hit/miss deste processo"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'timeout': self.timeout,
+                'backend': self.cache.__class__.__name__,
+            }
+
+
+permission_cache = PermissionCache()
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models.user import User
+from core.models.feature import Feature
+from core.models.role import Role
+from core.permissions.permission_cache import permission_cache
+
+
+def _invalidate(invalidate, *args):
+    """
+    Invalida agora, para a própria transação, e de novo após o commit: outro processo
+    pode ter gravado no cache compartilhado o estado anterior enquanto ela estava aberta
+    """
+    invalidate(*args)
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+@receiver(m2m_changed, sender=User.features.through)
+def invalidate_user_features(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        _invalidate(permission_cache.invalidate_user, instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            _invalidate(permission_cache.invalidate_user, user_id)
+    else:
+        # feature.system_users.clear(): não sabemos quais usuários foram afetados
+        _invalidate(permission_cache.clear)
+
+
+@receiver(m2m_changed, sender=Role.features.through)
+def invalidate_role_features(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        _invalidate(permission_cache.invalidate_role, instance.pk)
+    elif pk_set:
+        for role_id in pk_set:
+            _invalidate(permission_cache.invalidate_role, role_id)
+    else:
+        _invalidate(permission_cache.clear)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    _invalidate(permission_cache.invalidate_user, instance.pk)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role(sender, instance, **kwargs):
+    # O tipo da role fica na entrada da própria role
+    _invalidate(permission_cache.invalidate_role, instance.pk)
+
+
+@receiver(post_save, sender=Feature)
+@receiver(post_delete, sender=Feature)
+def invalidate_feature(sender, instance, created=False, **kwargs):
+    # Features novas ainda não estão associadas a ninguém
+    if not created:
+        _invalidate(permission_cache.clear)
@@ -1,3 +1,269 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from authentication.models import User
+from core.models.feature import Feature
+from core.models.jwt import JWTAuthentication, get_tokens_for_user
+from core.models.role import Role
+from core.permissions.permission_cache import PermissionCache, permission_cache
+
+
+class PermissionCacheTests(TestCase):
+
+    def setUp(self):
+        permission_cache.clear()
+        permission_cache.reset_stats()
+
+        self.role_feature, _ = Feature.objects.get_or_create(name='appointment.list_appointment')
+        self.user_feature, _ = Feature.objects.get_or_create(name='documents.download_document')
+
+        self.role = baker.make(Role, role_type='provider')
+        self.role.features.add(self.role_feature)
+
+        self.user = baker.make(User, role=self.role)
+        self.user.features.add(self.user_feature)
+
+    def test_has_permission_resolves_user_and_role_features(self):
+        self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+        self.assertTrue(self.user.has_permission('documents.download_document'))
+        self.assertFalse(self.user.has_permission('documents.preview_document'))
+
+    def test_cached_check_does_not_hit_database(self):
+        self.user.has_permission('appointment.list_appointment')
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+            self.assertFalse(self.user.has_permission('core.list_role'))
+
+        stats = permission_cache.stats()
+        self.assertGreater(stats['hits'], 0)
+        self.assertGreater(stats['misses'], 0)
+
+    def test_role_feature_change_invalidates_cache(self):
+        self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+        self.role.features.remove(self.role_feature)
+        self.assertFalse(self.user.has_permission('appointment.list_appointment'))
+
+        self.role.features.add(self.role_feature)
+        self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+    def test_user_feature_change_invalidates_cache(self):
+        self.assertTrue(self.user.has_permission('documents.download_document'))
+
+        self.user.features.clear()
+        self.assertFalse(self.user.has_permission('documents.download_document'))
+
+    def test_reverse_feature_change_invalidates_cache(self):
+        self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+        self.role_feature.roles.clear()
+        self.assertFalse(self.user.has_permission('appointment.list_appointment'))
+
+    def test_role_change_is_picked_up(self):
+        self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+        self.user.role = baker.make(Role, role_type='client')
+        self.user.save()
+        self.assertFalse(self.user.has_permission('appointment.list_appointment'))
+
+    def test_role_type_change_is_picked_up(self):
+        self.assertEqual(permission_cache.get_user_entry(self.user.pk).role_type, 'provider')
+
+        self.role.role_type = 'client'
+        self.role.save()
+        self.assertEqual(permission_cache.get_user_entry(self.user.pk).role_type, 'client')
+
+    def test_revocation_is_seen_by_other_processes(self):
+        # Outra instância sobre o mesmo backend faz o papel de outro worker
+        other_worker = PermissionCache()
+        self.assertTrue(other_worker.has_permission(self.user.pk, 'appointment.list_appointment'))
+
+        self.role.features.remove(self.role_feature)
+        self.assertFalse(other_worker.has_permission(self.user.pk, 'appointment.list_appointment'))
+
+    def test_cached_check_is_a_single_cache_round_trip(self):
+        self.user.has_permission('appointment.list_appointment')
+        backend = permission_cache.cache
+
+        # Contadores e entradas do usuário e da role vêm de um único get_many
+        with mock.patch.object(backend, 'get_many', wraps=backend.get_many) as get_many, \
+                mock.patch.object(backend, 'set') as cache_set:
+            self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+        self.assertEqual(get_many.call_count, 1)
+        cache_set.assert_not_called()
+
+    def test_role_seen_by_another_process_is_resolved(self):
+        # O outro worker ainda não conhece a role do usuário; depois dela, uma ida ao cache basta
+        other_worker = PermissionCache()
+        self.assertTrue(other_worker.has_permission(self.user.pk, 'appointment.list_appointment'))
+
+        self.user.role = baker.make(Role, role_type='client')
+        self.user.save()
+        self.assertFalse(other_worker.has_permission(self.user.pk, 'appointment.list_appointment'))
+        self.assertEqual(other_worker.get_user_entry(self.user.pk).role_type, 'client')
+
+    def test_entries_live_in_the_shared_cache(self):
+        self.user.has_permission('appointment.list_appointment')
+        permission_cache.cache.clear()
+
+        # Sem as entradas nem os contadores, tudo volta a ser lido do banco
+        with self.assertNumQueries(3):
+            self.assertTrue(self.user.has_permission('appointment.list_appointment'))
+
+
+@override_settings(JWT_STATELESS_AUTHENTICATION=True)
+class StatelessJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        permission_cache.clear()
+        self.factory = APIRequestFactory()
+        self.feature, _ = Feature.objects.get_or_create(name='appointment.list_appointment')
+        self.role = baker.make(Role, role_type='provider')
+        self.role.features.add(self.feature)
+        self.user = baker.make(User, role=self.role)
+
+    def _request(self, token):
+        return self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_authenticates_without_user_lookup(self):
+        token = str(get_tokens_for_user(self.user).access_token)
+
+        with self.assertNumQueries(0):
+            user, _ = JWTAuthentication().authenticate(self._request(token))
+            self.assertEqual(user.id, self.user.id)
+            self.assertEqual(user.role_type, 'provider')
+            self.assertTrue(user.has_permission('appointment.list_appointment'))
+            self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.user.email)
+
+    def test_rejects_token_with_stale_permissions(self):
+        token = str(get_tokens_for_user(self.user).access_token)
+
+        self.role.features.remove(self.feature)
+
+        with self.assertRaises(AuthenticationFailed):
+            JWTAuthentication().authenticate(self._request(token))
+
+    def test_stale_token_is_rejected_by_other_workers(self):
+        token = str(get_tokens_for_user(self.user).access_token)
+
+        # Outro worker, com sua própria instância do cache sobre o mesmo backend, já aceitou o token
+        with mock.patch('core.models.jwt.permission_cache', PermissionCache()):
+            JWTAuthentication().authenticate(self._request(token))
+
+            self.role.features.remove(self.feature)
+
+            with self.assertRaises(AuthenticationFailed):
+                JWTAuthentication().authenticate(self._request(token))
+
+    def test_refresh_issues_token_with_current_permissions(self):
+        refresh = get_tokens_for_user(self.user)
+        self.role.features.remove(self.feature)
+        self.user.role = baker.make(Role, role_type='client')
+        self.user.save()
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        user, _ = JWTAuthentication().authenticate(self._request(response.json()['access']))
+        self.assertEqual(user.role_id, self.user.role_id)
+        self.assertEqual(user.role_type, 'client')
+        with self.assertRaises(AuthenticationFailed):
+            JWTAuthentication().authenticate(self._request(str(refresh.access_token)))
+
+    def test_token_without_permission_claims_falls_back_to_database(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+
+        user, _ = JWTAuthentication().authenticate(self._request(token))
+        self.assertIsInstance(user, User)
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('role-list')
+
+        feature, _ = Feature.objects.get_or_create(name='core.list_role')
+        self.role = baker.make(Role, role_type='provider')
+        self.role.features.add(feature)
+        self.user = baker.make(User, role=self.role)
+        self.client.force_authenticate(user=self.user)
+
+        baker.make(Role, _quantity=4)
+
+    def test_pages_follow_cursor_without_overlap(self):
+        total = Role.objects.count()
+
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('X-Total-Count', response)
+
+        seen = [role['id'] for role in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(role['id'] for role in response.data['results'])
+            next_url = response.data['next']
+
+        self.assertEqual(len(seen), total)
+        self.assertEqual(len(set(seen)), total)
+
+    def test_total_count_header_is_opt_in_and_cached(self):
+        response = self.client.get(self.url, {'page_size': 2, 'with_count': 'true'})
+        self.assertEqual(response['X-Total-Count'], str(Role.objects.count()))
+
+        baker.make(Role)
+        response = self.client.get(self.url, {'page_size': 2, 'with_count': 'true'})
+        self.assertEqual(response['X-Total-Count'], str(Role.objects.count() - 1))
+
+
+class SoftDeleteTests(TestCase):
+
+    def setUp(self):
+        self.feature, _ = Feature.objects.get_or_create(name='core.list_role')
+        self.role = baker.make(Role, role_type='provider')
+        self.role.features.add(self.feature)
+        self.user = baker.make(User, role=self.role)
+
+    def test_delete_marks_row_without_reinserting(self):
+        with CaptureQueriesContext(connection) as context:
+            self.role.delete()
+
+        statements = [query['sql'].split()[0].upper() for query in context.captured_queries]
+        self.assertNotIn('INSERT', statements)
+
+        role = Role.objects.get(pk=self.role.pk)
+        self.assertIsNotNone(role.deleted_at)
+        self.assertFalse(Role.objects.alive().filter(pk=self.role.pk).exists())
+
+    def test_delete_keeps_dependent_relations_behavior(self):
+        self.role.delete()
+
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.role_id)
+        self.assertFalse(Role.features.through.objects.filter(role_id=self.role.pk).exists())
+
+    def test_protected_relation_blocks_delete(self):
+        from appointment.models import Appointment
+
+        baker.make(Appointment, client=self.user, provider=baker.make(User))
+
+        with self.assertRaises(ValidationError):
+            self.user.delete()
+        self.assertIsNone(User.objects.get(pk=self.user.pk).deleted_at)
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from dashboard.models import ServiceMonthlyStat
+
+@admin.register(ServiceMonthlyStat)
+class ServiceMonthlyStatAdmin(admin.ModelAdmin):
+    list_display = ('id', 'service', 'month', 'total_value', 'quantity')
+    list_filter = ('month',)
+    search_fields = ('service__name',)
+    list_select_related = ('service',)
@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.utils import timezone
+
+
+class DashboardCache:
+    """
+    Cache das respostas do dashboard, indexado pelo período normalizado.
+
+    As chaves incluem um contador de geração: qualquer alteração em agendamentos
+    ou serviços incrementa o contador (ver dashboard.signals), o que invalida
+    todas as respostas de uma vez sem precisar enumerar as chaves.
+    """
+    ALIAS = 'dashboard'
+    GENERATION_KEY = 'dashboard:generation'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        try:
+            return caches[self.ALIAS]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    @property
+    def timeout(self) -> int:
+        return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60)
+
+    @staticmethod
+    def normalize(value: Optional[datetime]) -> str:
+        if value is None:
+            return '*'
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value.astimezone(timezone.utc).isoformat()
+
+    def generation(self) -> int:
+        generation = self.cache.get(self.GENERATION_KEY)
+        if generation is None:
+            self.cache.add(self.GENERATION_KEY, 1, timeout=None)
+            generation = self.cache.get(self.GENERATION_KEY, 1)
+        return generation
+
+    def make_key(self, start: Optional[datetime], end: Optional[datetime]) -> str:
+        return f'dashboard:stats:{self.generation()}:{self.normalize(start)}:{self.normalize(end)}'
+
+    def get_or_compute(self, start: Optional[datetime], end: Optional[datetime], compute: Callable[[], Dict]) -> Dict:
+        key = self.make_key(start, end)
+        data = self.cache.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        started = time.perf_counter()
+        data = compute()
+        elapsed = time.perf_counter() - started
+
+        self.cache.set(key, data, self.timeout)
+        with self._lock:
+            self.misses += 1
+            self.recompute_time += elapsed
+            self.last_recompute_time = elapsed
+            self.max_recompute_time = max(self.max_recompute_time, elapsed)
+        return data
+
+    def invalidate(self) -> None:
+        try:
+            self.cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            self.cache.add(self.GENERATION_KEY, 1, timeout=None)
+        with self._lock:
+            self.invalidations += 1
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+            self.recompute_time = 0.0
+            self.last_recompute_time = 0.0
+            self.max_recompute_time = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Contadores deste processo, para dimensionar o cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRatio': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations,
+                'averageRecomputeMs': (self.recompute_time / self.misses * 1000) if self.misses else 0.0,
+                'lastRecomputeMs': self.last_recompute_time * 1000,
+                'maxRecomputeMs': self.max_recompute_time * 1000,
+                'timeout': self.timeout,
+                'backend': self.cache.__class__.__name__,
+            }
+
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from dashboard.services import ServiceStatsRollupService
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o consolidado mensal de receita por serviço a partir do histórico de agendamentos'
+
+    def handle(self, *args, **options):
+        total = ServiceStatsRollupService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Consolidado reconstruído: {total} registros de serviço/mês.'))
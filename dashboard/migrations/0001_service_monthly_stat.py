@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('service', '0002_alter_service_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceMonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='service.service')),
+            ],
+            options={
+                'ordering': ['service', 'month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='servicemonthlystat',
+            constraint=models.UniqueConstraint(fields=('service', 'month'), name='unique_service_monthly_stat'),
+        ),
+    ]
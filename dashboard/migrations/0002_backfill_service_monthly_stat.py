@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def backfill_service_monthly_stats(apps, schema_editor):
+    Appointment = apps.get_model('appointment', 'Appointment')
+    ServiceMonthlyStat = apps.get_model('dashboard', 'ServiceMonthlyStat')
+
+    rows = Appointment.objects.filter(
+        status='Concluido',
+        deleted_at__isnull=True,
+        services__isnull=False
+    ).annotate(
+        month=TruncMonth('appointment_date')
+    ).values('services', 'month').annotate(
+        total=Sum('services__cost'),
+        quantity=Count('id')
+    ).order_by()
+
+    ServiceMonthlyStat.objects.bulk_create([
+        ServiceMonthlyStat(
+            service_id=row['services'],
+            month=timezone.localtime(row['month']).date().replace(day=1),
+            total_value=row['total'] or 0,
+            quantity=row['quantity']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_service_monthly_stat'),
+        ('appointment', '0015_appointment_extra_documents'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_service_monthly_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1 @@
+from dashboard.models.service_monthly_stat import ServiceMonthlyStat
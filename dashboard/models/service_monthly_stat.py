@@ -0,0 +1,22 @@
+from django.db import models
+from service.models import Service
+
+
+class ServiceMonthlyStat(models.Model):
+    """
+    Consolidado mensal da receita de cada serviço com agendamentos concluídos.
+    Mantido pelos sinais de dashboard.signals e reconstruído pelo comando rebuild_service_stats.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='monthly_stats')
+    month = models.DateField()
+    total_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['service', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'month'], name='unique_service_monthly_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_id} - {self.month:%m/%Y}"
@@ -1,7 +1,12 @@
-from datetime import datetime
-from django.db.models import Sum, Count
+from collections import defaultdict
+from datetime import date, datetime, time
+from typing import Iterable, Optional, Tuple
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 from django.db.models.functions import TruncMonth
+from django.utils import timezone
 from appointment.models.appointment import Appointment
+from dashboard.models import ServiceMonthlyStat
 from service.models.service import Service
 
 
@@ -24,8 +29,7 @@ class DashboardDataService:
     @staticmethod
     def get_filtered_appointments(start_date=None, end_date=None):
         """Filtra agendamentos por período e remove deletados."""
-        appointments = Appointment.objects.filter(
-            deleted_at__isnull=True,
+        appointments = Appointment.objects.alive().filter(
             client__deleted_at__isnull=True,
             provider__deleted_at__isnull=True
         )
@@ -36,9 +40,8 @@ class DashboardDataService:
     @staticmethod
     def calculate_service_stats(appointments):
         """Calcula estatísticas de serviços agrupadas por mês."""
-        stats = appointments.filter(
+        stats = appointments.alive().filter(
             status=Appointment.Status.COMPLETED,
-            deleted_at__isnull=True,
             services__deleted_at__isnull=True
         ).annotate(
             month=TruncMonth('appointment_date')
@@ -62,12 +65,225 @@ class DashboardDataService:
 
     @staticmethod
     def calculate_total_revenue(appointments):
-        """Calcula a receita total de agendamentos concluídos."""
-        completed_appointments = appointments.filter(
+        """Calcula a receita total de agendamentos concluídos em uma única agregação no banco."""
+        result = appointments.alive().filter(
             status=Appointment.Status.COMPLETED,
-            deleted_at__isnull=True
-        ).prefetch_related('services')
-        return sum([
-            sum([service.cost for service in app.services.filter(deleted_at__isnull=True)])
-            for app in completed_appointments
-        ])
+            services__deleted_at__isnull=True
+        ).aggregate(total=Sum('services__cost'))
+        return result['total'] or 0
+
+
+class ServiceStatsRollupService:
+    """
+    Serviço de manutenção do consolidado mensal por serviço (ServiceMonthlyStat).
+
+    Cada alteração recalcula apenas os pares (serviço, mês) afetados a partir
+    das tabelas de origem, o que mantém o consolidado idempotente.
+    """
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def get_month(value: datetime) -> date:
+        """Mês do agendamento no fuso atual, como no TruncMonth"""
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date().replace(day=1)
+
+    @staticmethod
+    def month_bounds(month: date) -> Tuple[datetime, datetime]:
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        return (
+            timezone.make_aware(datetime.combine(month, time.min)),
+            timezone.make_aware(datetime.combine(next_month, time.min)),
+        )
+
+    @staticmethod
+    def completed_appointments():
+        return Appointment.objects.alive().filter(
+            status=Appointment.Status.COMPLETED
+        )
+
+    @staticmethod
+    def contributes(status, deleted_at) -> bool:
+        return status == Appointment.Status.COMPLETED and deleted_at is None
+
+    @staticmethod
+    def _save(stats: Iterable[ServiceMonthlyStat]) -> None:
+        ServiceMonthlyStat.objects.bulk_create(
+            stats,
+            batch_size=ServiceStatsRollupService.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['service', 'month'],
+            update_fields=['total_value', 'quantity']
+        )
+
+    @staticmethod
+    def refresh(pairs: Iterable[Tuple[int, date]]) -> None:
+        """Recalcula os pares (serviço, mês) informados, com uma consulta por mês"""
+        services_by_month = defaultdict(set)
+        for service_id, month in pairs:
+            services_by_month[month].add(service_id)
+
+        with transaction.atomic():
+            for month, service_ids in services_by_month.items():
+                start, end = ServiceStatsRollupService.month_bounds(month)
+                rows = ServiceStatsRollupService.completed_appointments().filter(
+                    services__in=service_ids,
+                    appointment_date__gte=start,
+                    appointment_date__lt=end
+                ).values('services').annotate(
+                    total=Sum('services__cost'),
+                    quantity=Count('id')
+                )
+
+                stats = [
+                    ServiceMonthlyStat(
+                        service_id=row['services'],
+                        month=month,
+                        total_value=row['total'] or 0,
+                        quantity=row['quantity']
+                    )
+                    for row in rows
+                ]
+                ServiceMonthlyStat.objects.filter(month=month, service_id__in=service_ids).exclude(
+                    service_id__in=[stat.service_id for stat in stats]
+                ).delete()
+                ServiceStatsRollupService._save(stats)
+
+    @staticmethod
+    def _rebuild(service_filter, stats_queryset) -> int:
+        # O filtro de serviço fica na mesma chamada de filter() para que o agrupamento use o mesmo join
+        rows = ServiceStatsRollupService.completed_appointments().filter(
+            **service_filter
+        ).annotate(
+            month=TruncMonth('appointment_date')
+        ).values('services', 'month').annotate(
+            total=Sum('services__cost'),
+            quantity=Count('id')
+        ).order_by()
+
+        stats = [
+            ServiceMonthlyStat(
+                service_id=row['services'],
+                month=ServiceStatsRollupService.get_month(row['month']),
+                total_value=row['total'] or 0,
+                quantity=row['quantity']
+            )
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            stats_queryset.delete()
+            ServiceStatsRollupService._save(stats)
+        return len(stats)
+
+    @staticmethod
+    def refresh_service(service_id) -> None:
+        """Recalcula todos os meses de um serviço, por exemplo após mudança de preço"""
+        ServiceStatsRollupService._rebuild(
+            {'services': service_id},
+            ServiceMonthlyStat.objects.filter(service_id=service_id)
+        )
+
+    @staticmethod
+    def rebuild() -> int:
+        """Reconstrói todo o consolidado a partir do histórico de agendamentos"""
+        return ServiceStatsRollupService._rebuild(
+            {'services__isnull': False},
+            ServiceMonthlyStat.objects.all()
+        )
+
+    @staticmethod
+    def split_period(start: datetime, end: datetime) -> Tuple[datetime, datetime, datetime, datetime]:
+        """
+        Retorna (start, end, full_start, full_end): o período com datas cientes de fuso e o
+        intervalo [full_start, full_end) dos meses inteiramente contidos nele, vazio
+        (full_start == full_end) quando não há nenhum
+        """
+        start, end = [value if timezone.is_aware(value) else timezone.make_aware(value) for value in (start, end)]
+
+        # Primeiro mês que começa dentro do período e início do primeiro mês que não cabe nele
+        month_start, month_end = ServiceStatsRollupService.month_bounds(ServiceStatsRollupService.get_month(start))
+        if month_start < start:
+            month_start, month_end = ServiceStatsRollupService.month_bounds(month_end.date())
+        full_start = month_start
+        while month_end <= end:
+            month_start, month_end = ServiceStatsRollupService.month_bounds(month_end.date())
+        full_end = month_start
+        return start, end, full_start, full_end
+
+    @staticmethod
+    def _edges(start: datetime, end: datetime, full_start: datetime, full_end: datetime):
+        """Agendamentos das pontas parciais do período, fora dos meses completos"""
+        appointments = DashboardDataService.get_filtered_appointments()
+        if full_start == full_end:
+            return appointments.filter(appointment_date__range=(start, end))
+        return appointments.filter(
+            Q(appointment_date__gte=start, appointment_date__lt=full_start) |
+            Q(appointment_date__gte=full_end, appointment_date__lte=end)
+        )
+
+    @staticmethod
+    def get_total_revenue(start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Receita dos agendamentos concluídos no período, ou em todo o histórico. Os meses
+        inteiramente contidos no período vêm do consolidado; só as pontas parciais
+        são somadas a partir dos agendamentos.
+        """
+        stats = ServiceMonthlyStat.objects.filter(service__deleted_at__isnull=True)
+        if not (start and end):
+            return stats.aggregate(total=Sum('total_value'))['total'] or 0
+
+        start, end, full_start, full_end = ServiceStatsRollupService.split_period(start, end)
+        revenue = DashboardDataService.calculate_total_revenue(
+            ServiceStatsRollupService._edges(start, end, full_start, full_end)
+        )
+        if full_start == full_end:
+            return revenue
+
+        full_months = stats.filter(month__gte=full_start.date(), month__lt=full_end.date())
+        return (full_months.aggregate(total=Sum('total_value'))['total'] or 0) + revenue
+
+    @staticmethod
+    def get_service_stats(start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Mesmo formato de DashboardDataService.calculate_service_stats. Os meses inteiramente
+        contidos no período (ou todo o histórico, sem período) vêm do consolidado; só as
+        pontas parciais são agrupadas a partir dos agendamentos.
+        """
+        stats = ServiceMonthlyStat.objects.filter(
+            service__deleted_at__isnull=True,
+            quantity__gt=0
+        )
+        edges = []
+        if start and end:
+            start, end, full_start, full_end = ServiceStatsRollupService.split_period(start, end)
+            edges = DashboardDataService.calculate_service_stats(
+                ServiceStatsRollupService._edges(start, end, full_start, full_end)
+            )
+            if full_start == full_end:
+                return edges
+            stats = stats.filter(month__gte=full_start.date(), month__lt=full_end.date())
+
+        stats = stats.values(
+            'service__name', 'month'
+        ).annotate(
+            totalValue=Sum('total_value'),
+            total_quantity=Sum('quantity')
+        ).order_by('service__name', 'month')
+
+        rollup = [
+            {
+                'serviceName': stat['service__name'],
+                'date': timezone.make_aware(datetime.combine(stat['month'], time.min)),
+                'totalValue': stat['totalValue'] or 0,
+                'quantity': stat['total_quantity'],
+                'averageValue': stat['totalValue'] / stat['total_quantity']
+            }
+            for stat in stats if stat['service__name']
+        ]
+        if not edges:
+            return rollup
+
+        # As pontas são meses diferentes dos completos: basta intercalar as duas listas
+        return sorted(rollup + edges, key=lambda stat: (stat['serviceName'], stat['date']))
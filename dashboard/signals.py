@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from appointment.models.appointment import Appointment
+from dashboard.cache import dashboard_cache
+from dashboard.services import ServiceStatsRollupService
+from service.models.service import Service
+
+
+def _contributing_month(status, deleted_at, appointment_date):
+    """Mês em que o agendamento entra no consolidado, ou None se não entra"""
+    if not ServiceStatsRollupService.contributes(status, deleted_at):
+        return None
+    return ServiceStatsRollupService.get_month(
+        Appointment._meta.get_field('appointment_date').to_python(appointment_date)
+    )
+
+
+@receiver(pre_save, sender=Appointment)
+def capture_appointment_state(sender, instance, raw=False, **kwargs):
+    instance._stats_previous_month = None
+    if raw or instance._state.adding:
+        return
+
+    previous = Appointment.objects.filter(pk=instance.pk).values(
+        'status', 'deleted_at', 'appointment_date'
+    ).first()
+    if previous:
+        instance._stats_previous_month = _contributing_month(**previous)
+
+
+@receiver(post_save, sender=Appointment)
+def update_appointment_stats(sender, instance, created, raw=False, **kwargs):
+    # Agendamentos novos ainda não têm serviços; eles entram pelo m2m_changed
+    if raw or created:
+        return
+
+    previous_month = getattr(instance, '_stats_previous_month', None)
+    current_month = _contributing_month(instance.status, instance.deleted_at, instance.appointment_date)
+    if previous_month == current_month:
+        return
+
+    months = {month for month in (previous_month, current_month) if month}
+    service_ids = list(instance.services.values_list('id', flat=True))
+    ServiceStatsRollupService.refresh(
+        (service_id, month) for service_id in service_ids for month in months
+    )
+
+
+@receiver(m2m_changed, sender=Appointment.services.through)
+def update_services_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Guarda o outro lado da relação, que não é informado no post_clear
+        related = instance.appointments if reverse else instance.services
+        instance._stats_cleared = set(related.values_list('pk', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_stats_cleared', set())
+    if not pk_set:
+        return
+
+    if not reverse:
+        month = _contributing_month(instance.status, instance.deleted_at, instance.appointment_date)
+        if month:
+            ServiceStatsRollupService.refresh((service_id, month) for service_id in pk_set)
+        return
+
+    dates = ServiceStatsRollupService.completed_appointments().filter(
+        pk__in=pk_set
+    ).values_list('appointment_date', flat=True)
+    ServiceStatsRollupService.refresh(
+        (instance.pk, ServiceStatsRollupService.get_month(appointment_date)) for appointment_date in dates
+    )
+
+
+@receiver(pre_delete, sender=Appointment)
+def capture_deleted_appointment(sender, instance, **kwargs):
+    month = _contributing_month(instance.status, instance.deleted_at, instance.appointment_date)
+    instance._stats_deleted_pairs = [
+        (service_id, month) for service_id in instance.services.values_list('id', flat=True)
+    ] if month else []
+
+
+@receiver(post_delete, sender=Appointment)
+def update_deleted_appointment_stats(sender, instance, **kwargs):
+    pairs = getattr(instance, '_stats_deleted_pairs', None)
+    if pairs:
+        ServiceStatsRollupService.refresh(pairs)
+
+
+@receiver(pre_save, sender=Service)
+def capture_service_cost(sender, instance, raw=False, **kwargs):
+    instance._stats_previous_cost = None
+    if not raw and not instance._state.adding:
+        instance._stats_previous_cost = Service.objects.filter(pk=instance.pk).values_list('cost', flat=True).first()
+
+
+@receiver(post_save, sender=Service)
+def update_service_cost_stats(sender, instance, created, raw=False, **kwargs):
+    previous_cost = getattr(instance, '_stats_previous_cost', None)
+    if raw or created or previous_cost is None:
+        return
+
+    cost = Service._meta.get_field('cost').to_python(instance.cost)
+    if cost != previous_cost:
+        ServiceStatsRollupService.refresh_service(instance.pk)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(m2m_changed, sender=Appointment.services.through)
+def invalidate_dashboard_cache(sender, action=None, raw=False, **kwargs):
+    if raw or (action and not action.startswith('post_')):
+        return
+    # Só após o commit, para que um recálculo concorrente não grave dados antigos na nova geração
+    transaction.on_commit(dashboard_cache.invalidate)
@@ -1,18 +1,29 @@
 # dashboard/tests.py
+import io
+import os
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
-from django.test import TestCase
+from unittest import skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
 from unittest.mock import patch, MagicMock
+from model_bakery import baker
 
 from core.models.role import Role
 from core.models.feature import Feature
 from appointment.models.appointment import Appointment
 from service.models.service import Service
 from authentication.models import User
+from dashboard.cache import dashboard_cache
+from dashboard.models import ServiceMonthlyStat
+from dashboard.services import DashboardDataService, ServiceStatsRollupService
 
 class DashboardTests(APITestCase):
     def setUp(self):
@@ -110,4 +121,269 @@ class DashboardTests(APITestCase):
         self.assertEqual(
             response.status_code, 
             status.HTTP_403_FORBIDDEN
-        )
\ No newline at end of file
+        )
+
+class DashboardRevenueTests(TestCase):
+    def setUp(self):
+        self.client_user = baker.make(User)
+        self.provider = baker.make(User)
+        self.service1 = baker.make(Service, cost=Decimal('100.00'), duration=30)
+        self.service2 = baker.make(Service, cost=Decimal('50.00'), duration=30)
+        self.deleted_service = baker.make(Service, cost=Decimal('999.00'), duration=30, deleted_at=timezone.now())
+
+    def _make_appointments(self, count, status=Appointment.Status.COMPLETED):
+        appointments = Appointment.objects.bulk_create([
+            Appointment(
+                client=self.client_user,
+                provider=self.provider,
+                appointment_date=timezone.now(),
+                status=status
+            )
+            for _ in range(count)
+        ])
+        Through = Appointment.services.through
+        Through.objects.bulk_create([
+            Through(appointment_id=appointment.id, service_id=service.id)
+            for appointment in appointments
+            for service in (self.service1, self.service2, self.deleted_service)
+        ], batch_size=5000)
+        return appointments
+
+    def test_total_revenue_ignores_deleted_services_and_other_status(self):
+        self._make_appointments(3)
+        self._make_appointments(2, status=Appointment.Status.PENDING)
+        baker.make(Appointment, client=self.client_user, provider=self.provider, status=Appointment.Status.COMPLETED)
+
+        appointments = DashboardDataService.get_filtered_appointments()
+        with self.assertNumQueries(1):
+            total = DashboardDataService.calculate_total_revenue(appointments)
+
+        self.assertEqual(total, Decimal('450.00'))
+
+    def test_total_revenue_without_appointments(self):
+        self.assertEqual(DashboardDataService.calculate_total_revenue(Appointment.objects.none()), 0)
+
+    @skipUnless(os.environ.get('RUN_BENCHMARKS'), 'Defina RUN_BENCHMARKS=1 para executar os benchmarks')
+    def test_total_revenue_benchmark(self):
+        self._make_appointments(100_000)
+        appointments = DashboardDataService.get_filtered_appointments()
+
+        started = time.perf_counter()
+        with self.assertNumQueries(1):
+            total = DashboardDataService.calculate_total_revenue(appointments)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(total, Decimal('15000000.00'))
+        self.assertLess(elapsed, 1.0)
+
+
+class ServiceMonthlyStatTests(TestCase):
+    def setUp(self):
+        self.client_user = baker.make(User)
+        self.provider = baker.make(User)
+        self.service1 = baker.make(Service, name='Corte', cost=Decimal('100.00'), duration=30)
+        self.service2 = baker.make(Service, name='Barba', cost=Decimal('40.00'), duration=30)
+
+        self.appointment = baker.make(
+            Appointment,
+            client=self.client_user,
+            provider=self.provider,
+            appointment_date=timezone.make_aware(datetime(2024, 3, 10, 10, 0)),
+            status=Appointment.Status.PENDING
+        )
+        self.appointment.services.add(self.service1)
+
+    def _stats(self):
+        return {
+            (stat.service_id, stat.month.isoformat()): (stat.total_value, stat.quantity)
+            for stat in ServiceMonthlyStat.objects.all()
+        }
+
+    def _assert_matches_live_query(self):
+        live = DashboardDataService.calculate_service_stats(DashboardDataService.get_filtered_appointments())
+        rollup = ServiceStatsRollupService.get_service_stats()
+        self.assertEqual(
+            [(s['serviceName'], s['date'], s['totalValue'], s['quantity']) for s in rollup],
+            [(s['serviceName'], s['date'], s['totalValue'], s['quantity']) for s in live]
+        )
+
+    def test_completing_and_reopening_appointment(self):
+        self.assertEqual(self._stats(), {})
+
+        self.appointment.status = Appointment.Status.COMPLETED
+        self.appointment.save()
+        self.assertEqual(self._stats(), {(self.service1.id, '2024-03-01'): (Decimal('100.00'), 1)})
+        self._assert_matches_live_query()
+
+        self.appointment.status = Appointment.Status.CANCELED
+        self.appointment.save()
+        self.assertEqual(self._stats(), {})
+
+    def test_service_and_date_changes_on_completed_appointment(self):
+        self.appointment.status = Appointment.Status.COMPLETED
+        self.appointment.save()
+
+        self.appointment.services.add(self.service2)
+        self.assertEqual(self._stats()[(self.service2.id, '2024-03-01')], (Decimal('40.00'), 1))
+
+        self.appointment.services.remove(self.service1)
+        self.assertNotIn((self.service1.id, '2024-03-01'), self._stats())
+
+        self.appointment.appointment_date = timezone.make_aware(datetime(2024, 4, 2, 9, 0))
+        self.appointment.save()
+        self.assertEqual(self._stats(), {(self.service2.id, '2024-04-01'): (Decimal('40.00'), 1)})
+
+        self.appointment.services.clear()
+        self.assertEqual(self._stats(), {})
+
+    def test_service_cost_change_and_rebuild(self):
+        self.appointment.status = Appointment.Status.COMPLETED
+        self.appointment.save()
+
+        self.service1.cost = Decimal('120.00')
+        self.service1.save()
+        self.assertEqual(self._stats(), {(self.service1.id, '2024-03-01'): (Decimal('120.00'), 1)})
+        self._assert_matches_live_query()
+
+        ServiceMonthlyStat.objects.all().delete()
+        call_command('rebuild_service_stats', stdout=io.StringIO())
+        self.assertEqual(self._stats(), {(self.service1.id, '2024-03-01'): (Decimal('120.00'), 1)})
+
+    def _complete(self, when, *services):
+        appointment = baker.make(
+            Appointment,
+            client=self.client_user,
+            provider=self.provider,
+            appointment_date=timezone.make_aware(when),
+            status=Appointment.Status.COMPLETED
+        )
+        appointment.services.add(*services)
+
+    def test_total_revenue_without_period_comes_from_rollup(self):
+        self._complete(datetime(2024, 3, 20, 10, 0), self.service1, self.service2)
+        self._complete(datetime(2024, 5, 1, 10, 0), self.service2)
+
+        with CaptureQueriesContext(connection) as queries:
+            total = ServiceStatsRollupService.get_total_revenue()
+
+        self.assertEqual(total, Decimal('180.00'))
+        self.assertEqual(len(queries), 1)
+        self.assertIn(ServiceMonthlyStat._meta.db_table, queries[0]['sql'])
+        self.assertNotIn(Appointment._meta.db_table, queries[0]['sql'])
+
+    def test_total_revenue_with_period_matches_live_query(self):
+        self._complete(datetime(2024, 1, 20, 10, 0), self.service1)
+        self._complete(datetime(2024, 2, 5, 10, 0), self.service1, self.service2)
+        self._complete(datetime(2024, 3, 15, 10, 0), self.service2)
+        self._complete(datetime(2024, 4, 10, 10, 0), self.service1)
+        self._complete(datetime(2024, 4, 25, 10, 0), self.service2)
+
+        periods = [
+            (datetime(2024, 1, 15), datetime(2024, 4, 15)),
+            (datetime(2024, 2, 1), datetime(2024, 4, 1)),
+            (datetime(2024, 3, 1), datetime(2024, 3, 20)),
+            (datetime(2024, 1, 25), datetime(2024, 2, 10)),
+        ]
+        for start, end in periods:
+            start, end = timezone.make_aware(start), timezone.make_aware(end)
+            appointments = DashboardDataService.get_filtered_appointments(start, end)
+            with self.subTest(start=start, end=end):
+                self.assertEqual(
+                    ServiceStatsRollupService.get_total_revenue(start, end),
+                    DashboardDataService.calculate_total_revenue(appointments)
+                )
+                self.assertEqual(
+                    [(s['serviceName'], s['date'], s['totalValue'], s['quantity'])
+                     for s in ServiceStatsRollupService.get_service_stats(start, end)],
+                    [(s['serviceName'], s['date'], s['totalValue'], s['quantity'])
+                     for s in DashboardDataService.calculate_service_stats(appointments)]
+                )
+
+    def test_service_stats_with_period_read_full_months_from_rollup(self):
+        for day in range(1, 28, 3):
+            self._complete(datetime(2024, 2, day, 10, 0), self.service1, self.service2)
+        self._complete(datetime(2024, 1, 25, 10, 0), self.service1)
+        start, end = timezone.make_aware(datetime(2024, 1, 20)), timezone.make_aware(datetime(2024, 3, 10))
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = ServiceStatsRollupService.get_service_stats(start, end)
+
+        self.assertEqual(
+            [(s['serviceName'], s['quantity']) for s in stats],
+            [('Barba', 9), ('Corte', 1), ('Corte', 9)]
+        )
+        # Fevereiro vem do consolidado: a consulta aos agendamentos cobre só as pontas
+        live = [query['sql'] for query in queries if Appointment._meta.db_table in query['sql']]
+        self.assertEqual(len(live), 1)
+        self.assertEqual(len(queries), 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'dashboard': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dashboard-tests'},
+})
+class DashboardCacheTests(APITestCase):
+    def setUp(self):
+        dashboard_cache.cache.clear()
+        dashboard_cache.reset_stats()
+
+        role = Role.objects.create(role_type='provider')
+        for name in ('list_dashboardstatsview', 'cache_stats_dashboardstatsview'):
+            role.features.add(Feature.objects.get_or_create(name=name)[0])
+        self.user = baker.make(User, role=role)
+        self.client.force_authenticate(user=self.user)
+
+        self.url = reverse('dashboard-stats-list')
+        self.service = baker.make(Service, cost=Decimal('100.00'), duration=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment = baker.make(
+                Appointment,
+                client=self.user,
+                provider=self.user,
+                appointment_date=timezone.now(),
+                status=Appointment.Status.COMPLETED
+            )
+            self.appointment.services.add(self.service)
+
+    def test_identical_requests_are_served_from_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totalRevenue'], '100.00')
+
+        with CaptureQueriesContext(connection) as context:
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.data, response.data)
+        self.assertFalse(any('appointment' in query['sql'] for query in context.captured_queries))
+
+        stats = self.client.get(reverse('dashboard-stats-cache-stats')).data
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hitRatio'], 0.5)
+        self.assertGreater(stats['lastRecomputeMs'], 0)
+
+    def test_equivalent_date_ranges_share_the_same_entry(self):
+        self.client.get(self.url, {'startDate': '2024-01-01T00:00:00-03:00', 'endDate': '2024-02-01T00:00:00-03:00'})
+        self.client.get(self.url, {'startDate': '2024-01-01T03:00:00+00:00', 'endDate': '2024-02-01T03:00:00+00:00'})
+
+        self.assertEqual(dashboard_cache.stats()['hits'], 1)
+
+    def test_appointment_change_invalidates_cache(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = Appointment.Status.CANCELED
+            self.appointment.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['totalRevenue'], '0.00')
+        self.assertEqual(dashboard_cache.stats()['misses'], 2)
+
+    def test_service_change_invalidates_cache(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.cost = Decimal('150.00')
+            self.service.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['totalRevenue'], '150.00')
@@ -11,7 +11,8 @@ from django.db.models.functions import TruncMonth
 
 from appointment.models.appointment import Appointment
 from core.models.mixins import DynamicViewPermissions
-from dashboard.services import DashboardDataService, DateValidationService
+from dashboard.cache import dashboard_cache
+from dashboard.services import DashboardDataService, DateValidationService, ServiceStatsRollupService
 from service.models.service import Service
 from .serializers import DashboardStatSerializer
 
@@ -54,25 +55,34 @@ class DashboardStatsView(ViewSet):
             # Validar datas
             start, end = DateValidationService.validate_date_range(start_date, end_date)
 
-            # Obter dados do dashboard
-            appointments = DashboardDataService.get_filtered_appointments(start, end)
-            dashboard_data = {
-                'totalRevenue': DashboardDataService.calculate_total_revenue(appointments),
-                'serviceStats': DashboardDataService.calculate_service_stats(appointments),
-                'currentAppointments': appointments.filter(
-                    status=Appointment.Status.IN_PROGRESS
-                ).order_by('appointment_date')[:5],
-                'upcomingAppointments': appointments.filter(
-                    appointment_date__gte=timezone.now(),
-                    status=Appointment.Status.PENDING
-                ).order_by('appointment_date')[:5]
-            }
-
-            # Serializar e retornar
-            serializer = DashboardStatSerializer(dashboard_data)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            data = dashboard_cache.get_or_compute(start, end, lambda: self._compute_stats(start, end))
+            return Response(data, status=status.HTTP_200_OK)
 
         except ValueError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _compute_stats(self, start, end):
+        appointments = DashboardDataService.get_filtered_appointments(start, end)
+        dashboard_data = {
+            # Meses completos (ou o histórico todo, sem período) vêm do consolidado mensal
+            'totalRevenue': ServiceStatsRollupService.get_total_revenue(start, end),
+            'serviceStats': ServiceStatsRollupService.get_service_stats(start, end),
+            'currentAppointments': appointments.filter(
+                status=Appointment.Status.IN_PROGRESS
+            ).order_by('appointment_date')[:5],
+            'upcomingAppointments': appointments.filter(
+                appointment_date__gte=timezone.now(),
+                status=Appointment.Status.PENDING
+            ).order_by('appointment_date')[:5]
+        }
+        return DashboardStatSerializer(dashboard_data).data
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """
+        Retorna as métricas do cache do dashboard neste processo
+        (taxa de acerto e tempo de recálculo)
+        """
+        return Response(dashboard_cache.stats(), status=status.HTTP_200_OK)
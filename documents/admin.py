@@ -1,16 +1,31 @@
 from django.contrib import admin
 
 from documents.models.document import Document
+from documents.models.document_blob import DocumentBlob
+from documents.models.document_preview import DocumentPreview
 from documents.models.document_template import DocumentTemplate, ServiceDocumentRequirement
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'file_name', 'file_type', 'document_type', 'created_at')
+    list_display = ('id', 'file_name', 'file_type', 'file_size', 'document_type', 'created_at')
     list_filter = ('document_type', 'file_type', 'created_at')
     search_fields = ('file_name', 'document_type')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('content_hash', 'mime_type', 'file_size', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
+
+@admin.register(DocumentBlob)
+class DocumentBlobAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'size', 'ref_count', 'created_at', 'last_uploaded_at')
+    search_fields = ('content_hash',)
+    readonly_fields = ('content_hash', 'size', 'ref_count', 'created_at', 'last_uploaded_at')
     ordering = ('-created_at',)
 
+@admin.register(DocumentPreview)
+class DocumentPreviewAdmin(admin.ModelAdmin):
+    list_display = ('document', 'kind', 'mime_type', 'width', 'height', 'page_count', 'created_at')
+    list_filter = ('kind', 'mime_type')
+    readonly_fields = ('source_hash', 'content_hash', 'metadata', 'created_at')
+
 @admin.register(DocumentTemplate)
 class DocumentTemplateAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'description', 'file_types', 'created_at', 'updated_at')
@@ -1,30 +1,36 @@
-import base64
-import mimetypes
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
 from documents.models.document import Document
+from documents.models.document_preview import DocumentPreview
+
+
+def get_thumbnail_url(document, request) -> str:
+    return f"{reverse('document-preview', args=[document.pk], request=request)}?variant=thumbnail"
+
 
 class DocumentSerializer(serializers.ModelSerializer):
     file = serializers.FileField(write_only=True)
-    file_content = serializers.SerializerMethodField()
+    file_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     file_size = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Document
-        fields = ['id', 'file', 'file_name', 'file_type', 'file_size', 'document_type', 'file_content', 'created_at', 'updated_at']
-        read_only_fields = ['file_name', 'file_type', 'file_content', 'file_size', 'created_at', 'updated_at']
-
-    def get_file_content(self, obj):
-        if not obj.file_content:
-            return None
-        
-        mime_type, _ = mimetypes.guess_type(obj.file_name)
-        if not mime_type:
-            mime_type = f'application/{obj.file_type}'
-        
-        base64_content = base64.b64encode(obj.file_content).decode('utf-8')
-        
-        return f'data:{mime_type};base64,{base64_content}'
+        fields = ['id', 'file', 'file_name', 'file_type', 'file_size', 'document_type', 'file_url', 'download_url', 'thumbnail_url', 'created_at', 'updated_at']
+        read_only_fields = ['file_name', 'file_type', 'file_url', 'download_url', 'thumbnail_url', 'file_size', 'created_at', 'updated_at']
+
+    # Não verifica has_content para não carregar a coluna legada adiada;
+    # documentos sem conteúdo respondem 404 no próprio endpoint
+    def get_file_url(self, obj):
+        return reverse('document-preview', args=[obj.pk], request=self.context.get('request'))
+
+    def get_download_url(self, obj):
+        return reverse('document-download', args=[obj.pk], request=self.context.get('request'))
+
+    def get_thumbnail_url(self, obj):
+        return get_thumbnail_url(obj, self.context.get('request'))
 
     def create(self, validated_data):
         file = validated_data.pop('file', None)
@@ -47,4 +53,9 @@ class DocumentSerializer(serializers.ModelSerializer):
         return document
     
     def get_file_size(self, obj):
-        return len(obj.file_content) if obj.file_content else 0
\ No newline at end of file
+        return obj.file_size or 0
+
+class DocumentPreviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentPreview
+        fields = ['kind', 'mime_type', 'width', 'height', 'page_count', 'metadata', 'created_at']
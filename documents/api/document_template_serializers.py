@@ -1,9 +1,9 @@
 import json
-import base64
-import mimetypes
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from documents.models.document_template import DocumentTemplate, ServiceDocumentRequirement
 from documents.models.document import Document
+from documents.api.document_serializers import get_thumbnail_url
 
 class DocumentTemplateSerializer(serializers.ModelSerializer):
     file = serializers.FileField(write_only=True, required=False, allow_null=True, allow_empty_file=True)
@@ -93,8 +93,8 @@ class DocumentTemplateSerializer(serializers.ModelSerializer):
             try:
                 if instance.document:
                     instance.document.file_name = file.name
-                    instance.document.file_content = file.read()
                     instance.document.file_type = file.name.split('.')[-1].lower()
+                    instance.document.set_content(file.read())
                     instance.document.save()
                 else:
                     from documents.models.document import Document
@@ -117,21 +117,18 @@ class DocumentTemplateSerializer(serializers.ModelSerializer):
 
     def get_document(self, obj):
         try:
-            if not obj.document or not obj.document.file_content:
+            if not obj.document:
                 return None
 
-            mime_type, _ = mimetypes.guess_type(obj.document.file_name)
-            if not mime_type:
-                mime_type = f'application/{obj.document.file_type}'
-
-            base64_content = base64.b64encode(obj.document.file_content).decode('utf-8')
-            
+            request = self.context.get('request')
             return {
                 'name': obj.document.file_name,
-                'type': mime_type,
+                'type': obj.document.mime_type or obj.document.guess_mime_type(),
                 'lastModified': int(obj.document.updated_at.timestamp() * 1000),
-                'size': len(obj.document.file_content),
-                'dataUrl': f'data:{mime_type};base64,{base64_content}'
+                'size': obj.document.file_size or 0,
+                'url': reverse('document-preview', args=[obj.document.pk], request=request),
+                'downloadUrl': reverse('document-download', args=[obj.document.pk], request=request),
+                'thumbnailUrl': get_thumbnail_url(obj.document, request)
             }
         except Exception:
             return None
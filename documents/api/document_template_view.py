@@ -10,7 +10,7 @@ from documents.models.document_template import DocumentTemplate
 from .document_template_serializers import DocumentTemplateSerializer
 
 class DocumentTemplateViewSet(DynamicPermissionModelViewSet):
-    queryset = DocumentTemplate.objects.filter(deleted_at=None)
+    queryset = DocumentTemplate.objects.alive().select_related('document').defer('document__file_content')
     serializer_class = DocumentTemplateSerializer
     parser_classes = (MultiPartParser, FormParser)
 
@@ -58,5 +58,7 @@ class DocumentTemplateViewSet(DynamicPermissionModelViewSet):
         return formatted_data
 
 class ServiceDocumentRequirementViewSet(DynamicPermissionModelViewSet):
-    queryset = ServiceDocumentRequirement.objects.all()
+    queryset = ServiceDocumentRequirement.objects.select_related(
+        'document_template__document'
+    ).defer('document_template__document__file_content')
     serializer_class = ServiceDocumentRequirementSerializer
\ No newline at end of file
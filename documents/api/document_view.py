@@ -1,14 +1,35 @@
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from core.models.mixins import DynamicPermissionModelViewSet
 from documents.models.document import Document
-from .document_serializers import DocumentSerializer
+from documents.models.document_preview import DocumentPreview
+from documents.services import DocumentPreviewService, DocumentStreamService
+from .document_serializers import DocumentPreviewSerializer, DocumentSerializer
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Aceita qualquer Accept nas ações de streaming; o corpo é montado pela própria view."""
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Respostas de erro continuam sendo enviadas como JSON
+        return JSONRenderer().render(data, renderer_context=renderer_context)
 
 
 class DocumentViewSet(DynamicPermissionModelViewSet):
-    queryset = Document.objects.filter(deleted_at=None)
+    queryset = Document.objects.alive()
     serializer_class = DocumentSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('download', 'preview'):
+            # Apenas os downloads precisam da coluna legada de conteúdo
+            return queryset.with_content()
+        return queryset
+
     def create(self, request, *args, **kwargs):
         try:
             file = request.FILES.get('file')
@@ -51,4 +72,28 @@ class DocumentViewSet(DynamicPermissionModelViewSet):
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
\ No newline at end of file
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def download(self, request, pk=None):
+        document = self.get_object()
+        if not document.has_content:
+            return Response({'error': 'Documento sem conteúdo'}, status=status.HTTP_404_NOT_FOUND)
+        return DocumentStreamService.build_response(request, document, as_attachment=True)
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def preview(self, request, pk=None):
+        """
+        Exibe o documento inline; com ?variant=thumbnail responde com o preview em cache
+        (miniatura para imagens, metadados para os demais tipos)
+        """
+        document = self.get_object()
+        if not document.has_content:
+            return Response({'error': 'Documento sem conteúdo'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get('variant') == 'thumbnail':
+            preview = DocumentPreviewService.get_preview(document)
+            if preview.kind == DocumentPreview.Kind.THUMBNAIL:
+                return DocumentPreviewService.build_thumbnail_response(request, preview)
+            return Response(DocumentPreviewSerializer(preview).data)
+
+        return DocumentStreamService.build_response(request, document, as_attachment=False)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from documents.services import DocumentBlobService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as referências dos blobs de documentos e remove do storage os que não são mais usados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--skip-recount', action='store_true',
+            help='Usa as contagens atuais, sem recalculá-las a partir dos documentos'
+        )
+
+    def handle(self, *args, **options):
+        if not options['skip_recount']:
+            recounted = DocumentBlobService.recount()
+            self.stdout.write(f'{recounted} blobs recontados.')
+
+        collected = DocumentBlobService.collect_unreferenced()
+        self.stdout.write(self.style.SUCCESS(f'{collected} blobs sem referências removidos.'))
+
+        orphans = DocumentBlobService.collect_orphans()
+        self.stdout.write(self.style.SUCCESS(f'{orphans} blobs sem registro removidos.'))
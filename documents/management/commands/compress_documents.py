@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from documents.models.document import Document
+from documents.storage import get_document_storage
+from documents.storage.compression import compression_ratio, should_compress
+
+
+class Command(BaseCommand):
+    help = 'Comprime no blob store o conteúdo dos documentos já gravados e registra a taxa de compressão, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Quantidade de documentos processados por lote'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        storage = get_document_storage()
+        pending = Document.objects.exclude(content_hash='').filter(compression_ratio__isnull=True).order_by('id')
+
+        processed = 0
+        compressed = 0
+        last_id = 0
+        while True:
+            rows = list(pending.filter(id__gt=last_id).values_list('id', 'file_name', 'file_size', 'content_hash')[:batch_size])
+            if not rows:
+                break
+
+            ratios = {}
+            for _, file_name, file_size, content_hash in rows:
+                # O blob é compartilhado por documentos com o mesmo conteúdo: cada hash é tratado uma vez
+                if content_hash in ratios:
+                    continue
+                if should_compress(file_name) and storage.compress(content_hash):
+                    compressed += 1
+                ratios[content_hash] = compression_ratio(file_size, storage.stored_size(content_hash)) or 1.0
+
+            for content_hash, ratio in ratios.items():
+                Document.objects.filter(content_hash=content_hash, compression_ratio__isnull=True).update(
+                    compression_ratio=ratio
+                )
+
+            processed += len(rows)
+            last_id = rows[-1][0]
+            self.stdout.write(f'{processed} documentos processados...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Compressão concluída: {processed} documentos processados, {compressed} blobs comprimidos.'
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from documents.models.document import Document
+from documents.services import DocumentBlobService
+from documents.storage import get_document_storage
+from documents.storage.compression import compression_ratio, should_compress
+
+
+class Command(BaseCommand):
+    help = 'Move o conteúdo dos documentos armazenado no banco (file_content) para o blob store, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Quantidade de documentos carregados em memória por lote'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        storage = get_document_storage()
+        pending = Document.objects.filter(content_hash='', file_content__isnull=False).order_by('id')
+
+        migrated = 0
+        last_id = 0
+        while True:
+            # Só o id é carregado para montar o lote; o conteúdo vem lote a lote
+            batch_ids = list(pending.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not batch_ids:
+                break
+
+            rows = Document.objects.filter(id__in=batch_ids).values_list(
+                'id', 'file_name', 'file_type', 'file_size', 'file_content'
+            )
+            for document_id, file_name, file_type, file_size, content in rows:
+                content = bytes(content or b'')
+                document = Document(file_name=file_name, file_type=file_type)
+                updates = {'file_content': None}
+                if content:
+                    content_hash = storage.save(content, should_compress(file_name))
+                    updates.update(
+                        content_hash=content_hash,
+                        file_size=file_size if file_size is not None else len(content),
+                        mime_type=document.guess_mime_type(),
+                        compression_ratio=compression_ratio(len(content), storage.stored_size(content_hash)),
+                    )
+                Document.objects.filter(id=document_id).update(**updates)
+                migrated += 1
+
+            last_id = batch_ids[-1]
+            self.stdout.write(f'{migrated} documentos migrados...')
+
+        # As atualizações em lote não passam pelos sinais que mantêm as contagens dos blobs
+        DocumentBlobService.recount()
+        self.stdout.write(self.style.SUCCESS(f'Migração concluída: {migrated} documentos movidos para o blob store.'))
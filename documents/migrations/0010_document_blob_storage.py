@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_alter_documenttemplate_document_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file_content',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count, Max, Q
+
+
+def backfill_document_blobs(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentBlob = apps.get_model('documents', 'DocumentBlob')
+
+    # Blobs usados apenas por documentos excluídos entram com contagem zero
+    # e são removidos pelo comando collect_document_blobs
+    rows = Document.objects.exclude(content_hash='').values('content_hash').annotate(
+        references=Count('id', filter=Q(deleted_at__isnull=True)),
+        size=Max('file_size')
+    ).order_by()
+
+    DocumentBlob.objects.bulk_create([
+        DocumentBlob(
+            content_hash=row['content_hash'],
+            size=row['size'] or 0,
+            ref_count=row['references']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_documentblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_document_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_backfill_document_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='compression_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_document_compression_ratio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(db_index=True, max_length=64)),
+                ('kind', models.CharField(choices=[('thumbnail', 'Thumbnail'), ('metadata', 'Metadata')], max_length=10)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('mime_type', models.CharField(blank=True, max_length=100)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preview', to='documents.document')),
+            ],
+        ),
+    ]
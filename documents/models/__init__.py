@@ -1,3 +1,5 @@
 from documents.models.document import Document
+from documents.models.document_blob import DocumentBlob
+from documents.models.document_preview import DocumentPreview
 from documents.models.document_template import ServiceDocumentRequirement
 from documents.models.document_template import DocumentTemplate
\ No newline at end of file
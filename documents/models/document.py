@@ -1,24 +1,44 @@
-import base64
-import os
+import io
+import mimetypes
+from typing import BinaryIO
 from django.db import models
-from django.core.validators import FileExtensionValidator
-from core.models.mixins import TimeStampedModel
+from core.models.mixins import TimeStampedModel, TimeStampedQuerySet
+from documents.storage import get_document_storage
+from documents.storage.compression import compression_ratio, should_compress
 
 def document_upload_path(instance, filename):
     return f'documents/{filename}'
 
+class DocumentQuerySet(TimeStampedQuerySet):
+    def with_content(self):
+        """Carrega também a coluna legada file_content, adiada por padrão"""
+        return self.defer(None)
+
+class DocumentManager(models.Manager.from_queryset(DocumentQuerySet)):
+    def get_queryset(self):
+        # O conteúdo só deve ser lido em downloads; as demais consultas não trazem o blob
+        return super().get_queryset().defer('file_content')
+
 class Document(TimeStampedModel):
     DOCUMENT_TYPES = (
         ('start', 'Start of Service'),
         ('end', 'End of Service'),
     )
-    
+
     file_name = models.CharField(max_length=255, blank=True)
-    file_content = models.BinaryField(blank=True)
+    # Legado: o conteúdo agora fica no blob store; registros antigos são movidos
+    # pelo comando migrate_document_blobs
+    file_content = models.BinaryField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     file_type = models.CharField(max_length=10, blank=True)
     file_size = models.IntegerField(blank=True, null=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    # Tamanho original / tamanho armazenado do blob (1.0 quando não há compressão)
+    compression_ratio = models.FloatField(blank=True, null=True)
     document_type = models.CharField(max_length=5, choices=DOCUMENT_TYPES)
-    
+
+    objects = DocumentManager()
+
     def __str__(self):
         return f"{self.file_name} - {self.document_type}"
 
@@ -26,5 +46,79 @@ class Document(TimeStampedModel):
     def file_extension(self):
         return self.file_name.split('.')[-1] if self.file_name else ''
 
+    @property
+    def has_content(self) -> bool:
+        return bool(self.content_hash or self.file_content)
+
+    def guess_mime_type(self) -> str:
+        mime_type, _ = mimetypes.guess_type(self.file_name)
+        return mime_type or f'application/{self.file_type}'
+
+    def _set_blob(self, content_hash: str, size: int) -> None:
+        self.content_hash = content_hash
+        self.file_content = None
+        self.file_size = size
+        self.mime_type = self.guess_mime_type()
+        self.compression_ratio = compression_ratio(size, get_document_storage().stored_size(content_hash))
+
+    def _store(self, write, size: int) -> None:
+        """
+        Grava o conteúdo com write() e registra o blob em seguida, antes de o documento
+        ser salvo: o período de carência do registro impede que o collect apague o
+        conteúdo enquanto a transação do chamador está aberta
+        """
+        from documents.services import DocumentBlobService
+
+        content_hash = write()
+        DocumentBlobService.register_upload(content_hash, size)
+        if not get_document_storage().exists(content_hash):
+            # Um collect concorrente apagou o conteúdo idêntico já armazenado antes do registro
+            write()
+        self._set_blob(content_hash, size)
+
+    def set_content(self, content: bytes) -> None:
+        """Grava o conteúdo no blob store (comprimido conforme o tipo) e guarda hash, tamanho e mime type"""
+        self._store(lambda: get_document_storage().save(content, should_compress(self.file_name)), len(content))
+
+    def set_uploaded_content(self, upload) -> None:
+        """
+        Associa o conteúdo de um arquivo enviado sem lê-lo inteiro: uploads já gravados
+        no blob store pelo DocumentStorageUploadHandler só informam o hash; os demais
+        são copiados em blocos
+        """
+        content_hash = getattr(upload, 'content_hash', None)
+        if content_hash:
+            # O handler já registrou o blob, fora da transação
+            self._set_blob(content_hash, upload.size)
+        else:
+            self._store(
+                lambda: get_document_storage().save_chunks(upload.chunks(), should_compress(self.file_name)),
+                upload.size
+            )
+
+    def open_content(self) -> BinaryIO:
+        if self.content_hash:
+            return get_document_storage().open(self.content_hash)
+        return io.BytesIO(bytes(self.file_content or b''))
+
+    def read_content(self) -> bytes:
+        with self.open_content() as content:
+            return content.read()
+
+    def save(self, *args, **kwargs):
+        # Conteúdo atribuído diretamente em file_content é movido para o blob store
+        if (
+            kwargs.get('update_fields') is None
+            and 'file_content' not in self.get_deferred_fields()
+            and self.file_content
+        ):
+            file_size = self.file_size
+            self.set_content(bytes(self.file_content))
+            if file_size is not None:
+                self.file_size = file_size
+        elif not self.mime_type and self.file_name:
+            self.mime_type = self.guess_mime_type()
+        super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['-updated_at']
\ No newline at end of file
+        ordering = ['-updated_at']
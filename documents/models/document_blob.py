@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class DocumentBlob(models.Model):
+    """
+    Conteúdo armazenado no blob store, identificado pelo SHA-256, com a contagem de
+    documentos ativos que o referenciam. Quando a contagem chega a zero o blob é
+    removido do storage (DocumentBlobService.collect).
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Uploads recentes ainda sem documento são preservados por um período de carência
+    last_uploaded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.content_hash} ({self.ref_count})"
@@ -0,0 +1,29 @@
+from django.db import models
+from documents.models.document import Document
+
+
+class DocumentPreview(models.Model):
+    """
+    Preview de um documento, gerado sob demanda na primeira requisição.
+
+    Imagens ganham uma miniatura gravada no blob store (content_hash); PDFs e
+    demais tipos guardam apenas metadados. source_hash identifica o conteúdo a
+    partir do qual o preview foi gerado, para detectar quando ele fica obsoleto.
+    """
+    class Kind(models.TextChoices):
+        THUMBNAIL = 'thumbnail'
+        METADATA = 'metadata'
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='preview')
+    source_hash = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    content_hash = models.CharField(max_length=64, blank=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.document_id} - {self.kind}"
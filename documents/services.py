@@ -0,0 +1,431 @@
+import hashlib
+import io
+import re
+from collections import Counter
+from datetime import timedelta
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from documents.models.document import Document
+from documents.models.document_blob import DocumentBlob
+from documents.models.document_preview import DocumentPreview
+from documents.storage import get_document_storage
+
+
+class DocumentStreamService:
+    """Serviço para envio do conteúdo dos documentos em streaming, com suporte a Range e ETag."""
+    CHUNK_SIZE = 64 * 1024
+    RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+    @staticmethod
+    def get_etag(document: Document) -> str:
+        """ETag forte: o próprio SHA-256 do conteúdo"""
+        content_hash = document.content_hash
+        if not content_hash:
+            digest = hashlib.sha256()
+            with document.open_content() as content:
+                for chunk in iter(lambda: content.read(DocumentStreamService.CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            content_hash = digest.hexdigest()
+        return f'"{content_hash}"'
+
+    @staticmethod
+    def etag_matches(header: str, etag: str) -> bool:
+        tags = [tag.strip() for tag in header.split(',')]
+        # If-None-Match usa comparação fraca
+        return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+    @staticmethod
+    def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+        """
+        Interpreta um cabeçalho Range de intervalo único e retorna (início, fim) inclusivos.
+        Retorna None quando o cabeçalho deve ser ignorado e lança ValueError quando
+        o intervalo não pode ser atendido.
+        """
+        match = DocumentStreamService.RANGE_PATTERN.match(header.strip())
+        if not match:
+            # Múltiplos intervalos ou unidade desconhecida: responde com o arquivo inteiro
+            return None
+
+        first, last = match.groups()
+        if not first and not last:
+            return None
+
+        if not first:
+            suffix = int(last)
+            if suffix == 0:
+                raise ValueError('Intervalo inválido')
+            return max(size - suffix, 0), size - 1
+
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError('Intervalo inválido')
+        return start, end
+
+    @staticmethod
+    def iter_content(content: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+        try:
+            content.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = content.read(min(DocumentStreamService.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            content.close()
+
+    @staticmethod
+    def build_response(request, document: Document, as_attachment: bool) -> HttpResponse:
+        etag = DocumentStreamService.get_etag(document)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and DocumentStreamService.etag_matches(if_none_match, etag):
+            response = HttpResponse(status=304)
+            response['ETag'] = etag
+            return response
+
+        content = document.open_content()
+        content.seek(0, 2)
+        size = content.tell()
+
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = DocumentStreamService.parse_range(range_header, size)
+            except ValueError:
+                content.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            DocumentStreamService.iter_content(content, start, end),
+            status=206 if byte_range else 200,
+            content_type=document.mime_type or document.guess_mime_type()
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = content_disposition_header(as_attachment, document.file_name)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return response
+
+
+class DocumentBlobService:
+    """
+    Serviço de contagem de referências dos blobs de documentos.
+
+    Cada documento ativo com content_hash é uma referência ao blob. As contagens
+    são ajustadas com F(); quando a última referência é excluída o blob é removido
+    do storage, após o commit e conferindo novamente os documentos sob lock.
+    """
+
+    @staticmethod
+    def get_upload_grace() -> timedelta:
+        """Período em que um blob enviado e ainda sem documento é preservado"""
+        return timedelta(seconds=getattr(settings, 'DOCUMENT_BLOB_UPLOAD_GRACE', 60 * 60))
+
+    @staticmethod
+    def register_upload(content_hash: str, size: int) -> None:
+        now = timezone.now()
+        if not DocumentBlob.objects.filter(pk=content_hash).update(last_uploaded_at=now):
+            DocumentBlob.objects.get_or_create(
+                pk=content_hash, defaults={'size': size, 'last_uploaded_at': now}
+            )
+
+    @staticmethod
+    def apply(content_hash: str, delta: int, size: Optional[int] = None) -> None:
+        if not content_hash or not delta:
+            return
+
+        if not DocumentBlob.objects.filter(pk=content_hash).update(ref_count=F('ref_count') + delta):
+            # Blob gravado fora do upload (set_content, migração): entra na primeira referência
+            _, created = DocumentBlob.objects.get_or_create(
+                pk=content_hash, defaults={'size': size or 0, 'ref_count': delta}
+            )
+            if not created:
+                DocumentBlob.objects.filter(pk=content_hash).update(ref_count=F('ref_count') + delta)
+
+        if delta < 0:
+            transaction.on_commit(lambda: DocumentBlobService.collect([content_hash]))
+
+    @staticmethod
+    def bulk_create(documents: List[Document]) -> List[Document]:
+        """Cria os documentos em uma única consulta, contando as referências que os sinais contariam"""
+        if not documents:
+            return []
+
+        created = Document.objects.bulk_create(documents)
+        hashes = Counter(document.content_hash for document in created if document.content_hash)
+        sizes = {document.content_hash: document.file_size for document in created}
+        for content_hash, quantity in hashes.items():
+            DocumentBlobService.apply(content_hash, quantity, sizes[content_hash])
+        return created
+
+    @staticmethod
+    def bulk_restore(documents: List[Document]) -> None:
+        """
+        Reativa em lote documentos excluídos logicamente, já com o novo conteúdo
+        (set_content/set_uploaded_content), contando as referências que os sinais contariam
+        """
+        if not documents:
+            return
+
+        now = timezone.now()
+        for document in documents:
+            document.deleted_at = None
+            document.updated_at = now
+        Document.objects.bulk_update(documents, [
+            'deleted_at', 'content_hash', 'file_content', 'file_size', 'mime_type', 'compression_ratio', 'updated_at'
+        ])
+
+        hashes = Counter(document.content_hash for document in documents if document.content_hash)
+        sizes = {document.content_hash: document.file_size for document in documents}
+        for content_hash, quantity in hashes.items():
+            DocumentBlobService.apply(content_hash, quantity, sizes[content_hash])
+
+    @staticmethod
+    def soft_delete(documents) -> int:
+        """Exclusão lógica em lote que mantém as contagens, já que update() não dispara sinais"""
+        documents = documents.alive()
+        hashes = Counter(documents.exclude(content_hash='').values_list('content_hash', flat=True))
+        deleted = documents.update(deleted_at=timezone.now(), updated_at=timezone.now())
+        for content_hash, quantity in hashes.items():
+            DocumentBlobService.apply(content_hash, -quantity)
+        return deleted
+
+    @staticmethod
+    def collect(content_hashes: Iterable[str]) -> int:
+        """Remove do storage os blobs sem referências; retorna quantos foram removidos"""
+        storage = get_document_storage()
+        uploaded_before = timezone.now() - DocumentBlobService.get_upload_grace()
+        collected = 0
+
+        for content_hash in content_hashes:
+            with transaction.atomic():
+                blob = DocumentBlob.objects.select_for_update().filter(
+                    Q(last_uploaded_at__isnull=True) | Q(last_uploaded_at__lt=uploaded_before),
+                    pk=content_hash,
+                    ref_count__lte=0
+                ).first()
+                if blob is None:
+                    continue
+
+                references = Document.objects.alive().filter(content_hash=content_hash).count()
+                if references:
+                    # Contagem divergente: corrige em vez de apagar um conteúdo em uso
+                    blob.ref_count = references
+                    blob.save(update_fields=['ref_count'])
+                    continue
+
+                storage.delete(content_hash)
+                blob.delete()
+                DocumentPreviewService.discard(content_hash)
+                collected += 1
+
+        return collected
+
+    @staticmethod
+    def recount() -> int:
+        """Recalcula as contagens a partir dos documentos; usado pelo comando collect_document_blobs"""
+        references = Document.objects.alive().filter(
+            content_hash=OuterRef('pk')
+        ).order_by().values('content_hash').annotate(total=Count('id')).values('total')
+
+        missing = dict(Document.objects.alive().exclude(content_hash='').exclude(
+            content_hash__in=DocumentBlob.objects.values('pk')
+        ).values_list('content_hash', 'file_size'))
+        DocumentBlob.objects.bulk_create(
+            [DocumentBlob(content_hash=content_hash, size=size or 0) for content_hash, size in missing.items()],
+            ignore_conflicts=True
+        )
+
+        return DocumentBlob.objects.update(ref_count=Coalesce(Subquery(references), Value(0)))
+
+    @staticmethod
+    def collect_unreferenced() -> int:
+        content_hashes = DocumentBlob.objects.filter(ref_count__lte=0).values_list('pk', flat=True)
+        return DocumentBlobService.collect(list(content_hashes))
+
+    @staticmethod
+    def collect_orphans() -> int:
+        """
+        Remove do storage os conteúdos sem registro em DocumentBlob nem em previews,
+        gravados antes do período de carência: sobras de transações desfeitas depois da gravação
+        """
+        storage = get_document_storage()
+        written_before = (timezone.now() - DocumentBlobService.get_upload_grace()).timestamp()
+        candidates = [content_hash for content_hash, written_at in storage.iter_blobs() if written_at < written_before]
+        known = set()
+        for start in range(0, len(candidates), 500):
+            batch = candidates[start:start + 500]
+            known.update(DocumentBlob.objects.filter(pk__in=batch).values_list('pk', flat=True))
+            known.update(DocumentPreview.objects.filter(content_hash__in=batch).values_list('content_hash', flat=True))
+
+        collected = 0
+        for content_hash in candidates:
+            if content_hash not in known:
+                storage.delete(content_hash)
+                collected += 1
+        return collected
+
+
+class DocumentPreviewService:
+    """
+    Serviço de geração e cache dos previews de documentos.
+
+    Imagens ganham uma miniatura gerada com Pillow (se ele faltar, ficam só com metadados)
+    e PDFs, número de páginas, versão e título. O preview é gerado na primeira
+    requisição e regenerado quando o conteúdo do documento muda.
+    """
+    PDF_SCAN_OVERLAP = 64
+    PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+    PDF_TITLE_PATTERN = re.compile(rb'/Title\s*\(([^)]{0,200})\)')
+    PDF_VERSION_PATTERN = re.compile(rb'^%PDF-(\d\.\d)')
+
+    @staticmethod
+    def get_thumbnail_size() -> int:
+        return getattr(settings, 'DOCUMENT_PREVIEW_SIZE', 256)
+
+    @staticmethod
+    def get_preview(document: Document) -> DocumentPreview:
+        preview = DocumentPreview.objects.filter(document=document).first()
+        if preview and preview.source_hash == document.content_hash and (
+            preview.kind != DocumentPreview.Kind.THUMBNAIL
+            or get_document_storage().exists(preview.content_hash)
+        ):
+            return preview
+
+        stale_hash = preview.content_hash if preview else ''
+        preview, _ = DocumentPreview.objects.update_or_create(
+            document=document,
+            defaults=DocumentPreviewService.generate(document)
+        )
+        if stale_hash and stale_hash != preview.content_hash:
+            DocumentPreviewService.release_blob(stale_hash)
+        return preview
+
+    @staticmethod
+    def generate(document: Document) -> dict:
+        mime_type = document.mime_type or document.guess_mime_type()
+        fields = {
+            'source_hash': document.content_hash,
+            'kind': DocumentPreview.Kind.METADATA,
+            'content_hash': '',
+            'mime_type': mime_type,
+            'width': None,
+            'height': None,
+            'page_count': None,
+            'metadata': {'name': document.file_name, 'size': document.file_size},
+        }
+
+        if mime_type.startswith('image/'):
+            fields.update(DocumentPreviewService._image_thumbnail(document, fields['metadata']))
+        elif mime_type == 'application/pdf':
+            fields.update(DocumentPreviewService._pdf_metadata(document, fields['metadata']))
+        return fields
+
+    @staticmethod
+    def _image_thumbnail(document: Document, metadata: dict) -> dict:
+        try:
+            from PIL import Image
+        except ImportError:
+            # Pillow faz parte do requirements.txt; sem ele o preview fica só com os metadados
+            return {}
+
+        size = DocumentPreviewService.get_thumbnail_size()
+        try:
+            with document.open_content() as content, Image.open(content) as image:
+                metadata.update(width=image.width, height=image.height)
+                image.draft('RGB', (size, size))
+                image.thumbnail((size, size))
+                transparent = image.mode in ('RGBA', 'LA', 'P')
+                thumbnail = image.convert('RGBA' if transparent else 'RGB')
+
+                output = io.BytesIO()
+                if transparent:
+                    thumbnail.save(output, format='PNG', optimize=True)
+                else:
+                    thumbnail.save(output, format='JPEG', quality=80)
+        except (OSError, Image.DecompressionBombError):
+            # Imagem inválida ou grande demais: fica só com os metadados
+            return {}
+
+        return {
+            'kind': DocumentPreview.Kind.THUMBNAIL,
+            'content_hash': get_document_storage().save(output.getvalue()),
+            'mime_type': 'image/png' if transparent else 'image/jpeg',
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+        }
+
+    @staticmethod
+    def _pdf_metadata(document: Document, metadata: dict) -> dict:
+        """
+        Lê o PDF em blocos contando os objetos /Page e buscando versão e título.
+        A contagem é aproximada em PDFs com object streams comprimidos.
+        """
+        pages = 0
+        tail = b''
+        with document.open_content() as content:
+            for chunk in iter(lambda: content.read(DocumentStreamService.CHUNK_SIZE), b''):
+                data = tail + chunk
+                if not tail:
+                    version = DocumentPreviewService.PDF_VERSION_PATTERN.match(data)
+                    if version:
+                        metadata['version'] = version.group(1).decode()
+
+                # Ocorrências inteiramente dentro do trecho repetido já foram contadas no bloco anterior
+                pages += sum(
+                    1 for match in DocumentPreviewService.PDF_PAGE_PATTERN.finditer(data)
+                    if match.end() > len(tail)
+                )
+                if 'title' not in metadata:
+                    title = DocumentPreviewService.PDF_TITLE_PATTERN.search(data)
+                    if title:
+                        metadata['title'] = title.group(1).decode('latin-1')
+
+                tail = data[-DocumentPreviewService.PDF_SCAN_OVERLAP:]
+
+        return {'page_count': pages or None}
+
+    @staticmethod
+    def build_thumbnail_response(request, preview: DocumentPreview) -> HttpResponse:
+        etag = f'"{preview.content_hash}"'
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and DocumentStreamService.etag_matches(if_none_match, etag):
+            response = HttpResponse(status=304)
+        else:
+            with get_document_storage().open(preview.content_hash) as content:
+                response = HttpResponse(content.read(), content_type=preview.mime_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+    @staticmethod
+    def release_blob(content_hash: str) -> None:
+        """Remove a miniatura do storage se nenhum outro preview ou documento usa o mesmo conteúdo"""
+        if (
+            DocumentPreview.objects.filter(content_hash=content_hash).exists()
+            or DocumentBlob.objects.filter(pk=content_hash).exists()
+        ):
+            return
+        get_document_storage().delete(content_hash)
+
+    @staticmethod
+    def discard(source_hash: str) -> None:
+        """Apaga os previews gerados a partir de um conteúdo que foi recolhido; as miniaturas são liberadas pelo sinal post_delete"""
+        DocumentPreview.objects.filter(source_hash=source_hash).delete()
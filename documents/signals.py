@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from documents.models.document import Document
+from documents.models.document_preview import DocumentPreview
+from documents.services import DocumentBlobService, DocumentPreviewService
+
+
+def _reference(content_hash, deleted_at):
+    """Blob referenciado pelo documento, ou None se ele não conta como referência"""
+    return content_hash if content_hash and deleted_at is None else None
+
+
+@receiver(pre_save, sender=Document)
+def capture_document_blob(sender, instance, raw=False, **kwargs):
+    instance._blob_previous = None
+    if raw or instance._state.adding:
+        return
+    previous = Document.objects.filter(pk=instance.pk).values('content_hash', 'deleted_at').first()
+    if previous:
+        instance._blob_previous = _reference(**previous)
+
+
+@receiver(post_save, sender=Document)
+def update_document_blob(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, '_blob_previous', None)
+    current = _reference(instance.content_hash, instance.deleted_at)
+    if previous == current:
+        return
+
+    DocumentBlobService.apply(current, 1, instance.file_size)
+    DocumentBlobService.apply(previous, -1)
+
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    DocumentBlobService.apply(_reference(instance.content_hash, instance.deleted_at), -1)
+
+
+@receiver(post_delete, sender=DocumentPreview)
+def release_preview_blob(sender, instance, **kwargs):
+    # O preview também é apagado em cascata quando o documento é excluído (mesmo logicamente)
+    if instance.content_hash:
+        transaction.on_commit(lambda: DocumentPreviewService.release_blob(instance.content_hash))
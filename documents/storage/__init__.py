@@ -0,0 +1,22 @@
+from functools import lru_cache
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from documents.storage.base import BlobWriter, DocumentStorage
+from documents.storage.local import LocalDocumentStorage
+
+
+@lru_cache(maxsize=None)
+def get_document_storage() -> DocumentStorage:
+    """Instancia o backend configurado em settings.DOCUMENT_STORAGE"""
+    config = getattr(settings, 'DOCUMENT_STORAGE', {})
+    backend = import_string(config.get('BACKEND', 'documents.storage.local.LocalDocumentStorage'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+def _reset_document_storage(setting, **kwargs):
+    if setting == 'DOCUMENT_STORAGE':
+        get_document_storage.cache_clear()
+
+
+setting_changed.connect(_reset_document_storage)
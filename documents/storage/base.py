@@ -0,0 +1,66 @@
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+
+class BlobWriter:
+    """Escrita incremental de um blob; o hash só é conhecido ao final (commit)."""
+
+    size = 0
+
+    def write(self, chunk: bytes) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> str:
+        """Finaliza a escrita e retorna o SHA-256 do conteúdo"""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Descarta o que já foi escrito"""
+        raise NotImplementedError
+
+
+class DocumentStorage:
+    """
+    Interface dos backends que armazenam o conteúdo dos documentos,
+    endereçado pelo SHA-256 do próprio conteúdo.
+    """
+    chunk_size = 64 * 1024
+
+    def open_writer(self, compress: bool = False) -> BlobWriter:
+        raise NotImplementedError
+
+    def open(self, content_hash: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def exists(self, content_hash: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, content_hash: str) -> None:
+        raise NotImplementedError
+
+    def iter_blobs(self) -> Iterator[Tuple[str, float]]:
+        """
+        Hash e horário da última gravação (timestamp) de cada blob armazenado; usado para
+        recolher conteúdos sem registro. Backends que não listam o conteúdo não retornam nada
+        """
+        return iter(())
+
+    def stored_size(self, content_hash: str) -> Optional[int]:
+        """Espaço ocupado pelo blob no storage, já comprimido"""
+        return None
+
+    def compress(self, content_hash: str) -> bool:
+        """Comprime um blob gravado sem compressão; retorna False se nada mudou"""
+        return False
+
+    def save_chunks(self, chunks: Iterable[bytes], compress: bool = False) -> str:
+        writer = self.open_writer(compress)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def save(self, content: bytes, compress: bool = False) -> str:
+        return self.save_chunks([content], compress)
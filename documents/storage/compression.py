@@ -0,0 +1,97 @@
+import io
+import struct
+import zlib
+from typing import BinaryIO, Optional
+from django.conf import settings
+
+# Tipos que já são comprimidos (jpg, png...) ficam de fora: zlib não reduz o tamanho
+DEFAULT_COMPRESSIBLE_TYPES = ['pdf', 'doc', 'docx', 'txt', 'rtf', 'odt', 'csv', 'xml']
+
+# Blobs comprimidos começam com o tamanho original, para que seek(0, SEEK_END) não precise descomprimir
+HEADER = struct.Struct('>Q')
+
+
+def should_compress(file_name: str) -> bool:
+    extension = file_name.rsplit('.', 1)[-1].lower() if file_name and '.' in file_name else ''
+    return extension in getattr(settings, 'DOCUMENT_COMPRESSIBLE_TYPES', DEFAULT_COMPRESSIBLE_TYPES)
+
+
+def compression_ratio(size: Optional[int], stored_size: Optional[int]) -> Optional[float]:
+    """Tamanho original dividido pelo armazenado (2.0 = metade do espaço)"""
+    if not size or not stored_size:
+        return None
+    return round(size / stored_size, 3)
+
+
+class ZlibReader(io.BufferedIOBase):
+    """
+    Leitura em streaming de um blob comprimido com zlib, com suporte a seek.
+
+    Avançar descomprime e descarta até a posição pedida; voltar reinicia a
+    descompressão do começo. A memória usada fica limitada a alguns blocos.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, file: BinaryIO):
+        super().__init__()
+        self._file = file
+        self.size = HEADER.unpack(file.read(HEADER.size))[0]
+        self._position = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._file.seek(HEADER.size)
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+        self._offset = 0
+        self._eof = False
+
+    def _next(self, size: int) -> bytes:
+        while len(self._buffer) < size and not self._eof:
+            data = self._decompressor.unconsumed_tail or self._file.read(self.CHUNK_SIZE)
+            if not data:
+                self._buffer += self._decompressor.flush()
+                self._eof = True
+                break
+            self._buffer += self._decompressor.decompress(data, self.CHUNK_SIZE)
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._offset += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if self._position < self._offset:
+            self._reset()
+        while self._offset < self._position:
+            if not self._next(min(self.CHUNK_SIZE, self._position - self._offset)):
+                break
+
+        if size is None or size < 0:
+            size = max(self.size - self._position, 0)
+        data = self._next(size)
+        self._position = self._offset
+        return data
+
+    read1 = read
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zlib
+from typing import BinaryIO, Iterator, Optional, Tuple
+from documents.storage.base import BlobWriter, DocumentStorage
+from documents.storage.compression import HEADER, ZlibReader
+
+
+class LocalBlobWriter(BlobWriter):
+    def __init__(self, storage: 'LocalDocumentStorage', compress: bool = False):
+        self._storage = storage
+        os.makedirs(storage.temp_dir, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=storage.temp_dir)
+        self._file = os.fdopen(fd, 'wb')
+        self._hash = hashlib.sha256()
+        self._compressor = zlib.compressobj(storage.compression_level) if compress else None
+        self.size = 0
+        if self._compressor:
+            # O tamanho original só é conhecido no final; o cabeçalho é preenchido em _finish
+            self._file.write(HEADER.pack(0))
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        self._file.write(self._compressor.compress(chunk) if self._compressor else chunk)
+
+    def finalize(self) -> Tuple[str, str]:
+        """
+        Conclui a escrita e retorna o hash do conteúdo e o caminho do arquivo temporário,
+        que passa a ser responsabilidade de quem chamou (no lugar de commit/abort)
+        """
+        if self._compressor:
+            self._file.write(self._compressor.flush())
+            self._file.seek(0)
+            self._file.write(HEADER.pack(self.size))
+        self._file.close()
+        return self._hash.hexdigest(), self._temp_path
+
+    def _store(self, content_hash: str) -> None:
+        """Move o arquivo temporário para o destino, sem comprimir quando isso não reduz o tamanho"""
+        if self._compressor and os.path.getsize(self._temp_path) >= self.size:
+            path = self._storage.path(content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(self._temp_path, 'rb') as compressed, open(self._temp_path + '.raw', 'wb') as raw:
+                shutil.copyfileobj(ZlibReader(compressed), raw, ZlibReader.CHUNK_SIZE)
+            os.remove(self._temp_path)
+            os.replace(self._temp_path + '.raw', path)
+            return
+
+        path = self._storage.compressed_path(content_hash) if self._compressor else self._storage.path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._temp_path, path)
+
+    def commit(self) -> str:
+        content_hash, temp_path = self.finalize()
+        if self._storage.exists(content_hash):
+            # Conteúdo idêntico já armazenado: renova a data de gravação, que protege
+            # o blob de ser recolhido antes de ser registrado
+            os.remove(temp_path)
+            self._storage.touch(content_hash)
+        else:
+            self._store(content_hash)
+        return content_hash
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+class LocalDocumentStorage(DocumentStorage):
+    """
+    Armazena os blobs no sistema de arquivos local, distribuídos em subdiretórios
+    pelos primeiros caracteres do hash (ab/cd/abcd...). Blobs comprimidos com zlib
+    recebem a extensão .zz e são descomprimidos na leitura.
+    """
+
+    def __init__(self, location: str, compression_level: int = 6):
+        self.location = location
+        self.temp_dir = os.path.join(location, 'tmp')
+        self.compression_level = compression_level
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.location, content_hash[:2], content_hash[2:4], content_hash)
+
+    def compressed_path(self, content_hash: str) -> str:
+        return self.path(content_hash) + '.zz'
+
+    def open_writer(self, compress: bool = False) -> LocalBlobWriter:
+        return LocalBlobWriter(self, compress)
+
+    def open(self, content_hash: str) -> BinaryIO:
+        try:
+            return ZlibReader(open(self.compressed_path(content_hash), 'rb'))
+        except FileNotFoundError:
+            return open(self.path(content_hash), 'rb')
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self.compressed_path(content_hash)) or os.path.exists(self.path(content_hash))
+
+    def touch(self, content_hash: str) -> None:
+        for path in (self.compressed_path(content_hash), self.path(content_hash)):
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                continue
+
+    def iter_blobs(self) -> Iterator[Tuple[str, float]]:
+        for directory, subdirectories, files in os.walk(self.location):
+            if directory == self.location:
+                # Arquivos temporários de escritas em andamento
+                subdirectories[:] = [name for name in subdirectories if name != 'tmp']
+                continue
+            for name in files:
+                content_hash = name[:-3] if name.endswith('.zz') else name
+                if len(content_hash) == 64:
+                    yield content_hash, os.path.getmtime(os.path.join(directory, name))
+
+    def stored_size(self, content_hash: str) -> Optional[int]:
+        for path in (self.compressed_path(content_hash), self.path(content_hash)):
+            try:
+                return os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def compress(self, content_hash: str) -> bool:
+        raw_path = self.path(content_hash)
+        if not os.path.exists(raw_path):
+            return False
+
+        writer = self.open_writer(compress=True)
+        try:
+            with open(raw_path, 'rb') as content:
+                for chunk in iter(lambda: content.read(self.chunk_size), b''):
+                    writer.write(chunk)
+        except Exception:
+            writer.abort()
+            raise
+
+        written_hash, temp_path = writer.finalize()
+        if written_hash != content_hash or os.path.getsize(temp_path) >= writer.size:
+            # Conteúdo divergente do hash ou que não reduz com compressão: mantém o original
+            os.remove(temp_path)
+            return False
+
+        os.replace(temp_path, self.compressed_path(content_hash))
+        os.remove(raw_path)
+        return True
+
+    def delete(self, content_hash: str) -> None:
+        for path in (self.compressed_path(content_hash), self.path(content_hash)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,12 +1,28 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.core.management import call_command
 from django.db import DataError
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.exceptions import ValidationError
 from core.models.feature import Feature
 from core.models.role import Role
 from documents.models.document import Document
+from documents.models.document_blob import DocumentBlob
+from documents.api.document_serializers import DocumentSerializer
+from documents.models.document_preview import DocumentPreview
+from documents.services import DocumentBlobService, DocumentPreviewService, DocumentStreamService
+from documents.storage import get_document_storage
+from documents.uploads import DocumentStorageUploadHandler, StoredUploadedFile
+from service.models.document_service import DocumentService
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from model_bakery import baker
+from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 
@@ -118,3 +134,500 @@ class DocumentViewSetTests(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Document.objects.filter(deleted_at=None).count(), 0)
+
+
+class DocumentBlobStorageTests(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        })
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def test_content_is_stored_outside_the_row(self):
+        document = Document.objects.create(
+            file_name="contrato.pdf",
+            file_content=b"conteudo do contrato",
+            file_type="pdf",
+            document_type="start"
+        )
+
+        self.assertEqual(document.content_hash, hashlib.sha256(b"conteudo do contrato").hexdigest())
+        self.assertEqual(document.file_size, len(b"conteudo do contrato"))
+        self.assertEqual(document.mime_type, "application/pdf")
+        self.assertIsNone(Document.objects.values_list('file_content', flat=True).get(id=document.id))
+        self.assertEqual(Document.objects.get(id=document.id).read_content(), b"conteudo do contrato")
+
+        path = get_document_storage().path(document.content_hash)
+        self.assertTrue(path.startswith(os.path.join(self.storage_dir, document.content_hash[:2], document.content_hash[2:4])))
+
+    def test_migrate_command_moves_legacy_rows_in_batches(self):
+        contents = [f"documento {i}".encode() for i in range(5)]
+        for i, content in enumerate(contents):
+            document = Document.objects.create(file_name=f"doc{i}.pdf", file_type="pdf", document_type="start")
+            Document.objects.filter(id=document.id).update(file_content=content)
+
+        call_command('migrate_document_blobs', batch_size=2, stdout=io.StringIO())
+
+        for document in Document.objects.filter(file_name__startswith="doc"):
+            self.assertTrue(document.content_hash)
+            self.assertIsNone(document.file_content)
+            self.assertIn(document.read_content(), contents)
+
+
+    def test_default_queryset_defers_legacy_content(self):
+        document = Document.objects.create(file_name="legado.pdf", file_type="pdf", document_type="start")
+        Document.objects.filter(id=document.id).update(file_content=b"conteudo legado")
+
+        document = Document.objects.get(id=document.id)
+        self.assertIn('file_content', document.get_deferred_fields())
+
+        document = Document.objects.with_content().get(id=document.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(document.read_content(), b"conteudo legado")
+
+    def test_soft_delete_of_deferred_instance(self):
+        document = Document.objects.create(file_name="apagar.pdf", file_content=b"conteudo", file_type="pdf", document_type="start")
+
+        Document.objects.get(id=document.id).delete()
+
+        deleted = Document.objects.get(file_name="apagar.pdf")
+        self.assertIsNotNone(deleted.deleted_at)
+        self.assertEqual(deleted.read_content(), b"conteudo")
+
+
+class DocumentDownloadTests(APITestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        })
+        self.settings_override.enable()
+
+        features = [
+            Feature.objects.get_or_create(name="documents.download_document")[0],
+            Feature.objects.get_or_create(name="documents.preview_document")[0],
+        ]
+        role = Role.objects.create(name="Document Reader", role_type="client")
+        role.features.set(features)
+        self.client.force_authenticate(user=baker.make("authentication.User", role=role, is_active=True))
+
+        self.content = bytes(range(256)) * 4
+        self.document = Document.objects.create(
+            file_name="relatorio.pdf",
+            file_content=self.content,
+            file_type="pdf",
+            document_type="start"
+        )
+        self.url = reverse('document-download', args=[self.document.id])
+        self.etag = f'"{self.document.content_hash}"'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def test_download_streams_full_content(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_preview_is_inline(self):
+        response = self.client.get(reverse('document-preview', args=[self.document.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+
+    def test_if_none_match_returns_not_modified(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], self.etag)
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-16')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-16:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_stale_if_range_ignores_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outro"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+
+class DocumentUploadHandlerTests(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        })
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def _upload(self, content, max_file_size):
+        request = RequestFactory().post('/', {'file': SimpleUploadedFile('laudo.pdf', content)})
+        handler = DocumentStorageUploadHandler(request, max_file_size=max_file_size)
+        handler.chunk_size = 1024
+        request.upload_handlers = [handler]
+        return request.FILES['file']
+
+    def _stored_files(self):
+        return [name for _, _, files in os.walk(self.storage_dir) for name in files]
+
+    def test_upload_is_streamed_into_storage(self):
+        content = os.urandom(10 * 1024)
+        upload = self._upload(content, max_file_size=len(content))
+
+        self.assertIsInstance(upload, StoredUploadedFile)
+        self.assertEqual(upload.size, len(content))
+        self.assertEqual(upload.content_hash, hashlib.sha256(content).hexdigest())
+        with upload.open() as stored:
+            self.assertEqual(stored.read(), content)
+
+        document = Document(file_name=upload.name, file_type='pdf', document_type='start')
+        document.set_uploaded_content(upload)
+        document.save()
+        self.assertEqual(document.read_content(), content)
+        self.assertEqual(document.file_size, len(content))
+        self.assertEqual(self._stored_files(), [upload.content_hash])
+
+    def test_oversized_upload_is_discarded_while_streaming(self):
+        upload = self._upload(os.urandom(10 * 1024), max_file_size=4 * 1024)
+
+        self.assertTrue(upload.exceeded_max_size)
+        self.assertEqual(upload.size, 10 * 1024)
+        self.assertEqual(self._stored_files(), [])
+        with self.assertRaises(ValidationError):
+            DocumentService.validate_file_size(upload, 4 * 1024)
+
+
+class DocumentBlobReferenceTests(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        # Sem carência, os blobs recém-gravados já podem ser recolhidos
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        }, DOCUMENT_BLOB_UPLOAD_GRACE=0)
+        self.settings_override.enable()
+        self.storage = get_document_storage()
+        self.content = b"mesmo conteudo enviado varias vezes"
+        self.content_hash = hashlib.sha256(self.content).hexdigest()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def _create(self, content=None):
+        return Document.objects.create(
+            file_name="laudo.pdf",
+            file_content=content or self.content,
+            file_type="pdf",
+            document_type="start"
+        )
+
+    def _ref_count(self):
+        return DocumentBlob.objects.get(pk=self.content_hash).ref_count
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self._create(), self._create()
+
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(self._ref_count(), 2)
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+
+    def test_blob_is_collected_when_last_reference_is_deleted(self):
+        first, second = self._create(), self._create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self._ref_count(), 1)
+        self.assertTrue(self.storage.exists(self.content_hash))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.storage.exists(self.content_hash))
+        self.assertFalse(DocumentBlob.objects.filter(pk=self.content_hash).exists())
+
+    def test_bulk_soft_delete_and_restore_in_same_transaction(self):
+        documents = [self._create(), self._create()]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DocumentBlobService.soft_delete(Document.objects.filter(pk__in=[doc.pk for doc in documents]))
+            self.assertEqual(self._ref_count(), 0)
+
+            restored = Document.objects.get(pk=documents[0].pk)
+            restored.deleted_at = None
+            restored.save(update_fields=['deleted_at', 'updated_at'])
+
+        self.assertEqual(self._ref_count(), 1)
+        self.assertTrue(self.storage.exists(self.content_hash))
+
+    def test_content_change_moves_reference(self):
+        document = self._create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.file_content = b"outro conteudo"
+            document.save()
+
+        self.assertFalse(self.storage.exists(self.content_hash))
+        self.assertEqual(DocumentBlob.objects.get(pk=document.content_hash).ref_count, 1)
+
+    def test_collect_command_recounts_and_removes_stale_uploads(self):
+        document = self._create()
+        DocumentBlob.objects.filter(pk=self.content_hash).update(ref_count=0)
+
+        orphan_hash = self.storage.save(b"upload nunca usado")
+        DocumentBlobService.register_upload(orphan_hash, 18)
+
+        call_command('collect_document_blobs', stdout=io.StringIO())
+
+        self.assertEqual(self._ref_count(), 1)
+        self.assertTrue(self.storage.exists(document.content_hash))
+        self.assertFalse(self.storage.exists(orphan_hash))
+
+    def test_content_is_registered_when_written(self):
+        with override_settings(DOCUMENT_BLOB_UPLOAD_GRACE=60 * 60), self.captureOnCommitCallbacks(execute=True):
+            document = self._create()
+            document.delete()
+
+        # Ainda no período de carência: o blob recém-gravado não é recolhido
+        self.assertIsNotNone(DocumentBlob.objects.get(pk=self.content_hash).last_uploaded_at)
+        self.assertTrue(self.storage.exists(self.content_hash))
+
+    def test_content_removed_by_concurrent_collect_is_written_again(self):
+        self.storage.save(self.content)
+        register_upload = DocumentBlobService.register_upload
+
+        def collect_then_register(content_hash, size):
+            # O collect apaga o conteúdo idêntico depois que a gravação o encontrou no storage
+            self.storage.delete(content_hash)
+            register_upload(content_hash, size)
+
+        with mock.patch.object(DocumentBlobService, 'register_upload', side_effect=collect_then_register):
+            document = self._create()
+
+        self.assertEqual(Document.objects.get(pk=document.pk).read_content(), self.content)
+
+    def test_collect_orphans_removes_unregistered_content(self):
+        document = self._create()
+        orphan_hash = self.storage.save(b"gravado em uma transacao desfeita")
+        thumbnail_hash = self.storage.save(b"miniatura")
+        baker.make(DocumentPreview, document=document, source_hash=document.content_hash, content_hash=thumbnail_hash)
+
+        with override_settings(DOCUMENT_BLOB_UPLOAD_GRACE=60 * 60):
+            self.assertEqual(DocumentBlobService.collect_orphans(), 0)
+        self.assertEqual(DocumentBlobService.collect_orphans(), 1)
+
+        self.assertFalse(self.storage.exists(orphan_hash))
+        self.assertTrue(self.storage.exists(document.content_hash))
+        self.assertTrue(self.storage.exists(thumbnail_hash))
+
+
+class DocumentCompressionTests(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        })
+        self.settings_override.enable()
+        self.storage = get_document_storage()
+        self.content = b"%PDF-1.4 relatorio de atendimento " * 4000
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def _create(self, file_name, content):
+        return Document.objects.create(file_name=file_name, file_content=content, file_type="pdf", document_type="start")
+
+    def test_compressible_types_are_stored_compressed(self):
+        document = self._create("relatorio.pdf", self.content)
+
+        self.assertTrue(os.path.exists(self.storage.compressed_path(document.content_hash)))
+        self.assertEqual(document.file_size, len(self.content))
+        self.assertGreater(document.compression_ratio, 10)
+        self.assertEqual(Document.objects.get(pk=document.pk).read_content(), self.content)
+
+    def test_images_and_incompressible_content_are_stored_raw(self):
+        image = self._create("foto.png", self.content)
+        random_pdf = self._create("aleatorio.pdf", os.urandom(4096))
+
+        for document in (image, random_pdf):
+            self.assertTrue(os.path.exists(self.storage.path(document.content_hash)))
+            self.assertEqual(document.compression_ratio, 1.0)
+        self.assertEqual(random_pdf.read_content(), Document.objects.get(pk=random_pdf.pk).read_content())
+
+    def test_compressed_reader_supports_seek(self):
+        document = self._create("relatorio.pdf", self.content)
+
+        with document.open_content() as content:
+            self.assertEqual(content.seek(0, io.SEEK_END), len(self.content))
+            content.seek(100_000)
+            self.assertEqual(content.read(50), self.content[100_000:100_050])
+            content.seek(10)
+            self.assertEqual(content.read(20), self.content[10:30])
+            self.assertEqual(content.read(), self.content[30:])
+
+    def test_compress_documents_command_recompresses_existing_blobs(self):
+        content_hash = self.storage.save(self.content)
+        document = Document.objects.create(file_name="antigo.pdf", file_type="pdf", document_type="start")
+        Document.objects.filter(pk=document.pk).update(content_hash=content_hash, file_size=len(self.content))
+
+        call_command('compress_documents', '--batch-size', '1', stdout=io.StringIO())
+
+        document.refresh_from_db()
+        self.assertFalse(os.path.exists(self.storage.path(content_hash)))
+        self.assertTrue(os.path.exists(self.storage.compressed_path(content_hash)))
+        self.assertGreater(document.compression_ratio, 10)
+        self.assertEqual(document.read_content(), self.content)
+
+
+class DocumentPreviewTests(APITestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(DOCUMENT_STORAGE={
+            'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+            'OPTIONS': {'location': self.storage_dir},
+        }, DOCUMENT_BLOB_UPLOAD_GRACE=0)
+        self.settings_override.enable()
+
+        feature, _ = Feature.objects.get_or_create(name="documents.preview_document")
+        role = Role.objects.create(name="Document Reader", role_type="client")
+        role.features.add(feature)
+        self.client.force_authenticate(user=baker.make("authentication.User", role=role, is_active=True))
+
+        self.pdf = (
+            b"%PDF-1.7\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+            b"2 0 obj << /Type /Pages /Count 2 >> endobj\n"
+            b"3 0 obj << /Type /Page >> endobj\n4 0 obj << /Type/Page >> endobj\n"
+            b"5 0 obj << /Title (Contrato de servico) >> endobj\n%%EOF"
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def _create(self, file_name, content):
+        return Document.objects.create(
+            file_name=file_name, file_content=content, file_type=file_name.split('.')[-1], document_type="start"
+        )
+
+    def _thumbnail(self, document, **headers):
+        url = reverse('document-preview', args=[document.id])
+        return self.client.get(url, {'variant': 'thumbnail'}, **headers)
+
+    def test_pdf_preview_is_generated_once_and_cached(self):
+        document = self._create("contrato.pdf", self.pdf)
+
+        with mock.patch.object(DocumentPreviewService, 'generate', wraps=DocumentPreviewService.generate) as generate:
+            first = self._thumbnail(document)
+            second = self._thumbnail(document)
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.data['kind'], DocumentPreview.Kind.METADATA)
+        self.assertEqual(first.data['page_count'], 2)
+        self.assertEqual(first.data['metadata']['version'], '1.7')
+        self.assertEqual(first.data['metadata']['title'], 'Contrato de servico')
+
+    def test_preview_is_regenerated_when_content_changes(self):
+        document = self._create("contrato.pdf", self.pdf)
+        self._thumbnail(document)
+
+        document.file_content = self.pdf.replace(b"/Type/Page ", b"/Type /Page >> endobj 6 0 obj << /Type /Page ")
+        document.save()
+
+        response = self._thumbnail(document)
+        self.assertEqual(response.data['page_count'], 3)
+        self.assertEqual(DocumentPreview.objects.get(document=document).source_hash, document.content_hash)
+
+    def test_page_markers_split_across_chunks_are_counted_once(self):
+        boundary = DocumentStreamService.CHUNK_SIZE
+        content = b"%PDF-1.4\n" + b" " * (boundary - 15) + b"/Type /Page >>" + b" " * 100 + b"/Type /Page"
+        document = self._create("longo.pdf", content)
+
+        self.assertEqual(DocumentPreviewService.generate(document)['page_count'], 2)
+
+    def test_image_preview(self):
+        document = self._create("foto.png", b"conteudo que nao e uma imagem")
+
+        response = self._thumbnail(document)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Com imagem inválida, o preview traz apenas os metadados
+        self.assertEqual(response.data['kind'], DocumentPreview.Kind.METADATA)
+        self.assertEqual(response.data['metadata']['name'], "foto.png")
+
+    def test_image_thumbnail_is_downscaled(self):
+        output = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(output, format='JPEG')
+        document = self._create("foto.jpg", output.getvalue())
+
+        response = self._thumbnail(document)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertLess(len(response.content), len(output.getvalue()))
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 171))
+
+        response = self._thumbnail(document, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_thumbnail_is_collected_after_document_is_deleted(self):
+        output = io.BytesIO()
+        Image.new('RGB', (600, 400), 'blue').save(output, format='PNG')
+        document = self._create("foto.png", output.getvalue())
+        preview = DocumentPreviewService.get_preview(document)
+        storage = get_document_storage()
+        self.assertTrue(storage.exists(preview.content_hash))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            DocumentBlobService.collect_unreferenced()
+
+        self.assertFalse(DocumentPreview.objects.exists())
+        self.assertFalse(storage.exists(document.content_hash))
+        self.assertFalse(storage.exists(preview.content_hash))
+
+    def test_serializers_expose_thumbnail_url(self):
+        document = self._create("contrato.pdf", self.pdf)
+
+        data = DocumentSerializer(document).data
+        self.assertEqual(data['thumbnail_url'], f"{reverse('document-preview', args=[document.id])}?variant=thumbnail")
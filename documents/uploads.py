@@ -0,0 +1,93 @@
+from typing import Optional
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from documents.services import DocumentBlobService
+from documents.storage import get_document_storage
+from documents.storage.compression import should_compress
+
+DEFAULT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5MB
+
+
+def get_max_upload_size() -> int:
+    return getattr(settings, 'DOCUMENT_MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    Arquivo enviado cujo conteúdo já foi gravado no document storage durante o upload.
+    content_hash é None quando o arquivo excedeu o tamanho máximo e foi descartado.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_hash: Optional[str], content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.content_hash = content_hash
+
+    @property
+    def exceeded_max_size(self) -> bool:
+        return self.content_hash is None
+
+    def open(self, mode=None):
+        if self.content_hash is None:
+            raise ValueError('O conteúdo do arquivo foi descartado por exceder o tamanho máximo')
+        self.close()
+        self.file = get_document_storage().open(self.content_hash)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class DocumentStorageUploadHandler(FileUploadHandler):
+    """
+    Grava os arquivos de um upload multipart direto no document storage, bloco a bloco.
+
+    O hash é calculado pelo writer do storage à medida que os blocos chegam e o
+    tamanho é verificado a cada bloco: ao passar de max_file_size o que já foi
+    gravado é descartado e o restante do arquivo é apenas consumido.
+    """
+
+    def __init__(self, request=None, max_file_size: Optional[int] = None):
+        super().__init__(request)
+        self.max_file_size = max_file_size or get_max_upload_size()
+        self.chunk_size = get_document_storage().chunk_size
+        self.writer = None
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.writer = get_document_storage().open_writer(should_compress(self.file_name))
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.writer is not None:
+            if self.received > self.max_file_size:
+                self.writer.abort()
+                self.writer = None
+            else:
+                self.writer.write(raw_data)
+        # Nenhum outro handler precisa receber os blocos
+        return None
+
+    def file_complete(self, file_size):
+        content_hash = self.writer.commit() if self.writer is not None else None
+        self.writer = None
+        if content_hash:
+            # Registra o blob para que ele seja recolhido se nenhum documento chegar a usá-lo
+            DocumentBlobService.register_upload(content_hash, file_size)
+        return StoredUploadedFile(
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            content_hash,
+            self.content_type_extra
+        )
+
+    def upload_interrupted(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
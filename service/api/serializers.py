@@ -13,10 +13,7 @@ class ServiceSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'cost', 'duration', 'document_requirements', 'rating_avg']
 
     def get_rating_avg(self, obj):
-        ratings = []
-        for appointment in obj.appointments.all():
-            ratings.extend([review.rating for review in appointment.reviews.all()])
-        return sum(ratings) / len(ratings) if ratings else None
+        return obj.rating_average
 
     def validate_document_requirements(self, document_requirements_data):
         """
@@ -1,10 +1,17 @@
+from django.db.models import Prefetch
 from core.models.mixins import DynamicPermissionModelViewSet
+from documents.models.document_template import ServiceDocumentRequirement
 from service.models import Service
 from service.api.serializers import ServiceSerializer
 
 class ServiceViewSet(DynamicPermissionModelViewSet):
-    queryset = Service.objects.filter(deleted_at=None).prefetch_related(
-        'document_requirements',
-        'document_requirements__document_template'
+    # O DocumentTemplateSerializer lê o documento do template; a coluna legada do conteúdo fica de fora
+    queryset = Service.objects.alive().prefetch_related(
+        Prefetch(
+            'document_requirements',
+            queryset=ServiceDocumentRequirement.objects.select_related(
+                'document_template__document'
+            ).defer('document_template__document__file_content')
+        )
     )
     serializer_class = ServiceSerializer
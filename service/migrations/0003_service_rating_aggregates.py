@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0002_alter_service_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
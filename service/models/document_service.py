@@ -15,6 +15,13 @@ class DocumentService:
                 f'Tipo de arquivo inválido. Tipos permitidos: {", ".join(allowed_types)}'
             )
 
+    @staticmethod
+    def validate_file_size(file: UploadedFile, max_size: int) -> None:
+        if file.size > max_size:
+            raise serializers.ValidationError(
+                f"Arquivo {file.name} excede o tamanho máximo permitido ({max_size // (1024 * 1024)}MB)"
+            )
+
     @staticmethod
     def create_document(file: UploadedFile) -> Document:
         try:
@@ -6,6 +6,13 @@ class Service(TimeStampedModel):
     description = models.TextField()
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     duration = models.IntegerField()
+    # Agregados das avaliações dos agendamentos do serviço, mantidos pelos sinais de appointment.signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
 
     def check_required_documents(self):
         required_documents = self.document_requirements.filter(is_required=True)
@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.models.feature import Feature
+from core.models.role import Role
+from documents.models.document import Document
+from documents.models.document_template import DocumentTemplate, ServiceDocumentRequirement
+from service.models import Service
 
-# Create your tests here.
+
+class ServiceListQueryTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('service-list')
+
+        feature, _ = Feature.objects.get_or_create(name="service.list_service")
+        self.role = Role.objects.create(name="client", role_type="client")
+        self.role.features.add(feature)
+        self.user = baker.make("authentication.User", role=self.role, is_active=True)
+        self.client.force_authenticate(user=self.user)
+
+    def _create_services(self, count):
+        for index in range(count):
+            service = baker.make(Service, duration=60)
+            for name in ("rg.pdf", "cpf.pdf", "comprovante.pdf"):
+                document = Document(file_name=name, file_type="pdf", document_type="start", file_content=b"modelo")
+                document.save()
+                template = baker.make(DocumentTemplate, document=document, file_types="pdf")
+                baker.make(ServiceDocumentRequirement, service=service, document_template=template)
+
+    def test_list_query_count_does_not_depend_on_templates(self):
+        self._create_services(1)
+        self.client.get(self.url)
+
+        self._create_services(4)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]['document_requirements'][0]['document_template']['document']['name'][-4:], ".pdf")
+
+    def test_template_documents_are_loaded_without_content(self):
+        self._create_services(2)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+
+        document_queries = [query['sql'] for query in context.captured_queries if '"documents_document"' in query['sql']]
+        self.assertTrue(document_queries)
+        self.assertFalse(any('file_content' in sql for sql in document_queries))
@@ -36,6 +36,27 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Armazenamento do conteúdo dos documentos, endereçado pelo SHA-256
+DOCUMENT_STORAGE = {
+    'BACKEND': 'documents.storage.local.LocalDocumentStorage',
+    'OPTIONS': {
+        'location': os.getenv('DOCUMENT_STORAGE_LOCATION', os.path.join(MEDIA_ROOT, 'document_blobs')),
+        'compression_level': 6,
+    },
+}
+
+# Tipos de arquivo comprimidos com zlib no blob store; imagens já comprimidas ficam de fora
+DOCUMENT_COMPRESSIBLE_TYPES = ['pdf', 'doc', 'docx', 'txt', 'rtf', 'odt', 'csv', 'xml']
+
+# Lado máximo (px) das miniaturas de imagens; a geração usa o Pillow quando instalado
+DOCUMENT_PREVIEW_SIZE = 256
+
+# Tamanho máximo de cada documento enviado; verificado durante o upload
+DOCUMENT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5MB
+
+# Carência (segundos) antes de recolher um blob enviado que ainda não é usado por nenhum documento
+DOCUMENT_BLOB_UPLOAD_GRACE = 60 * 60
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -63,8 +84,63 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'core.models.jwt.JWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'core.models.pagination.TimeStampedCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
+}
+
+# Cache (em segundos) da contagem estimada enviada em X-Total-Count
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# O cache do dashboard usa memória local por padrão; com mais de um processo,
+# DASHBOARD_CACHE_BACKEND=file ou db compartilha as respostas entre eles
+# (o backend db exige `python manage.py createcachetable`)
+DASHBOARD_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DASHBOARD_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'dashboard')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'dashboard_cache',
+    },
 }
 
+# As permissões resolvidas também ficam em memória local por padrão. Nesse caso cada
+# processo tem os próprios contadores de versão e uma revogação feita em outro worker
+# só é vista quando a entrada expira, por isso o PERMISSION_CACHE_TIMEOUT padrão é curto.
+# Com mais de um processo, PERMISSION_CACHE_BACKEND=file ou db faz com que a revogação
+# valha para todos eles imediatamente
+PERMISSION_CACHE_BACKEND = os.getenv('PERMISSION_CACHE_BACKEND', 'locmem')
+PERMISSION_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'permissions',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('PERMISSION_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'permissions')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'permission_cache',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': DASHBOARD_CACHE_BACKENDS[os.getenv('DASHBOARD_CACHE_BACKEND', 'locmem')],
+    'permissions': PERMISSION_CACHE_BACKENDS[PERMISSION_CACHE_BACKEND],
+}
+
+# Tempo (em segundos) que as respostas do dashboard ficam em cache
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 60))
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:4200',
     'http://127.0.0.1:4200',
@@ -84,6 +160,10 @@ CORS_ALLOW_HEADERS = [
     'Authorization',
 ]
 
+CORS_EXPOSE_HEADERS = [
+    'X-Total-Count',
+]
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=10000),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -99,6 +179,32 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Quando ativo, tokens com claims de permissão autenticam sem buscar o User no banco
+JWT_STATELESS_AUTHENTICATION = os.getenv('JWT_STATELESS_AUTHENTICATION', 'False').lower() == 'true'
+
+# Pub/sub das novas mensagens do chat (stream SSE). O padrão entrega apenas aos
+# clientes conectados no mesmo processo; com vários processos use
+# CHAT_BROKER_BACKEND=chat_message.broker.PostgresNotifyBroker (LISTEN/NOTIFY)
+CHAT_BROKER = {
+    'BACKEND': os.getenv('CHAT_BROKER_BACKEND', 'chat_message.broker.InProcessBroker'),
+    'OPTIONS': {},
+}
+
+# Intervalo dos heartbeats e duração máxima (em segundos) de cada conexão do stream.
+# Cada conexão ocupa uma thread durante todo esse tempo: sirva a aplicação com workers
+# em threads (gunicorn --worker-class gthread --threads N) ou com um servidor ASGI
+CHAT_STREAM_HEARTBEAT = 15
+CHAT_STREAM_MAX_DURATION = 300
+
+# Validade (em segundos) do token com que o EventSource abre o stream (?token=)
+CHAT_STREAM_TOKEN_LIFETIME = 60
+
+# Tempo (em segundos) que os conjuntos de permissões resolvidos ficam em cache; com o
+# backend locmem é também o atraso máximo de uma revogação entre processos
+PERMISSION_CACHE_TIMEOUT = int(os.getenv(
+    'PERMISSION_CACHE_TIMEOUT', 10 if PERMISSION_CACHE_BACKEND == 'locmem' else 300
+))
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',